@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+############################################################
+
+
+import os
+import time
+import argparse
+import tempfile
+import h5py
+from mintpy.objects.stack import get_compression_kwargs, get_dataset_compression, hdf5plugin
+from mintpy.utils import readfile
+
+
+###########################################################################################
+EXAMPLE = """example:
+  benchmark_compression.py  inputs/ifgramStack.h5
+  benchmark_compression.py  inputs/ifgramStack.h5  -d coherence  -c lzf gzip zstd  -n 50
+  benchmark_compression.py  timeseries.h5  --outdir /scratch/tmp
+"""
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Compare the compression ratio vs. write / read throughput '
+                                                 'of HDF5 compression filters on a given stack',
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     epilog=EXAMPLE)
+
+    parser.add_argument('file', type=str, help='HDF5 file of interest')
+    parser.add_argument('-d', '--dset', dest='dsName', type=str,
+                        help='dataset to be tested, default: the 1st one, e.g. unwrapPhase / timeseries')
+    parser.add_argument('-c', '--compression', dest='compList', nargs='+',
+                        default=['no', 'lzf', 'gzip', 'blosc', 'zstd'],
+                        help='compressions to be tested, default: no lzf gzip blosc zstd\n'
+                             'blosc / zstd require the hdf5plugin package.')
+    parser.add_argument('-n', '--num-slice', dest='numSlice', type=int, default=20,
+                        help='number of slices of 3D dataset to be tested, default: 20.')
+    parser.add_argument('--outdir', dest='outdir', type=str,
+                        help='directory for the temporary test files, default: the directory of the input file.')
+    return parser
+
+
+def cmd_line_parse(iargs=None):
+    parser = create_parser()
+    inps = parser.parse_args(args=iargs)
+    if os.path.splitext(inps.file)[1] not in ['.h5', '.he5']:
+        raise ValueError('input file is not HDF5: {}'.format(inps.file))
+    if not inps.dsName:
+        inps.dsName = readfile.get_dataset_list(inps.file)[0]
+    if not inps.outdir:
+        inps.outdir = os.path.dirname(os.path.abspath(inps.file))
+    return inps
+
+
+###########################################################################################
+def benchmark_compression(data, compression, chunks=True, outdir='./'):
+    """Write and read data with the given compression.
+    Parameters: data        - np.ndarray, data to be tested
+                compression - str, compression name, e.g. lzf, gzip, zstd
+                chunks      - tuple of int / True, chunk shape
+                outdir      - str, directory for the temporary test file
+    Returns:    ratio       - float, compression ratio
+                write_speed - float, write throughput in MB/s of uncompressed data
+                read_speed  - float, read  throughput in MB/s of uncompressed data
+    """
+    num_mb = data.nbytes / 1024**2
+    fd, fname = tempfile.mkstemp(suffix='.h5', prefix='tmp_compression_', dir=outdir)
+    os.close(fd)
+    try:
+        # write
+        start_time = time.time()
+        with h5py.File(fname, 'w') as f:
+            ds = f.create_dataset('data', data=data, chunks=chunks, **get_compression_kwargs(compression))
+        write_time = time.time() - start_time
+
+        # read
+        start_time = time.time()
+        with h5py.File(fname, 'r') as f:
+            ds = f['data']
+            ds[:]
+            storage_size = ds.id.get_storage_size()
+        read_time = time.time() - start_time
+    finally:
+        os.remove(fname)
+
+    ratio = data.nbytes / max(storage_size, 1)
+    return ratio, num_mb / write_time, num_mb / read_time
+
+
+def run_benchmark(inps):
+    # read data
+    with h5py.File(inps.file, 'r') as f:
+        ds = f[inps.dsName]
+        chunks = ds.chunks if ds.chunks else True
+        compression = get_dataset_compression(ds)
+        if ds.ndim == 3:
+            data = ds[:inps.numSlice, :, :]
+        else:
+            data = ds[:]
+    print('read /{} in size of {} with chunks = {}, compression = {} from file: {}'.format(inps.dsName,
+                                                                                          data.shape,
+                                                                                          chunks,
+                                                                                          compression,
+                                                                                          inps.file))
+    print('test {:.1f} MB data of {} in directory: {}'.format(data.nbytes / 1024**2, data.dtype, inps.outdir))
+
+    # test
+    msg = '{:<15}{:>10}{:>18}{:>18}'
+    print('-'*61)
+    print(msg.format('compression', 'ratio', 'write [MB/s]', 'read [MB/s]'))
+    print('-'*61)
+    resultDict = {}
+    for comp in inps.compList:
+        if comp.lower() not in ['no', 'lzf', 'gzip'] and hdf5plugin is None:
+            print('{:<15}skip: can not import hdf5plugin'.format(comp))
+            continue
+        resultDict[comp] = benchmark_compression(data, comp, chunks=chunks, outdir=inps.outdir)
+        print(msg.format(comp, *['{:.2f}'.format(i) for i in resultDict[comp]]))
+    print('-'*61)
+    print('NOTE: read throughput is for files in the OS page cache, thus bounded by decompression speed.')
+    return resultDict
+
+
+###########################################################################################
+def main(iargs=None):
+    inps = cmd_line_parse(iargs)
+    run_benchmark(inps)
+    return
+
+
+###########################################################################################
+if __name__ == '__main__':
+    main()
@@ -79,6 +79,8 @@ def create_parser():
                         help='Use phase velocity instead of phase for inversion constrain.')
     parser.add_argument('-p', '--poly-order', dest='polyOrder', type=int, default=2,
                         help='polynomial order number of temporal deformation model, default = 2')
+    parser.add_argument('--memory', '--max-memory', dest='maxMemory', type=str, default='4GB',
+                        help='max memory to allocate, e.g. 8GB, 500MB, 4 (in GB), default: %(default)s.')
     parser.add_argument('--update', dest='update_mode', action='store_true',
                         help='Enable update mode, and skip inversion if:\n'+
                              '1) output timeseries file already exists, readable '+
@@ -199,7 +201,7 @@ def design_matrix4deformation(inps):
     msg = 'ordinal least squares (OLS) inversion with L2-norm minimization on: phase'
     if inps.phaseVelocity:
         msg += ' velocity'
-    if inps.rangeDist.size != 1:
+    if inps.geom_file and 'incidenceAngle' in readfile.get_dataset_list(inps.geom_file):
         msg += ' (pixel-wisely)'
     print(msg)
 
@@ -224,36 +226,41 @@ def design_matrix4deformation(inps):
     return A_def
 
 
-def read_geometry(inps):
+def read_geometry(inps, box=None, print_msg=True):
+    """Read the geometry (incidence angle, slant range distance and perp baseline) within the box."""
     ts_obj = timeseries(inps.timeseries_file)
     ts_obj.open(print_msg=False)
 
     # 2D / 3D geometry
     if inps.geom_file:
         geom_obj = geometry(inps.geom_file)
-        geom_obj.open()
+        geom_obj.open(print_msg=False)
         if 'incidenceAngle' not in geom_obj.datasetNames:
-            inps.incAngle = ut.incidence_angle(ts_obj.metadata, dimension=0)
-            inps.rangeDist = ut.range_distance(ts_obj.metadata, dimension=0)
+            inps.incAngle = ut.incidence_angle(ts_obj.metadata, dimension=0, print_msg=print_msg)
+            inps.rangeDist = ut.range_distance(ts_obj.metadata, dimension=0, print_msg=print_msg)
         else:
-            print(('read 2D incidenceAngle,slantRangeDistance from {} file:'
-                   ' {}').format(geom_obj.name, os.path.basename(geom_obj.file)))
-            inps.incAngle = geom_obj.read(datasetName='incidenceAngle', print_msg=False).flatten()
-            inps.rangeDist = geom_obj.read(datasetName='slantRangeDistance', print_msg=False).flatten()
+            if print_msg:
+                print(('read 2D incidenceAngle,slantRangeDistance from {} file:'
+                       ' {}').format(geom_obj.name, os.path.basename(geom_obj.file)))
+            inps.incAngle  = geom_obj.read(datasetName='incidenceAngle', box=box, print_msg=False).flatten()
+            inps.rangeDist = geom_obj.read(datasetName='slantRangeDistance', box=box, print_msg=False).flatten()
         if 'bperp' in geom_obj.datasetNames:
-            print('read 3D bperp from {} file: {} ...'.format(geom_obj.name, os.path.basename(geom_obj.file)))
+            if print_msg:
+                print('read 3D bperp from {} file: {} ...'.format(geom_obj.name, os.path.basename(geom_obj.file)))
             dset_list = ['bperp-{}'.format(d) for d in ts_obj.dateList]
-            inps.pbase = geom_obj.read(datasetName=dset_list, print_msg=False).reshape((ts_obj.numDate, -1))
+            inps.pbase = geom_obj.read(datasetName=dset_list, box=box, print_msg=False).reshape((ts_obj.numDate, -1))
             inps.pbase -= np.tile(inps.pbase[ts_obj.refIndex, :].reshape(1, -1), (ts_obj.numDate, 1))
         else:
-            print('read mean bperp from {} file'.format(ts_obj.name))
+            if print_msg:
+                print('read mean bperp from {} file'.format(ts_obj.name))
             inps.pbase = ts_obj.pbase.reshape((-1, 1))
 
     # 0D geometry
     else:
-        print('read mean incidenceAngle,slantRangeDistance,bperp value from {} file'.format(ts_obj.name))
-        inps.incAngle = ut.incidence_angle(ts_obj.metadata, dimension=0)
-        inps.rangeDist = ut.range_distance(ts_obj.metadata, dimension=0)
+        if print_msg:
+            print('read mean incidenceAngle,slantRangeDistance,bperp value from {} file'.format(ts_obj.name))
+        inps.incAngle = ut.incidence_angle(ts_obj.metadata, dimension=0, print_msg=print_msg)
+        inps.rangeDist = ut.range_distance(ts_obj.metadata, dimension=0, print_msg=print_msg)
         inps.pbase = ts_obj.pbase.reshape((-1, 1))
 
     inps.sinIncAngle = np.sin(inps.incAngle * np.pi / 180.)
@@ -319,36 +326,116 @@ def estimate_dem_error(ts0, A0, tbase, drop_date=None, phaseVelocity=False, num_
     return delta_z, ts_cor, ts_res, step_def
 
 
-def correct_dem_error(inps, A_def):
-    """Correct DEM error of input timeseries file"""
-    # Read Date Info
+def estimate_dem_error_batch(ts0, A_geom0, A_def, tbase, drop_date=None, phaseVelocity=False, num_step=0,
+                             rcond=1e-10):
+    """Estimate DEM error for pixels with pixel-wise geometry all at once.
+
+    The design matrix [A_geom, A_def] of each pixel differs only in its first column A_geom,
+    thus the least squares solution is given by the Schur complement of the common A_def:
+        delta_z = (A_geom^T * P * ts) / (A_geom^T * P * A_geom), with P = I - A_def * pinv(A_def)
+        X_def   = pinv(A_def) * (ts - A_geom * delta_z)
+    which is equivalent to estimate_dem_error() pixel by pixel. Pixels with A_geom (nearly) in the
+    column space of A_def are rank deficient, and solved with estimate_dem_error() one by one.
+
+    Parameters: ts0     : 2D np.array in size of (numDate, numPixel), original displacement time-series
+                A_geom0 : 2D np.array in size of (numDate, numPixel), geometry column of the design matrix
+                A_def   : 2D np.array in size of (numDate, model_num-1), design matrix of the deformation model
+                tbase   : 2D np.array in size of (numDate, 1), temporal baseline
+                drop_date : 1D np.array in bool data type, mark the date used in the estimation
+                phaseVelocity : bool, use phase history or phase velocity for minimization
+                rcond   : float, relative cut-off of A_geom^T * P * A_geom for rank deficiency
+    Returns:    delta_z, ts_cor, ts_res, step_def, same as estimate_dem_error()
+    """
+    num_date, num_pixel = ts0.shape
+    if drop_date is None:
+        drop_date = np.ones(num_date, np.bool_)
+    A_geom0 = np.broadcast_to(A_geom0, (num_date, num_pixel))
+
+    # Prepare Design matrix A and observations ts for inversion,
+    # as the linear operator T on the rows of [A_geom, A_def, ts]
+    T = np.eye(num_date, dtype=np.float64)[drop_date, :]
+    if phaseVelocity:
+        tbase_diff = np.diff(tbase[drop_date, :], axis=0)
+        T = np.diff(T, axis=0) / tbase_diff
+    A_def0 = np.array(A_def, dtype=np.float64)
+    A_def = np.dot(T, A_def0)
+    A_def_inv = linalg.pinv(A_def)
+    A_geom = np.dot(T, A_geom0)
+    ts = np.dot(T, ts0)
+
+    # Inverse using L-2 norm with the Schur complement of A_def
+    # X = [delta_z, constC, vel, acc, deltaAcc, ..., step1, step2, ...]
+    PA_geom = A_geom - np.dot(A_def, np.dot(A_def_inv, A_geom))
+    den = np.sum(PA_geom * A_geom, axis=0)
+    flag = den > rcond * np.sum(A_geom ** 2, axis=0)
+
+    delta_z = np.zeros(num_pixel, dtype=np.float64)
+    delta_z[flag] = np.sum(PA_geom[:, flag] * ts[:, flag], axis=0) / den[flag]
+    X_def = np.dot(A_def_inv, ts - A_geom * delta_z)
+    del PA_geom, A_geom, ts
+
+    # Prepare Outputs
+    ts_cor = ts0 - A_geom0 * delta_z
+    ts_res = ts_cor - np.dot(A_def0, X_def)
+
+    step_def = None
+    if num_step > 0:
+        step_def = X_def[-1*num_step:, :].reshape(num_step, -1)
+
+    # rank deficient pixels
+    for idx in np.where(~flag)[0]:
+        A = np.hstack((A_geom0[:, idx:idx+1], A_def0))
+        (delta_z[idx:idx+1],
+         ts_cor[:, idx:idx+1],
+         ts_res[:, idx:idx+1],
+         step_def_i) = estimate_dem_error(ts0[:, idx], A,
+                                          tbase=tbase,
+                                          drop_date=drop_date,
+                                          phaseVelocity=phaseVelocity,
+                                          num_step=num_step)
+        if num_step > 0:
+            step_def[:, idx:idx+1] = step_def_i
+
+    return delta_z, ts_cor, ts_res, step_def
+
+
+def correct_dem_error_patch(inps, A_def, tbase, drop_date, box=None, print_msg=True):
+    """Correct DEM error of input timeseries file within the box.
+    Parameters: inps      - Namespace, with geometry for the box, from read_geometry()
+                A_def     - 2D np.array in size of (numDate, model_num), design matrix for the deformation model
+                tbase     - 2D np.array in size of (numDate, 1), temporal baseline in years
+                drop_date - 1D np.array in bool data type, mark the date used in the estimation
+                box       - tuple of 4 int, (x0, y0, x1, y1) of the patch
+    Returns:    delta_z    - 2D np.array in size of (length, width), estimated DEM residual
+                ts_cor     - 3D np.array in size of (numDate, length, width), corrected time-series
+                ts_res     - 3D np.array in size of (numDate, length, width), residual time-series
+                step_model - 3D np.array in size of (num_step, length, width), estimated step model
+    """
     ts_obj = timeseries(inps.timeseries_file)
-    ts_obj.open()
+    ts_obj.open(print_msg=False)
+    if box is None:
+        box = (0, 0, ts_obj.width, ts_obj.length)
     num_date = ts_obj.numDate
-    num_pixel = ts_obj.numPixel
-    tbase = np.array(ts_obj.tbase, np.float32) / 365.25
-
     num_step = len(inps.stepFuncDate)
-    drop_date, inps.excludeDate = read_exclude_date(inps.excludeDate, ts_obj.dateList)
-    if inps.polyOrder > np.sum(drop_date):
-        raise ValueError(("input poly order {} > number of acquisition {}!"
-                          " Reduce it!").format(inps.polyOrder, np.sum(drop_date)))
+    length = box[3] - box[1]
+    width = box[2] - box[0]
+    num_pixel = length * width
 
     # Read time-series Data
-    ts_data = ts_obj.read(print_msg=True).reshape((num_date, -1))
+    ts_data = ts_obj.read(box=box, print_msg=print_msg).reshape((num_date, -1))
 
     ##-------------------------------- Loop for L2-norm inversion  --------------------------------##
-    print('inverting DEM error ...')
     delta_z = np.zeros(num_pixel, dtype=np.float32)
     ts_cor = np.zeros((num_date, num_pixel), dtype=np.float32)
     ts_res = np.zeros((num_date, num_pixel), dtype=np.float32)
-    if num_step > 0:
-        step_model = np.zeros((num_step, num_pixel), dtype=np.float32)
+    step_model = np.zeros((num_step, num_pixel), dtype=np.float32)
 
     # initiate mask based on time-series
-    print('skip pixels with ZERO in ALL acquisitions')
+    if print_msg:
+        print('skip pixels with ZERO in ALL acquisitions')
     mask = np.nanmean(ts_data, axis=0) != 0.
-    print('skip pixels with NaN  in ANY acquisitions')
+    if print_msg:
+        print('skip pixels with NaN  in ANY acquisitions')
     mask *= np.sum(np.isnan(ts_data), axis=0) == 0
 
     if inps.rangeDist.size == 1:
@@ -356,109 +443,184 @@ def correct_dem_error(inps, A_def):
         A = np.hstack((A_geom, A_def))
 
         ts_data = ts_data[:, mask]
-        (delta_z_i,
-         ts_cor_i,
-         ts_res_i,
-         step_model_i) = estimate_dem_error(ts_data, A,
-                                            tbase=tbase,
-                                            drop_date=drop_date,
-                                            phaseVelocity=inps.phaseVelocity,
-                                            num_step=num_step)
-        delta_z[mask] = delta_z_i
-        ts_cor[:, mask] = ts_cor_i
-        ts_res[:, mask] = ts_res_i
-        if num_step > 0:
-            step_model[:, mask] = step_model_i
+        if ts_data.size > 0:
+            (delta_z_i,
+             ts_cor_i,
+             ts_res_i,
+             step_model_i) = estimate_dem_error(ts_data, A,
+                                                tbase=tbase,
+                                                drop_date=drop_date,
+                                                phaseVelocity=inps.phaseVelocity,
+                                                num_step=num_step)
+            delta_z[mask] = delta_z_i
+            ts_cor[:, mask] = ts_cor_i
+            ts_res[:, mask] = ts_res_i
+            if num_step > 0:
+                step_model[:, mask] = step_model_i
     else:
         # update mask based on geometry
-        print('skip pixels with ZERO / NaN value in incidenceAngle / slantRangeDistance')
+        if print_msg:
+            print('skip pixels with ZERO / NaN value in incidenceAngle / slantRangeDistance')
         for geom_data in [inps.sinIncAngle, inps.rangeDist]:
             mask *= geom_data != 0.
             mask *= ~np.isnan(geom_data)
 
         num_pixel2inv = np.sum(mask)
-        idx_pixel2inv = np.where(mask)[0]
-        print(('number of pixels to invert: {} out of {}'
-               ' ({:.1f}%)').format(num_pixel2inv,
-                                    num_pixel,
-                                    num_pixel2inv/num_pixel*100))
+        if print_msg:
+            print(('number of pixels to invert: {} out of {}'
+                   ' ({:.1f}%)').format(num_pixel2inv,
+                                        num_pixel,
+                                        num_pixel2inv/num_pixel*100))
 
         # update data matrix to save memory and IO
         ts_data = ts_data[:, mask]
-        inps.rangeDist = inps.rangeDist[mask]
-        inps.sinIncAngle = inps.sinIncAngle[mask]
-        if inps.pbase.shape[1] != 1:
-            inps.pbase = inps.pbase[:, mask]
-
-        # loop pixel by pixel
-        prog_bar = ptime.progressBar(maxValue=num_pixel2inv)
-        for i in range(num_pixel2inv):
-            prog_bar.update(i+1, every=2000, suffix='{}/{}'.format(i+1, num_pixel2inv))
-            idx = idx_pixel2inv[i]
-
-            # design matrix
-            if inps.pbase.shape[1] == 1:
-                pbase = inps.pbase
-            else:
-                pbase = inps.pbase[:, i].reshape(-1, 1)
-            A_geom = pbase / (inps.rangeDist[i] * inps.sinIncAngle[i])
-            A = np.hstack((A_geom, A_def))
+        range_dist = inps.rangeDist[mask]
+        sin_inc_angle = inps.sinIncAngle[mask]
+        pbase = inps.pbase
+        if pbase.shape[1] != 1:
+            pbase = pbase[:, mask]
 
-            (delta_z_i,
-             ts_cor_i,
-             ts_res_i,
-             step_model_i) = estimate_dem_error(ts_data[:, i], A,
-                                                tbase=tbase,
-                                                drop_date=drop_date,
-                                                phaseVelocity=inps.phaseVelocity,
-                                                num_step=num_step)
-            delta_z[idx:idx+1] = delta_z_i
-            ts_cor[:, idx:idx+1] = ts_cor_i
-            ts_res[:, idx:idx+1] = ts_res_i
-            if num_step > 0:
-                step_model[:, idx:idx+1] = step_model_i
-        prog_bar.close()
+        # design matrix - geometry column for each pixel
+        A_geom = pbase / (range_dist * sin_inc_angle).reshape(1, -1)
+
+        (delta_z_i,
+         ts_cor_i,
+         ts_res_i,
+         step_model_i) = estimate_dem_error_batch(ts_data, A_geom, A_def,
+                                                  tbase=tbase,
+                                                  drop_date=drop_date,
+                                                  phaseVelocity=inps.phaseVelocity,
+                                                  num_step=num_step)
+        delta_z[mask] = delta_z_i
+        ts_cor[:, mask] = ts_cor_i
+        ts_res[:, mask] = ts_res_i
+        if num_step > 0:
+            step_model[:, mask] = step_model_i
     del ts_data
 
-    ##---------------------------------------- Output  -----------------------------------------##
-    # prepare for output
-    ts_cor = ts_cor.reshape((num_date, ts_obj.length, ts_obj.width))
-    ts_res = ts_res.reshape((num_date, ts_obj.length, ts_obj.width))
-    delta_z = delta_z.reshape((ts_obj.length, ts_obj.width))
-    if num_step > 0:
-        step_model = step_model.reshape((num_step, ts_obj.length, ts_obj.width))
-    atr = dict(ts_obj.metadata)
+    # reshape into 2D / 3D
+    delta_z = delta_z.reshape((length, width))
+    ts_cor = ts_cor.reshape((num_date, length, width))
+    ts_res = ts_res.reshape((num_date, length, width))
+    step_model = step_model.reshape((num_step, length, width))
+    return delta_z, ts_cor, ts_res, step_model
+
 
-    # config parameter
+def get_output_files(inps):
+    """Get the output file names: corrected / residual time-series, DEM error and step model."""
+    out_dir = os.path.dirname(inps.outfile)
+    ts_cor_file = inps.outfile
+    ts_res_file = os.path.join(out_dir, 'timeseriesResidual.h5')
+    dem_err_file = 'demErr.h5'
+    step_file = os.path.join(out_dir, 'timeseriesStepModel.h5')
+    return ts_cor_file, ts_res_file, dem_err_file, step_file
+
+
+def layout_output_files(inps, ts_obj):
+    """Create the (empty) output files to be filled block by block."""
+    ts_cor_file, ts_res_file, dem_err_file, step_file = get_output_files(inps)
+    num_date = ts_obj.numDate
+    num_step = len(inps.stepFuncDate)
+    length, width = ts_obj.length, ts_obj.width
+    compression = readfile.get_hdf5_compression(ts_obj.file)
+
+    atr = dict(ts_obj.metadata)
     print('add/update the following configuration metadata to file:\n{}'.format(configKeys))
     for key in configKeys:
         atr[key_prefix+key] = str(vars(inps)[key])
 
     # 1. Estimated DEM error
-    outfile = 'demErr.h5'
     atr['FILE_TYPE'] = 'dem'
     atr['UNIT'] = 'm'
-    writefile.write(delta_z, out_file=outfile, metadata=atr)
+    writefile.layout_hdf5(dem_err_file, {'dem' : (np.float32, (length, width))}, atr)
 
     # 2. Time-series corrected for DEM error
-    atr['FILE_TYPE'] = 'timeseries'
-    writefile.write(ts_cor, out_file=inps.outfile, metadata=atr, ref_file=ts_obj.file)
-
     # 3. Time-series of inversion residual
-    ts_ref_file = os.path.join(os.path.dirname(inps.outfile), 'timeseriesResidual.h5')
-    writefile.write(ts_res, out_file=ts_ref_file, metadata=atr, ref_file=ts_obj.file)
+    # the configuration metadata are added to the corrected time-series after all boxes are finished,
+    # to mark the file as incomplete for the update mode in case of interruption.
+    atr['FILE_TYPE'] = 'timeseries'
+    atr['UNIT'] = ts_obj.metadata.get('UNIT', 'm')
+    dsNameDict = {
+        'date'       : (np.dtype('S8'), (num_date,), np.array([i.encode('utf-8') for i in ts_obj.dateList])),
+        'bperp'      : (np.float32, (num_date,), ts_obj.pbase),
+        'timeseries' : (np.float32, (num_date, length, width)),
+    }
+    writefile.layout_hdf5(ts_res_file, dsNameDict, atr, compression=compression)
+    atr_cor = {k: v for k, v in atr.items() if not k.startswith(key_prefix)}
+    writefile.layout_hdf5(ts_cor_file, dsNameDict, atr_cor, compression=compression)
 
     # 4. Time-series of estimated Step Model
     if num_step > 0:
         atr.pop('REF_DATE')
-        step_obj = timeseries(os.path.join(os.path.dirname(inps.outfile), 'timeseriesStepModel.h5'))
-        step_obj.write2hdf5(data=step_model, metadata=atr, dates=inps.stepFuncDate)
+        dsNameDict = {
+            'date'       : (np.dtype('S8'), (num_step,), np.array([i.encode('utf-8') for i in inps.stepFuncDate])),
+            'timeseries' : (np.float32, (num_step, length, width)),
+        }
+        writefile.layout_hdf5(step_file, dsNameDict, atr)
 
     ## 5. Time-series of estimated Deformation Model = poly model + step model
     #ts_def_obj = timeseries(os.path.join(os.path.dirname(inps.outfile), 'timeseriesDefModel.h5'))
     #ts_def_obj.write2hdf5(data=ts_cor - ts_res, refFile=ts_obj.file)
-    #del ts_cor, ts_res
+    return
+
+
+def correct_dem_error(inps, A_def):
+    """Correct DEM error of input timeseries file"""
+    # Read Date Info
+    ts_obj = timeseries(inps.timeseries_file)
+    ts_obj.open()
+    num_date = ts_obj.numDate
+    num_step = len(inps.stepFuncDate)
+    tbase = np.array(ts_obj.tbase, np.float32) / 365.25
 
+    drop_date, inps.excludeDate = read_exclude_date(inps.excludeDate, ts_obj.dateList)
+    if inps.polyOrder > np.sum(drop_date):
+        raise ValueError(("input poly order {} > number of acquisition {}!"
+                          " Reduce it!").format(inps.polyOrder, np.sum(drop_date)))
+
+    if os.path.abspath(inps.outfile) == os.path.abspath(inps.timeseries_file):
+        raise ValueError('output file is the same as input file: {}'.format(inps.outfile))
+
+    # split into boxes based on the working set: time-series read, corrected and residual in float32,
+    # 3D bperp if available, and the design matrix / observation / model in the estimation in float64
+    ds_shape = (num_date, ts_obj.length, ts_obj.width)
+    ds_list = [(ds_shape, np.float32, 4),
+               (ds_shape, np.float64, 5)]
+    box_list = ut.split2boxes_by_memory(ds_list,
+                                        max_memory=inps.maxMemory,
+                                        chunk_shape=readfile.get_hdf5_chunks(ts_obj.file))
+    num_box = len(box_list)
+
+    # prepare output files
+    layout_output_files(inps, ts_obj)
+    ts_cor_file, ts_res_file, dem_err_file, step_file = get_output_files(inps)
+
+    print('inverting DEM error ...')
+    for i, box in enumerate(box_list):
+        if num_box > 1:
+            print('\n------- processing patch {} out of {} --------------'.format(i+1, num_box))
+            print('box: {}'.format(box))
+
+        inps = read_geometry(inps, box=box, print_msg=(i == 0))
+        (delta_z,
+         ts_cor,
+         ts_res,
+         step_model) = correct_dem_error_patch(inps, A_def,
+                                               tbase=tbase.reshape(-1, 1),
+                                               drop_date=drop_date,
+                                               box=box,
+                                               print_msg=(i == 0))
+
+        # write the block to disk
+        block = [box[1], box[3], box[0], box[2]]
+        writefile.write_hdf5_block(dem_err_file, delta_z, 'dem', block=block)
+        writefile.write_hdf5_block(ts_cor_file, ts_cor, 'timeseries', block=[0, num_date]+block)
+        writefile.write_hdf5_block(ts_res_file, ts_res, 'timeseries', block=[0, num_date]+block)
+        if num_step > 0:
+            writefile.write_hdf5_block(step_file, step_model, 'timeseries', block=[0, num_step]+block)
+
+    # mark the corrected time-series as complete with the configuration metadata
+    ut.add_attribute(ts_cor_file, {key_prefix+key: str(vars(inps)[key]) for key in configKeys})
     return inps
 
 
@@ -471,8 +633,6 @@ def main(iargs=None):
         return inps.outfile
 
     start_time = time.time()
-    inps = read_geometry(inps)
-
     A_def = design_matrix4deformation(inps)
 
     inps = correct_dem_error(inps, A_def)
@@ -12,10 +12,13 @@ import time
 import argparse
 import warnings
 import multiprocessing
+import concurrent.futures
+import h5py
 import numpy as np
+from mintpy.objects import dequantize_data
 from mintpy.objects.resample import resample
 from mintpy.defaults.template import get_template_content
-from mintpy.utils import readfile, writefile, utils as ut
+from mintpy.utils import ptime, readfile, writefile, utils as ut
 
 
 ######################################################################################
@@ -25,6 +28,7 @@ EXAMPLE = """example:
   geocode.py velocity.h5
   geocode.py velocity.h5 -b -0.5 -0.25 -91.3 -91.1
   geocode.py velocity.h5 timeseries.h5 -t smallbaselineApp.cfg --outdir ./geo --update
+  geocode.py timeseries.h5 velocity.h5 temporalCoherence.h5 --num-worker 8 --memory 8GB
 
   # radar-code file in geo coordinates
   geocode.py swbdLat_S02_N01_Lon_W092_W090.wbd -l geometryRadar.h5 -o waterMask.rdr --geo2radar
@@ -69,6 +73,14 @@ def create_parser():
                              'Note: Do not use more processes than available processor cores.')
     parser.add_argument('-p','--processor', dest='processor', type=str, choices={'pyresample', 'scipy'},
                         help='processor module used for interpolation.')
+    parser.add_argument('--num-worker', dest='numWorker', type=int, default=4,
+                        help='number of threads to resample the blocks of all files/datasets concurrently,\n'
+                             'with the resampling plan computed once and shared. Default: 4')
+    parser.add_argument('--memory', '--max-memory', dest='maxMemory', type=str, default='4GB',
+                        help='max memory to allocate for the blocks being resampled, default: 4GB')
+    parser.add_argument('--no-plan-cache', dest='cachePlan', action='store_false',
+                        help='do not read/write the resampling plan from/to the cache file next to the lookup table,\n'
+                             'i.e. ./inputs/resamplePlan_*.h5, which saves the kd-tree search in the following runs.')
 
     parser.add_argument('--update', dest='updateMode', action='store_true',
                         help='skip resampling if output file exists and newer than input file')
@@ -142,6 +154,8 @@ def read_template2inps(template_file, inps):
                 inps_dict[key] = tuple([float(i) for i in value.split(',')])
             elif key in ['latStep', 'lonStep']:
                 inps_dict[key] = float(value)
+            elif key in ['numWorker']:
+                inps_dict[key] = int(value)
             elif key in ['interpMethod']:
                 inps_dict[key] = value
             elif key == 'fillValue':
@@ -259,6 +273,111 @@ def auto_output_filename(infile, inps):
     return outfile
 
 
+def get_num_slice_per_block(src_shape, dest_shape, dtype, max_memory=4, num_worker=1):
+    """Get the number of 2D slices to be resampled together in one block,
+    so that all the blocks being resampled concurrently fit into the memory budget."""
+    slice_size = (np.prod(src_shape[-2:]) + np.prod(dest_shape)) * np.dtype(dtype).itemsize
+    slice_size += np.prod(dest_shape) * 8  #float64 buffer for linear interpolation
+    num_byte = ut.parse_memory_size(max_memory) / max(num_worker, 1)
+    return max(int(num_byte / slice_size), 1)
+
+
+def layout_geocode_file(infile, outfile, atr, res_obj, inps):
+    """Create the output HDF5 file with empty datasets and split the datasets into blocks in time.
+    Parameters: infile   : str, input HDF5 file
+                outfile  : str, output HDF5 file
+                atr      : dict, metadata of the output file
+                res_obj  : resample object
+                inps     : Namespace, with dset, maxMemory and numWorker
+    Returns:    taskList : list of tuple in (infile, outfile, dsName, zStart, zEnd)
+    """
+    dsNames = readfile.get_dataset_list(infile, datasetName=inps.dset)
+    dest_shape = (res_obj.length, res_obj.width)
+
+    dsNameDict = dict()
+    taskList = []
+    with h5py.File(infile, 'r') as f:
+        for dsName in dsNames:
+            ds = f[dsName]
+            # quantized data is decoded into float32 while reading
+            dtype = np.float32 if 'scale_factor' in ds.attrs.keys() else ds.dtype
+            dsNameDict[dsName] = (dtype, ds.shape[:-2] + dest_shape)
+
+            # split 3D dataset into blocks of 2D slices
+            num_slice = ds.shape[0] if ds.ndim == 3 else 1
+            step = get_num_slice_per_block(ds.shape, dest_shape, dtype,
+                                           max_memory=inps.maxMemory,
+                                           num_worker=inps.numWorker)
+            for i in range(0, num_slice, step):
+                taskList.append((infile, outfile, dsName, i, min(i+step, num_slice)))
+
+        # auxliary datasets, e.g. date, bperp
+        if not inps.dset:
+            shape2d = (int(f.attrs['LENGTH']), int(f.attrs['WIDTH']))
+            for dsName in f.keys():
+                if isinstance(f[dsName], h5py.Dataset) and f[dsName].shape[-2:] != shape2d:
+                    dsNameDict[dsName] = (f[dsName].dtype, f[dsName].shape, f[dsName][()])
+
+    writefile.layout_hdf5(outfile, dsNameDict, metadata=atr,
+                          compression=readfile.get_hdf5_compression(infile))
+    return taskList
+
+
+def read_block(infile, dsName, z_start, z_end):
+    """Read 2D dataset or a block of 2D slices of 3D dataset from HDF5 file."""
+    with h5py.File(infile, 'r') as f:
+        ds = f[dsName]
+        if ds.ndim == 3:
+            data = ds[z_start:z_end, :, :]
+        else:
+            data = ds[:]
+        data = dequantize_data(data, ds.attrs)
+    return data
+
+
+def run_resample_blocks(taskList, res_obj, inps):
+    """Resample all blocks concurrently with the shared plan, and write them by the main thread."""
+    if len(taskList) == 0:
+        return
+    plan = res_obj.get_resample_plan(interp_method=inps.interpMethod)
+
+    def resample_block(task):
+        data = read_block(*[task[i] for i in [0, 2, 3, 4]])
+        data = res_obj.apply_resample_plan(data, plan, fill_value=inps.fillValue, print_msg=False)
+        return task, data
+
+    num_worker = max(min(inps.numWorker, len(taskList)), 1)
+    print('-' * 50)
+    print('resampling {} blocks with {} threads ...'.format(len(taskList), num_worker))
+    prog_bar = ptime.progressBar(maxValue=len(taskList))
+    num_done = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_worker) as executor:
+        # limit the number of blocks in memory
+        futures = set()
+        for i, task in enumerate(taskList):
+            futures.add(executor.submit(resample_block, task))
+            if len(futures) < num_worker * 2 and i < len(taskList) - 1:
+                continue
+
+            return_when = concurrent.futures.FIRST_COMPLETED
+            if i == len(taskList) - 1:
+                return_when = concurrent.futures.ALL_COMPLETED
+            done, futures = concurrent.futures.wait(futures, return_when=return_when)
+            for future in done:
+                (infile, outfile, dsName, z_start, z_end), data = future.result()
+                if data.ndim == 3:
+                    block = [z_start, z_end, 0, res_obj.length, 0, res_obj.width]
+                else:
+                    block = [0, res_obj.length, 0, res_obj.width]
+                writefile.write_hdf5_block(outfile, data, dsName, block=block, print_msg=False)
+                num_done += 1
+                prog_bar.update(num_done, suffix='{}/{}'.format(num_done, len(taskList)))
+    prog_bar.close()
+    for outfile in sorted(set(task[1] for task in taskList)):
+        readfile.clear_attribute_cache(outfile)
+    return
+
+
 def run_geocode(inps):
     """geocode all input files"""
     start_time = time.time()
@@ -268,10 +387,16 @@ def run_geocode(inps):
                        dataFile=inps.file[0],
                        SNWE=inps.SNWE,
                        laloStep=inps.laloStep,
-                       processor=inps.processor)
+                       processor=inps.processor,
+                       cachePlan=inps.cachePlan)
     res_obj.open()
 
-    # resample input files one by one
+    # pre-compute the resampling plan, shared by all files and datasets
+    res_obj.get_resample_plan(interp_method=inps.interpMethod, nprocs=inps.nprocs)
+
+    # resample input files
+    taskList = []
+    tmpFileDict = dict()
     for infile in inps.file:
         print('-' * 50+'\nresampling file: {}'.format(infile))
         ext = os.path.splitext(infile)[1]
@@ -281,6 +406,26 @@ def run_geocode(inps):
             print('update mode is ON, skip geocoding.')
             continue
 
+        # HDF5 file: layout the output file, then resample in blocks together with the other files
+        # into a temporary file, renamed after all blocks are written, to not leave an incomplete
+        # output file behind (which would be skipped in update mode) if interrupted.
+        # slice names, e.g. timeseries-20200113, are read via readfile.read() below.
+        if ext in ['.h5', '.he5'] and os.path.splitext(outfile)[1] in ['.h5', '.he5']:
+            with h5py.File(infile, 'r') as f:
+                block_mode = all(i in f for i in readfile.get_dataset_list(infile, datasetName=inps.dset))
+        else:
+            block_mode = False
+
+        if block_mode:
+            if inps.radar2geo:
+                atr = metadata_radar2geo(atr, res_obj)
+            else:
+                atr = metadata_geo2radar(atr, res_obj)
+            tmp_file = os.path.join(os.path.dirname(outfile), 'tmp_{}'.format(os.path.basename(outfile)))
+            taskList += layout_geocode_file(infile, tmp_file, atr, res_obj, inps)
+            tmpFileDict[tmp_file] = outfile
+            continue
+
         # read source data and resample
         dsNames = readfile.get_dataset_list(infile, datasetName=inps.dset)
         maxDigit = max([len(i) for i in dsNames])
@@ -317,6 +462,13 @@ def run_geocode(inps):
 
         writefile.write(dsResDict, out_file=outfile, metadata=atr, ref_file=infile)
 
+    # resample HDF5 files block by block
+    run_resample_blocks(taskList, res_obj, inps)
+    for tmp_file, outfile in tmpFileDict.items():
+        os.replace(tmp_file, outfile)
+        readfile.clear_attribute_cache(outfile)
+        print('finished writing to {}'.format(outfile))
+
     m, s = divmod(time.time()-start_time, 60)
     print('time used: {:02.0f} mins {:02.1f} secs.\n'.format(m, s))
     return outfile
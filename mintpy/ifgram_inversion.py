@@ -13,11 +13,14 @@ import os
 import sys
 import time
 import argparse
+import hashlib
 import warnings
+from collections import OrderedDict
+import concurrent.futures
 import h5py
 import numpy as np
 from scipy import linalg   # more effieint than numpy.linalg
-from mintpy.objects import ifgramStack, timeseries
+from mintpy.objects import ifgramStack
 from mintpy.simulation import decorrelation as decor
 from mintpy.defaults.template import get_template_content
 from mintpy.utils import readfile, writefile, ptime, utils as ut
@@ -33,6 +36,12 @@ configKeys = ['obsDatasetName',
               'minRedundancy',
               'minNormVelocity']
 
+# design matrix cache of the worker process in parallel processing
+WORKER_CACHE = None
+
+# max memory in GB of the stacked normal equations in estimate_timeseries_batch()
+BATCH_MAX_MEMORY = 0.2
+
 
 ################################################################################################
 EXAMPLE = """example:
@@ -46,6 +55,9 @@ EXAMPLE = """example:
   ifgram_inversion.py  inputs/ifgramStack.h5 -w var --parallel
   ifgram_inversion.py  inputs/ifgramStack.h5 -w var --parallel --num-worker 25
 
+  # parallel processing on a local machine with multiple cores
+  ifgram_inversion.py  inputs/ifgramStack.h5 -w var --parallel local --num-worker 8
+
   # invert offset stack
   ifgram_inversion.py  inputs/ifgramStack.h5 -i azimuthOffset --water-mask waterMask.h5 --mask-dset offsetSNR --mask-threshold 5
 """
@@ -94,6 +106,9 @@ def create_parser():
     parser.add_argument('--chunk-size', dest='chunk_size', type=float, default=100e6,
                         help='max number of data (= ifgram_num * num_row * num_col) to read per loop\n' +
                         'default: 0.2 G; adjust it according to your computer memory.')
+    parser.add_argument('--memory', '--max-memory', dest='maxMemory', type=str,
+                        help='max memory to allocate, e.g. 8GB, 500MB, 4 (in GB), default: None.\n' +
+                        'Override --chunk-size and split the data based on the full working set.')
     parser.add_argument('--skip-reference', dest='skip_ref', action='store_true',
                         help='Skip checking reference pixel value, for simulation testing.')
 
@@ -121,16 +136,20 @@ def create_parser():
                       help='minimum redundancy of interferograms for every SAR acquisition.')
 
     # parallel computing
-    par = parser.add_argument_group('parallel', 'parallel processing configuration for Dask')
-    par.add_argument('--parallel', dest='parallel', action='store_true',
-                     help='Enable parallel processing for the pixelwise weighted inversion.')
+    par = parser.add_argument_group('parallel', 'parallel processing configuration for Dask / local cores')
+    par.add_argument('--parallel', dest='parallel', nargs='?', const='dask', default=False,
+                     choices={'dask', 'local', 'yes', 'no'},
+                     help='Enable parallel processing for the pixelwise weighted inversion:\n' +
+                          'dask  - Dask cluster on HPC (default if no value is given)\n' +
+                          'local - pool of processes on the local machine')
     par.add_argument('--cluster', '--cluster-type', dest='cluster', type=str,
                      default='slurm', choices={'lsf', 'pbs', 'slurm'},
                      help='Type of HPC cluster you are running on (default: %(default)s).')
     par.add_argument('--config', '--config-name', dest='config', type=str, default='no', 
                      help='Configuration name to use in dask.yaml (default: %(default)s).')
     par.add_argument('--num-worker', dest='numWorker', type=int, default=40,
-                     help='Number of workers the Dask cluster should use (default: %(default)s).')
+                     help='Number of workers the Dask cluster / local pool should use (default: %(default)s).\n' +
+                          'For local pool, it is limited by the number of CPU cores.')
     par.add_argument('--walltime', dest='walltime', type=str, default='00:40',
                      help='Walltime for each dask worker (default: %(default)s).')
 
@@ -163,6 +182,12 @@ def cmd_line_parse(iargs=None):
     if inps.waterMaskFile and not os.path.isfile(inps.waterMaskFile):
         inps.waterMaskFile = None
 
+    # --parallel option
+    if inps.parallel in [True, 'yes', 'dask']:
+        inps.parallel = 'dask'
+    elif inps.parallel in [False, None, 'no']:
+        inps.parallel = False
+
     # --fast option
     if inps.fast:
         print("Enable fast network inversion.")
@@ -245,9 +270,13 @@ def run_or_skip(inps):
     flag = 'skip'
 
     # check output files vs input dataset
+    ckpt_file = get_checkpoint_file(get_output_files(inps)[0])
     if not all(os.path.isfile(i) for i in inps.outfile):
         flag = 'run'
         print('1) NOT ALL output files found: {}.'.format(inps.outfile))
+    elif os.path.isfile(ckpt_file):
+        flag = 'run'
+        print('1) output files are incomplete with checkpoint file: {}.'.format(ckpt_file))
     else:
         print('1) output files already exist: {}.'.format(inps.outfile))
         with h5py.File(inps.ifgramStackFile, 'r') as f:
@@ -467,69 +496,369 @@ def estimate_timeseries(A, B, tbase_diff, ifgram, weight_sqrt=None, min_norm_vel
     return ts, temp_coh, num_inv_ifg
 
 
+class designMatrixCache:
+    """LRU cache of design matrix factorizations keyed by the valid-ifgram mask.
+
+    Most pixels share one of a few dozen valid-ifgram patterns, thus the checks and
+    factorization of the design matrix are computed once per pattern and re-used
+    for all patches of the same network inversion.
+
+    Example:    cache = designMatrixCache(max_size=1000)
+                ifgram_inversion_patch('ifgramStack.h5', box=box, cache=cache)
+                print(cache)
+    """
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.design_key = None
+        self.clear()
+
+    def clear(self):
+        self._cache = OrderedDict()
+        self.num_hit = 0
+        self.num_miss = 0
+
+    @property
+    def hit_rate(self):
+        num_query = self.num_hit + self.num_miss
+        return self.num_hit / num_query if num_query > 0 else 0.
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __str__(self):
+        return ('design matrix cache: {} patterns, {} hits, {} misses'
+                ' (hit rate: {:.1f}%)').format(len(self), self.num_hit, self.num_miss,
+                                               self.hit_rate*100)
+
+    def set_design_matrix(self, A, B):
+        """Set the design matrices of the network, and clear the cache if they are different from before.
+        It should be called once per patch, before get() for all the patterns of the patch.
+        Parameters: A/B - 2D np.array in size of (num_ifgram, num_date-1), design matrices
+        """
+        design_key = (A.shape, hash(A.tobytes()), hash(B.tobytes()))
+        if design_key != self.design_key:
+            self.design_key = design_key
+            self.clear()
+
+    def get(self, A, B, idx, min_norm_velocity=True, rcond=1e-5, min_redundancy=1.):
+        """Get the factorization of the design matrix for the input valid-ifgram mask.
+        Parameters: A/B - 2D np.array in size of (num_ifgram, num_date-1), design matrices,
+                          same as the ones in set_design_matrix()
+                    idx - 1D np.array of bool in size of (num_ifgram), valid-ifgram mask
+        Returns:    entry - dict, with the following items:
+                        redundant  - bool, redundancy >= min_redundancy
+                        invertible - bool, B.T * B is invertible
+                        full_rank  - bool, design matrix in use is full rank (w.r.t. rcond)
+                        pinv       - 2D np.array, pseudo-inverse of the design matrix in use
+        """
+        if self.design_key is None:
+            self.set_design_matrix(A, B)
+
+        key = (np.packbits(idx).tobytes(), min_norm_velocity, rcond, min_redundancy)
+        if key in self._cache:
+            self.num_hit += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        self.num_miss += 1
+
+        # checks consistent with estimate_timeseries()
+        entry = dict()
+        entry['redundant'] = bool(np.min(np.sum(A[idx, :] != 0., axis=0)) >= min_redundancy)
+        try:
+            linalg.inv(np.dot(B[idx, :].T, B[idx, :]))
+            entry['invertible'] = True
+        except linalg.LinAlgError:
+            entry['invertible'] = False
+
+        # pseudo-inverse via SVD, with the same cut-off as linalg.lstsq(cond=rcond)
+        G = B[idx, :] if min_norm_velocity else A[idx, :]
+        U, s, Vh = linalg.svd(G, full_matrices=False)
+        s_inv = np.zeros(s.shape, np.float64)
+        s_inv[s > rcond * s[0]] = 1. / s[s > rcond * s[0]]
+        entry['full_rank'] = bool(s.size == G.shape[1] and s[-1] > rcond * s[0])
+        entry['pinv'] = np.dot(Vh.T * s_inv, U.T)
+
+        self._cache[key] = entry
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return entry
+
+
+def get_valid_ifgram_pattern(ifgram, skip_zero_value=True):
+    """Group pixels by their pattern of valid (non-zero) interferograms.
+    Parameters: ifgram - 2D np.array in size of (num_ifgram, num_pixel)
+                skip_zero_value - bool, treat zero value as invalid observation
+    Returns:    patterns - 2D np.array of bool in size of (num_pattern, num_ifgram)
+                pixel_idx_list - list of 1D np.array of int, pixel indices for each pattern
+    """
+    num_ifgram, num_pixel = ifgram.shape
+    if not skip_zero_value:
+        return np.ones((1, num_ifgram), np.bool_), [np.arange(num_pixel)]
+
+    # pack the bool mask into bytes for a cheaper row-wise unique
+    mask_packed = np.packbits(ifgram != 0., axis=0).T
+    mask_packed = np.ascontiguousarray(mask_packed)
+    mask_packed = mask_packed.view(np.dtype((np.void, mask_packed.shape[1]))).flatten()
+    pattern_packed, pattern_idx, pixel_label = np.unique(mask_packed,
+                                                         return_index=True,
+                                                         return_inverse=True)
+    patterns = (ifgram[:, pattern_idx] != 0.).T
+
+    # pixel indices for each pattern
+    order = np.argsort(pixel_label, kind='stable')
+    bounds = np.cumsum(np.bincount(pixel_label.flatten(), minlength=pattern_packed.size))[:-1]
+    pixel_idx_list = np.split(order, bounds)
+    return patterns, pixel_idx_list
+
+
+def get_batch_memory(num_ifgram, num_param):
+    """Get the memory usage of the weighted inversion in estimate_timeseries_batch().
+    Parameters: num_ifgram - int, number of interferograms
+                num_param  - int, number of unknowns, i.e. number of acquisitions - 1
+    Returns:    gg_size    - int, size in bytes of the outer products of the design matrix rows (GG),
+                             which is fixed for each pattern
+                pixel_size - int, size in bytes per pixel of the stacked solve:
+                             weight and weighted observation, normal matrix and its copy in solve()
+    """
+    gg_size = num_ifgram * num_param**2 * 8
+    pixel_size = num_ifgram * 8 * 2 + num_param**2 * 8 * 2
+    return gg_size, pixel_size
+
+
+def estimate_timeseries_batch(A, B, tbase_diff, ifgram, weight_sqrt=None, min_norm_velocity=True,
+                              rcond=1e-5, min_redundancy=1., skip_zero_value=True, max_memory=BATCH_MAX_MEMORY,
+                              cache=None, print_msg=True):
+    """Estimate time-series for many pixels at once by grouping them by valid-ifgram pattern.
+
+    It gives the same result as calling estimate_timeseries() pixel by pixel, but:
+    1. for pixels without weight, all pixels sharing one pattern are solved with one lstsq call;
+    2. for pixels with weight, the weighted normal equations of all pixels sharing one pattern
+       are built with matrix multiplication and solved with stacked np.linalg.solve().
+       Patterns with rank deficient design matrix fall back to the pixel-wise lstsq solution.
+
+    Parameters: A/B/tbase_diff/weight_sqrt/min_norm_velocity/rcond/min_redundancy/skip_zero_value
+                    - same as estimate_timeseries()
+                ifgram - 2D np.array in size of (num_ifgram, num_pixel)
+                max_memory - float, max memory in GB for the stacked normal matrices of the weighted inversion,
+                    including the outer products of the design matrix rows (GG), see get_batch_memory()
+                cache - designMatrixCache object, to share the design matrix factorization
+                    among multiple calls, e.g. patches
+    Returns:    ts - 2D np.array in size of (num_date, num_pixel), phase time-series
+                temp_coh - 1D np.array in size of (num_pixel), temporal coherence
+                num_inv_ifg - 1D np.array in size of (num_pixel), number of ifgrams
+                    used during the inversion
+    """
+    ifgram = ifgram.reshape(A.shape[0], -1)
+    if weight_sqrt is not None:
+        weight_sqrt = weight_sqrt.reshape(A.shape[0], -1)
+    num_date = A.shape[1] + 1
+    num_pixel = ifgram.shape[1]
+
+    # Initial output value
+    ts = np.zeros((num_date, num_pixel), np.float32)
+    temp_coh = np.zeros(num_pixel, np.float32)
+    num_inv_ifg = np.zeros(num_pixel, np.int16)
+
+    # design matrix in use: B for min-norm velocity, A for min-norm phase
+    G = B if min_norm_velocity else A
+    num_param = G.shape[1]
+
+    if cache is None:
+        cache = designMatrixCache()
+    cache.set_design_matrix(A, B)
+
+    patterns, pixel_idx_list = get_valid_ifgram_pattern(ifgram, skip_zero_value=skip_zero_value)
+    num_pattern = patterns.shape[0]
+    if print_msg:
+        print('number of valid-ifgram patterns: {} for {} pixels'.format(num_pattern, num_pixel))
+
+    prog_bar = ptime.progressBar(maxValue=num_pattern, print_msg=print_msg)
+    for i in range(num_pattern):
+        prog_bar.update(i+1, every=max(num_pattern // 100, 1),
+                        suffix='{}/{} patterns'.format(i+1, num_pattern))
+        idx = patterns[i]
+        pix = pixel_idx_list[i]
+        G_i = G[idx, :]
+        num_ifg_i = G_i.shape[0]
+        if num_ifg_i == 0:
+            continue
+        factor = cache.get(A, B, idx,
+                           min_norm_velocity=min_norm_velocity,
+                           rcond=rcond,
+                           min_redundancy=min_redundancy)
+
+        # checks consistent with estimate_timeseries() for pixels with some zero phase
+        if not np.all(idx):
+            # Skip the pixel if its redundancy < threshold
+            if not factor['redundant']:
+                continue
+
+            # check matrix invertability
+            if weight_sqrt is not None and not factor['invertible']:
+                continue
+
+        y = ifgram[np.ix_(idx, pix)]
+        try:
+            if weight_sqrt is None:
+                X = np.dot(factor['pinv'], y)
+            else:
+                w_sqrt = weight_sqrt[np.ix_(idx, pix)]
+                if factor['full_rank']:
+                    # full rank: stacked weighted normal equations
+                    X = np.zeros((num_param, pix.size), np.float64)
+                    GG = (G_i[:, :, np.newaxis] * G_i[:, np.newaxis, :]).reshape(num_ifg_i, -1)
+                    # max number of pixels per stacked solve, within max_memory together with GG
+                    gg_size, pixel_size = get_batch_memory(num_ifg_i, num_param)
+                    step = max(int((max_memory * 1024**3 - gg_size) / pixel_size), 1)
+                    for j0 in range(0, pix.size, step):
+                        j1 = min(j0 + step, pix.size)
+                        w = np.square(w_sqrt[:, j0:j1], dtype=np.float64).T
+                        N = np.dot(w, GG).reshape(-1, num_param, num_param)
+                        r = np.dot(w * y[:, j0:j1].T, G_i)
+                        X[:, j0:j1] = np.linalg.solve(N, r[:, :, np.newaxis])[:, :, 0].T
+                else:
+                    # rank deficient: minimum-norm solution pixel by pixel
+                    X = np.zeros((num_param, pix.size), np.float64)
+                    for j in range(pix.size):
+                        X[:, j] = linalg.lstsq(G_i * w_sqrt[:, j:j+1],
+                                               y[:, j] * w_sqrt[:, j],
+                                               cond=rcond)[0]
+        except (linalg.LinAlgError, np.linalg.LinAlgError):
+            continue
+
+        if min_norm_velocity:
+            ts[1:, pix] = np.cumsum(X * tbase_diff, axis=0)
+        else:
+            ts[1:, pix] = X
+        ifgram_diff = y - np.dot(G_i, X)
+
+        # calculate temporal coherence
+        num_inv_ifg[pix] = num_ifg_i
+        temp_coh[pix] = np.abs(np.sum(np.exp(1j*ifgram_diff), axis=0)) / num_ifg_i
+    prog_bar.close()
+    return ts, temp_coh, num_inv_ifg
+
+
 ###################################### File IO ############################################
-def write2hdf5_file(ifgram_file, metadata, ts, temp_coh, num_inv_ifg=None,
-                    suffix='', inps=None):
-    stack_obj = ifgramStack(ifgram_file)
-    stack_obj.open(print_msg=False)
-    date_list = stack_obj.get_date_list(dropIfgram=True)
+def get_output_files(inps):
+    """Get output file names of timeseries, temporal coherence and number of inverted ifgrams."""
+    ts_file = '{}.h5'.format(os.path.splitext(inps.outfile[0])[0])
+    tcoh_file = '{}.h5'.format(os.path.splitext(inps.outfile[1])[0])
+    num_file = 'numInvIfgram.h5'
+    return ts_file, tcoh_file, num_file
 
-    # File 1 - timeseries.h5
-    ts_file = '{}{}.h5'.format(suffix, os.path.splitext(inps.outfile[0])[0])
-    metadata['REF_DATE'] = date_list[0]
-    metadata['FILE_TYPE'] = 'timeseries'
-    metadata['UNIT'] = 'm'
 
-    print('-'*50)
-    print('calculating perpendicular baseline timeseries')
-    pbase = stack_obj.get_perp_baseline_timeseries(dropIfgram=True)
+def layout_output_files(inps, metadata, date_list, pbase):
+    """Create the (empty) output files to be filled block by block."""
+    ts_file, tcoh_file, num_file = get_output_files(inps)
+    num_date = len(date_list)
+    length, width = int(metadata['LENGTH']), int(metadata['WIDTH'])
 
-    ts_obj = timeseries(ts_file)
-    ts_obj.write2hdf5(data=ts, dates=date_list, bperp=pbase, metadata=metadata)
+    # File 1 - timeseries.h5
+    meta = dict(metadata)
+    meta['REF_DATE'] = date_list[0]
+    meta['FILE_TYPE'] = 'timeseries'
+    meta['UNIT'] = 'm'
+    dsNameDict = {
+        "date"       : (np.dtype('S8'), (num_date,), np.array([i.encode('utf-8') for i in date_list])),
+        "bperp"      : (np.float32, (num_date,), pbase),
+        "timeseries" : (np.float32, (num_date, length, width)),
+    }
+    writefile.layout_hdf5(ts_file, dsNameDict, meta)
 
     # File 2 - temporalCoherence.h5
-    out_file = '{}{}.h5'.format(suffix, os.path.splitext(inps.outfile[1])[0])
-    metadata['FILE_TYPE'] = 'temporalCoherence'
-    metadata['UNIT'] = '1'
-    print('-'*50)
-    writefile.write(temp_coh, out_file=out_file, metadata=metadata)
-
-    ## File 3 - timeseriesDecorStd.h5
-    #if not np.all(ts_std == 0.):
-    #    out_file = 'timeseriesDecorStd{}.h5'.format(suffix)
-    #    metadata['FILE_TYPE'] = 'timeseries'
-    #    metadata['UNIT'] = 'm'
-    #    phase2range = -1*float(stack_obj.metadata['WAVELENGTH'])/(4.*np.pi)
-    #    ts_std *= abs(phase2range)
-    #    print('-'*50)
-    #    writefile.write(ts_std, out_file=out_file, metadata=metadata, ref_file=ts_file)
+    meta['FILE_TYPE'] = 'temporalCoherence'
+    meta['UNIT'] = '1'
+    writefile.layout_hdf5(tcoh_file, {'temporalCoherence' : (np.float32, (length, width))}, meta)
 
     # File 3 - numInvIfgram.h5
-    out_file = 'numInvIfgram{}.h5'.format(suffix)
-    metadata['FILE_TYPE'] = 'mask'
-    metadata['UNIT'] = '1'
-    print('-'*50)
-    writefile.write(num_inv_ifg, out_file=out_file, metadata=metadata)
+    meta['FILE_TYPE'] = 'mask'
+    meta['UNIT'] = '1'
+    writefile.layout_hdf5(num_file, {'mask' : (np.int16, (length, width))}, meta)
+    return ts_file, tcoh_file, num_file
+
+
+def write_output_block(inps, tsi, temp_cohi, ifg_numi, box, print_msg=True):
+    """Write one block of inversion results into the laid out output files."""
+    ts_file, tcoh_file, num_file = get_output_files(inps)
+    block = [box[1], box[3], box[0], box[2]]
+    writefile.write_hdf5_block(ts_file, tsi, 'timeseries', block=[0, tsi.shape[0]]+block, print_msg=print_msg)
+    writefile.write_hdf5_block(tcoh_file, temp_cohi, 'temporalCoherence', block=block, print_msg=print_msg)
+    writefile.write_hdf5_block(num_file, ifg_numi, 'mask', block=block, print_msg=print_msg)
     return
 
 
-def write2hdf5_auxFiles(metadata, temp_coh, num_inv_ifg=None, suffix='', inps=None):
+################################ Checkpoint for resume ####################################
+def get_checkpoint_file(ts_file):
+    """Get the checkpoint file recording the finished boxes, next to the timeseries file."""
+    return '{}_checkpoint.txt'.format(os.path.splitext(ts_file)[0])
 
-    # File 2 - temporalCoherence.h5
-    out_file = '{}{}.h5'.format(suffix, os.path.splitext(inps.outfile[1])[0])
-    metadata['FILE_TYPE'] = 'temporalCoherence'
-    metadata['UNIT'] = '1'
-    print('-'*50)
-    writefile.write(temp_coh, out_file=out_file, metadata=metadata)
 
-    # File 3 - numInvIfgram.h5
-    out_file = 'numInvIfgram{}.h5'.format(suffix)
-    metadata['FILE_TYPE'] = 'mask'
-    metadata['UNIT'] = '1'
-    print('-'*50)
-    writefile.write(num_inv_ifg, out_file=out_file, metadata=metadata)
+def get_checkpoint_key(ifgram_file, metadata, inps):
+    """Get the key of the network inversion setup, to invalidate outdated checkpoint files.
+    It changes with the input ifgramStack file (modification time), dropIfgram,
+    file size, key configuration parameters and the water mask file.
+    """
+    with h5py.File(ifgram_file, 'r') as f:
+        drop_ifgram = f['dropIfgram'][:]
+    key_list = [os.path.abspath(ifgram_file),
+                str(os.path.getmtime(ifgram_file)),
+                ''.join(str(int(i)) for i in drop_ifgram),
+                metadata['LENGTH'],
+                metadata['WIDTH'],
+                str(inps.waterMaskFile)]
+    key_list += [metadata[key_prefix+key] for key in configKeys]
+    return hashlib.md5('\n'.join(key_list).encode('utf-8')).hexdigest()
+
+
+def read_checkpoint(ckpt_file):
+    """Read the checkpoint file.
+    Parameters: ckpt_file : str, checkpoint file
+    Returns:    key       : str, key of the network inversion setup
+                box_list  : list of tuple of 4 int for (x0, y0, x1, y1), finished boxes
+    """
+    key = None
+    box_list = []
+    if os.path.isfile(ckpt_file):
+        with open(ckpt_file, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('# key:'):
+                    key = line.split(':')[1].strip()
+                elif line and not line.startswith('#'):
+                    box_list.append(tuple(int(i) for i in line.split()))
+    return key, box_list
+
+
+def write_checkpoint(ckpt_file, box=None, key=None):
+    """Append one finished box to the checkpoint file, or create a new one if box is None."""
+    if box is None:
+        with open(ckpt_file, 'w') as f:
+            f.write('# finished boxes (x0 y0 x1 y1) of network inversion\n')
+            f.write('# key: {}\n'.format(key))
+    else:
+        with open(ckpt_file, 'a') as f:
+            f.write('{} {} {} {}\n'.format(*box))
+    return ckpt_file
 
-    return None
+
+def get_finished_boxes(inps, key):
+    """Get the list of boxes already inverted and written by a previous interrupted run.
+    Return an empty list if the previous run can not be resumed, i.e. output files not found,
+    or different input file / dropIfgram / key configuration parameters.
+    """
+    out_files = get_output_files(inps)
+    ckpt_file = get_checkpoint_file(out_files[0])
+    if not all(os.path.isfile(i) for i in list(out_files) + [ckpt_file]):
+        return []
+
+    ckpt_key, box_list = read_checkpoint(ckpt_file)
+    if ckpt_key != key:
+        print('existing checkpoint file is outdated, ignore it: {}'.format(ckpt_file))
+        return []
+
+    print('resume from checkpoint file: {} with {} finished boxes'.format(ckpt_file, len(box_list)))
+    return box_list
 
 
 def split_ifgram_file(ifgram_file, chunk_size=100e6):
@@ -572,27 +901,39 @@ def split_ifgram_file(ifgram_file, chunk_size=100e6):
     return outfile_list
 
 
-def split2boxes(dataset_shape, chunk_size=100e6, print_msg=True):
-    """Split into chunks in rows to reduce memory usage
-    Parameters:
+def split2boxes(dataset_shape, chunk_size=100e6, max_memory=None, num_date=None, weighted=False,
+                chunk_shape=None, print_msg=True):
+    """Split into boxes to reduce memory usage
+    Parameters: dataset_shape - tuple of 3 int, (num_ifgram, length, width)
+                chunk_size    - float, max number of data (num_ifgram * num_row * num_col) to read per loop,
+                                used if max_memory is None
+                max_memory    - str / float, memory budget, e.g. 8GB, 4 (in GB)
+                num_date      - int, number of acquisitions, for the size of the output time-series
+                weighted      - bool, weighted inversion with coherence-based weight,
+                                with the memory of the stacked solve reserved from max_memory
+                chunk_shape   - tuple of int, chunk shape of the observation dataset
+    Returns:    box_list      - list of tuple of 4 int in (x0, y0, x1, y1)
     """
-    # Get r_step / chunk_num
-    r_step = chunk_size / (dataset_shape[0] * dataset_shape[2])         # split in lines
-    r_step = int(ut.round_to_1(r_step))
-    chunk_num = int((dataset_shape[1]-1)/r_step) + 1
-
-    if print_msg and chunk_num > 1:
-        print('maximum chunk size: %.1E' % chunk_size)
-        print('split %d lines into %d patches for processing' % (dataset_shape[1], chunk_num))
-        print('    with each patch up to %d lines' % r_step)
+    if max_memory:
+        # working set: observation (and coherence / weight) + time-series (and its std. dev.)
+        num_date = num_date if num_date else dataset_shape[0]
+        ds_list = [(dataset_shape, np.float32, 4 if weighted else 2),
+                   ((num_date,) + tuple(dataset_shape[1:]), np.float32, 2)]
+
+        # reserve the memory of the weighted inversion, which does not scale with the box size
+        if weighted:
+            gg_size, pixel_size = get_batch_memory(dataset_shape[0], num_date - 1)
+            num_byte = ut.parse_memory_size(max_memory)
+            num_byte -= max(BATCH_MAX_MEMORY * 1024**3, gg_size + pixel_size)
+            max_memory = '{}B'.format(max(num_byte, 0))
+    else:
+        max_memory = '{}B'.format(chunk_size * 4)
+        ds_list = [(dataset_shape, np.float32, 1)]
 
-    # Computing the inversion
-    box_list = []
-    for i in range(chunk_num):
-        r0 = i * r_step
-        r1 = min([dataset_shape[1], r0+r_step])
-        box = (0, r0, dataset_shape[2], r1)
-        box_list.append(box)
+    box_list = ut.split2boxes_by_memory(ds_list,
+                                        max_memory=max_memory,
+                                        chunk_shape=chunk_shape,
+                                        print_msg=print_msg)
     return box_list
 
 
@@ -614,14 +955,14 @@ def subsplit_boxes4_workers(box, num_split, dimension='y'):
         y_diff = y1 - y0
         # `start` and `end` are the new bounds of the subdivided box
         for i in range(num_split):
-            start = (i * y_diff) // num_split
-            end = ((i + 1) * y_diff) // num_split
+            start = y0 + (i * y_diff) // num_split
+            end = y0 + ((i + 1) * y_diff) // num_split
             subboxes.append([x0, start, x1, end])
     elif dimension == 'x':
         x_diff = x1 - x0
         for i in range(num_split):
-            start = (i * x_diff) // num_split
-            end = ((i + 1) * x_diff) // num_split
+            start = x0 + (i * x_diff) // num_split
+            end = x0 + ((i + 1) * x_diff) // num_split
             subboxes.append([start, y0, end, y1])
     else:
         raise Exception("Unknown value for dimension parameter:", dimension)
@@ -729,7 +1070,7 @@ def read_coherence(stack_obj, box, dropIfgram=True, print_msg=True):
 def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, obsDatasetName='unwrapPhase',
                            weight_func='var', min_norm_velocity=True,
                            mask_dataset_name=None, mask_threshold=0.4, min_redundancy=1.0,
-                           water_mask_file=None):
+                           water_mask_file=None, cache=None):
     """Invert one patch of an ifgram stack into timeseries.
     Parameters: ifgram_file       : str, interferograms stack HDF5 file, e.g. ./inputs/ifgramStack.h5
                 box               : tuple of 4 int, indicating (x0, y0, x1, y1) pixel coordinate of area of interest
@@ -741,6 +1082,8 @@ def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, obsDatasetName
                 mask_threshold    : float, min coherence of pixels if mask_dataset_name='coherence'
                 water_mask_file   : str, water mask filename if available,
                                     skip inversion on water to speed up the process
+                cache             : designMatrixCache object, to re-use the design matrix factorization
+                                    among patches
     Returns:    ts          : 3D array in size of (num_date, num_row, num_col)
                 temp_coh    : 2D array in size of (num_row, num_col)
                 num_inv_ifg : 2D array in size of (num_row, num_col)
@@ -837,7 +1180,6 @@ def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, obsDatasetName
 
     # Invert pixels on mask 1+2
     num_pixel2inv = int(np.sum(mask))
-    idx_pixel2inv = np.where(mask)[0]
     print(('number of pixels to invert: {} out of {}'
            ' ({:.1f}%)').format(num_pixel2inv, num_pixel,
                                 num_pixel2inv/num_pixel*100))
@@ -867,12 +1209,14 @@ def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, obsDatasetName
         if np.sum(mask_all_net) > 0:
             print(('inverting pixels with valid phase in all  ifgrams'
                    ' ({:.0f} pixels) ...').format(np.sum(mask_all_net)))
-            tsi, tcohi, num_ifgi = estimate_timeseries(A, B, tbase_diff,
-                                                       ifgram=pha_data[:, mask_all_net],
-                                                       weight_sqrt=None,
-                                                       min_norm_velocity=min_norm_velocity,
-                                                       min_redundancy=min_redundancy,
-                                                       skip_zero_value=skip_zero_value)
+            tsi, tcohi, num_ifgi = estimate_timeseries_batch(A, B, tbase_diff,
+                                                             ifgram=pha_data[:, mask_all_net],
+                                                             weight_sqrt=None,
+                                                             min_norm_velocity=min_norm_velocity,
+                                                             min_redundancy=min_redundancy,
+                                                             skip_zero_value=False,
+                                                             cache=cache,
+                                                             print_msg=False)
             ts[:, mask_all_net] = tsi
             temp_coh[mask_all_net] = tcohi
             num_inv_ifg[mask_all_net] = num_ifgi
@@ -880,22 +1224,16 @@ def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, obsDatasetName
         if np.sum(mask_part_net) > 0:
             print(('inverting pixels with valid phase in some ifgrams'
                    ' ({:.0f} pixels) ...').format(np.sum(mask_part_net)))
-            num_pixel2inv = int(np.sum(mask_part_net))
-            idx_pixel2inv = np.where(mask_part_net)[0]
-            prog_bar = ptime.progressBar(maxValue=num_pixel2inv)
-            for i in range(num_pixel2inv):
-                idx = idx_pixel2inv[i]
-                tsi, tcohi, num_ifgi = estimate_timeseries(A, B, tbase_diff,
-                                                           ifgram=pha_data[:, idx],
-                                                           weight_sqrt=None,
-                                                           min_norm_velocity=min_norm_velocity,
-                                                           min_redundancy=min_redundancy,
-                                                           skip_zero_value=skip_zero_value)
-                ts[:, idx] = tsi.flatten()
-                temp_coh[idx] = tcohi
-                num_inv_ifg[idx] = num_ifgi
-                prog_bar.update(i+1, every=2000, suffix='{}/{} pixels'.format(i+1, num_pixel2inv))
-            prog_bar.close()
+            tsi, tcohi, num_ifgi = estimate_timeseries_batch(A, B, tbase_diff,
+                                                             ifgram=pha_data[:, mask_part_net],
+                                                             weight_sqrt=None,
+                                                             min_norm_velocity=min_norm_velocity,
+                                                             min_redundancy=min_redundancy,
+                                                             skip_zero_value=skip_zero_value,
+                                                             cache=cache)
+            ts[:, mask_part_net] = tsi
+            temp_coh[mask_part_net] = tcohi
+            num_inv_ifg[mask_part_net] = num_ifgi
 
     # Inversion - WLS
     else:
@@ -904,22 +1242,18 @@ def ifgram_inversion_patch(ifgram_file, box=None, ref_phase=None, obsDatasetName
         weight = coherence2weight(weight, weight_func=weight_func, L=L, epsilon=5e-2)
         weight = np.sqrt(weight)
 
-        # Weighted Inversion pixel by pixel
+        # Weighted Inversion for pixels grouped by valid-ifgram pattern
         print('inverting network of interferograms into time-series ...')
-        prog_bar = ptime.progressBar(maxValue=num_pixel2inv)
-        for i in range(num_pixel2inv):
-            idx = idx_pixel2inv[i]
-            tsi, tcohi, num_ifgi = estimate_timeseries(A, B, tbase_diff,
-                                                       ifgram=pha_data[:, idx],
-                                                       weight_sqrt=weight[:, idx],
-                                                       min_norm_velocity=min_norm_velocity,
-                                                       min_redundancy=min_redundancy,
-                                                       skip_zero_value=skip_zero_value)
-            ts[:, idx] = tsi.flatten()
-            temp_coh[idx] = tcohi
-            num_inv_ifg[idx] = num_ifgi
-            prog_bar.update(i+1, every=2000, suffix='{}/{} pixels'.format(i+1, num_pixel2inv))
-        prog_bar.close()
+        tsi, tcohi, num_ifgi = estimate_timeseries_batch(A, B, tbase_diff,
+                                                         ifgram=pha_data[:, mask],
+                                                         weight_sqrt=weight[:, mask],
+                                                         min_norm_velocity=min_norm_velocity,
+                                                         min_redundancy=min_redundancy,
+                                                         skip_zero_value=skip_zero_value,
+                                                         cache=cache)
+        ts[:, mask] = tsi
+        temp_coh[mask] = tcohi
+        num_inv_ifg[mask] = num_ifgi
         del weight
     del pha_data
 
@@ -1005,7 +1339,12 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
     print('number of columns : {}'.format(width))
 
     # split ifgram_file into blocks to save memory
-    box_list = split2boxes(dataset_shape=stack_obj.get_size(), chunk_size=inps.chunk_size)
+    box_list = split2boxes(dataset_shape=stack_obj.get_size(),
+                           chunk_size=inps.chunk_size,
+                           max_memory=inps.maxMemory,
+                           num_date=num_date,
+                           weighted=inps.weightFunc != 'no',
+                           chunk_shape=readfile.get_hdf5_chunks(ifgram_file, inps.obsDatasetName))
     num_box = len(box_list)
 
     # read ifgram_file in small patches and write them together
@@ -1019,11 +1358,6 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
     pbase = stack_obj.get_perp_baseline_timeseries(dropIfgram=True)
     date_list = stack_obj.get_date_list(dropIfgram=True)
 
-    #ts     = np.zeros((num_date, length, width), np.float32)
-    #ts_std = np.zeros((num_date, length, width), np.float32)
-    temp_coh    = np.zeros((length, width), np.float32)
-    num_inv_ifg = np.zeros((length, width), np.int16)
-
     # metadata
     metadata = dict(stack_obj.metadata)
     for key in configKeys:
@@ -1033,21 +1367,26 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
     metadata['FILE_TYPE'] = 'timeseries'
     metadata['UNIT'] = 'm'
 
-    # Loop
-    if not inps.parallel:
-        # instantiate a timeseries object
-        ts_file = '{}.h5'.format(os.path.splitext(inps.outfile[0])[0])
-        ts_obj = timeseries(ts_file)
+    # layout the output files to be written box by box,
+    # or resume from the checkpoint of the previous interrupted run
+    ts_file, tcoh_file, num_file = get_output_files(inps)
+    ckpt_file = get_checkpoint_file(ts_file)
+    ckpt_key = get_checkpoint_key(ifgram_file, metadata, inps)
+    box_done = get_finished_boxes(inps, ckpt_key)
+    if len(box_done) == 0:
+        layout_output_files(inps, metadata, date_list, pbase)
+        write_checkpoint(ckpt_file, key=ckpt_key)
 
-        # A dictionary of the datasets which we like to have in the timeseries
-        dsNameDict = {
-                "date": ((np.dtype('S8'), (num_date,))),
-                "bperp": (np.float32, (num_date,)),
-                "timeseries": (np.float32, (num_date, length, width)),
-            }
+    # Loop
+    if inps.parallel in [False, 'local']:
+        # share the design matrix factorization among patches
+        cache = designMatrixCache()
 
-        # layout the HDF5 file for the datasets and the metadata
-        ts_obj.layout_hdf5(dsNameDict, metadata)
+        # pool of processes on the local machine
+        if inps.parallel == 'local':
+            num_worker = max(min(inps.numWorker, os.cpu_count()), 1)
+            print('parallel processing using a local pool of {} processes'.format(num_worker))
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=num_worker)
 
         # invert & write block by block
         for i in range(num_box):
@@ -1056,34 +1395,61 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
                 print('\n------- Processing Patch {} out of {} --------------'.format(i+1, num_box))
 
             # invert the network
-            (tsi,
-             temp_cohi,
-             ifg_numi) = ifgram_inversion_patch(ifgram_file,
-                                                box=box,
-                                                ref_phase=ref_phase,
-                                                obsDatasetName=inps.obsDatasetName,
-                                                weight_func=inps.weightFunc,
-                                                min_norm_velocity=inps.minNormVelocity,
-                                                mask_dataset_name=inps.maskDataset,
-                                                mask_threshold=inps.maskThreshold,
-                                                min_redundancy=inps.minRedundancy,
-                                                water_mask_file=inps.waterMaskFile)
-
-            # write the block of timeseries to disk
-            block = [0, num_date, box[1], box[3], box[0], box[2]]
-            ts_obj.write2hdf5_block(tsi, datasetName='timeseries', block=block)
-
-            # save the block of aux datasets
-            temp_coh[box[1]:box[3], box[0]:box[2]] = temp_cohi
-            num_inv_ifg[box[1]:box[3], box[0]:box[2]] = ifg_numi
-
-        # write date and bperp to disk
-        print('-'*50)
-        date_list_utf8 = [dt.encode('utf-8') for dt in date_list]
-        ts_obj.write2hdf5_block(date_list_utf8, datasetName='date')
-        ts_obj.write2hdf5_block(pbase, datasetName='bperp')
+            if inps.parallel == 'local':
+                # split the patch into sub-boxes in rows, one per worker,
+                # to keep the same memory usage as the serial processing
+                subbox_list = [tuple(b) for b in subsplit_boxes4_workers(box, num_split=num_worker, dimension='y')
+                               if b[3] > b[1] and tuple(b) not in box_done]
+                if len(subbox_list) == 0:
+                    print('skip patch {} finished in the previous run'.format(box))
+                    continue
+
+                futures = []
+                for subbox in subbox_list:
+                    data = (ifgram_file,
+                            subbox,
+                            ref_phase,
+                            inps.obsDatasetName,
+                            inps.weightFunc,
+                            inps.minNormVelocity,
+                            inps.maskDataset,
+                            inps.maskThreshold,
+                            inps.minRedundancy,
+                            inps.waterMaskFile)
+                    futures.append(pool.submit(parallel_ifgram_inversion_patch, data))
+                results = (future.result() for future in concurrent.futures.as_completed(futures))
+
+            else:
+                if tuple(box) in box_done:
+                    print('skip patch {} finished in the previous run'.format(box))
+                    continue
+
+                (tsi,
+                 temp_cohi,
+                 ifg_numi) = ifgram_inversion_patch(ifgram_file,
+                                                    box=box,
+                                                    ref_phase=ref_phase,
+                                                    obsDatasetName=inps.obsDatasetName,
+                                                    weight_func=inps.weightFunc,
+                                                    min_norm_velocity=inps.minNormVelocity,
+                                                    mask_dataset_name=inps.maskDataset,
+                                                    mask_threshold=inps.maskThreshold,
+                                                    min_redundancy=inps.minRedundancy,
+                                                    water_mask_file=inps.waterMaskFile,
+                                                    cache=cache)
+                results = [(tsi, temp_cohi, ifg_numi, box)]
+
+            # write the block to disk, one (sub-)box at a time
+            for tsi, temp_cohi, ifg_numi, subbox in results:
+                write_output_block(inps, tsi, temp_cohi, ifg_numi, subbox)
+                write_checkpoint(ckpt_file, subbox)
+
+        if inps.parallel == 'local':
+            pool.shutdown()
+        else:
+            print(cache)
 
-    # Parallel loop
+    # Parallel loop with Dask
     else:
         try:
             from dask.distributed import Client, as_completed
@@ -1091,8 +1457,6 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
             raise ImportError('Cannot import dask.distributed!')
         from mintpy.objects.cluster import get_cluster
 
-        ts = np.zeros((num_date, length, width), np.float32)
-
         # Look at the ~/.config/dask/mintpy.yaml file for Changing the Dask configuration defaults
 
         # This line submits NUM_WORKERS jobs to Pegasus to start a bunch of workers
@@ -1117,6 +1481,11 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
             # With larger jobs, increasing the `num_split` factor may improve runtime
             all_boxes += subsplit_boxes4_workers(box, num_split=1 * NUM_WORKERS, dimension='x')
 
+        # skip boxes finished in the previous interrupted run
+        if len(box_done) > 0:
+            all_boxes = [i for i in all_boxes if tuple(i) not in box_done]
+            print('skip {} finished boxes, {} boxes remain'.format(len(box_done), len(all_boxes)))
+
         futures = []
         start_time_subboxes = time.time()
         for i, subbox in enumerate(all_boxes):
@@ -1151,10 +1520,11 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
                   "seconds. Box:", subbox, "Time:", time.time())
             tsi, temp_cohi, ifg_numi, subbox = result
 
-            ts[:, subbox[1]:subbox[3], subbox[0]:subbox[2]] = tsi
-            #ts_std[:, subbox[1]:subbox[3], subbox[0]:subbox[2]] = ts_stdi
-            temp_coh[subbox[1]:subbox[3], subbox[0]:subbox[2]] = temp_cohi
-            num_inv_ifg[subbox[1]:subbox[3], subbox[0]:subbox[2]] = ifg_numi
+            # write the box to disk and release its memory on both client and workers
+            write_output_block(inps, tsi, temp_cohi, ifg_numi, subbox)
+            write_checkpoint(ckpt_file, subbox)
+            future.release()
+            del result, tsi, temp_cohi, ifg_numi
 
         # Shut down Dask workers gracefully
         cluster.close()
@@ -1166,15 +1536,12 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
     if not inps.skip_ref:
         ref_y = int(stack_obj.metadata['REF_Y'])
         ref_x = int(stack_obj.metadata['REF_X'])
-        num_inv_ifg[ref_y, ref_x] = num_ifgram
-        temp_coh[ref_y, ref_x] = 1.
+        block = [ref_y, ref_y+1, ref_x, ref_x+1]
+        writefile.write_hdf5_block(tcoh_file, np.ones((1, 1), np.float32), 'temporalCoherence', block=block)
+        writefile.write_hdf5_block(num_file, np.array([[num_ifgram]], np.int16), 'mask', block=block)
 
-    if inps.parallel:
-        # for dask still use the old function to write.
-        # consider to migrate to block-by-block writing, if HDF5 support multiple 
-        write2hdf5_file(ifgram_file, metadata, ts, temp_coh, num_inv_ifg, suffix='', inps=inps)
-    else:
-        write2hdf5_auxFiles(metadata, temp_coh, num_inv_ifg, suffix='', inps=inps)
+    # all boxes are done
+    os.remove(ckpt_file)
 
     m, s = divmod(time.time()-start_time, 60)
     print('time used: {:02.0f} mins {:02.1f} secs.\n'.format(m, s))
@@ -1183,7 +1550,7 @@ def ifgram_inversion(ifgram_file='ifgramStack.h5', inps=None):
 
 def parallel_ifgram_inversion_patch(data):
     """
-    This is the starting point for Dask futures. Futures start executing code here.
+    This is the starting point for Dask futures / local pool. Futures start executing code here.
     :param data:
     :return: The box
     """
@@ -1199,6 +1566,11 @@ def parallel_ifgram_inversion_patch(data):
      water_mask_file) = data
     print("BOX DIMS:", box)
 
+    # share the design matrix factorization among tasks within the same worker process
+    global WORKER_CACHE
+    if WORKER_CACHE is None:
+        WORKER_CACHE = designMatrixCache()
+
     # This line is where all of the processing happens.
     (tsi,
      temp_cohi,
@@ -1211,7 +1583,8 @@ def parallel_ifgram_inversion_patch(data):
                                         mask_dataset_name=mask_dataset_name,
                                         mask_threshold=mask_threshold,
                                         min_redundancy=min_redundancy,
-                                        water_mask_file=water_mask_file)
+                                        water_mask_file=water_mask_file,
+                                        cache=WORKER_CACHE)
 
     return tsi, temp_cohi, ifg_numi, box
 
@@ -15,6 +15,7 @@ from mintpy.defaults import auto_path
 from mintpy.defaults.template import get_template_content
 from mintpy.objects import (geometryDatasetNames,
                             geometry,
+                            COMPRESSION_NAMES,
                             ifgramDatasetNames,
                             ifgramStack,
                             sensor)
@@ -93,8 +94,17 @@ def create_parser():
                         help='InSAR processor/software of the file', default='isce')
     parser.add_argument('--enforce', '-f', dest='updateMode', action='store_false',
                         help='Disable the update mode, or skip checking dataset already loaded.')
-    parser.add_argument('--compression', choices={'gzip', 'lzf', None}, default=None,
-                        help='compress loaded geometry while writing HDF5 file, default: None.')
+    parser.add_argument('--compression', choices=COMPRESSION_NAMES+[None], default=None,
+                        help='compress loaded geometry while writing HDF5 file, default: None.\n'
+                             'blosc / zstd require the hdf5plugin package, also for reading.')
+    parser.add_argument('--chunk-shape', dest='chunkShape', type=str, default=None,
+                        help='chunk shape / policy of HDF5 datasets, e.g. pixel, slice, balanced, "(None,128,128)"\n'
+                             'default: None for auto-chunking by h5py.')
+    parser.add_argument('--quantize', dest='quantize', action='store_true',
+                        help='store coherence (and connectComponent in byte) in uint8 with scale_factor attributes,\n'
+                             'decoded into float32 while reading, with max error of 0.002.')
+    parser.add_argument('--num-worker', dest='numWorker', type=int, default=4,
+                        help='number of threads to read the interferograms, while writing to HDF5 file, default: 4.')
 
     parser.add_argument('-o', '--output', type=str, nargs=3, dest='outfile',
                         default=['./inputs/ifgramStack.h5',
@@ -148,13 +158,17 @@ def read_inps2dict(inps):
     key_list = [i.split(prefix)[1] for i in template.keys() if i.startswith(prefix)]
     for key in key_list:
         value = template[prefix+key]
-        if key in ['processor', 'updateMode', 'compression']:
+        if key in ['processor', 'updateMode', 'compression', 'chunkShape', 'quantize']:
             inpsDict[key] = template[prefix+key]
+        elif key in ['numWorker']:
+            inpsDict[key] = int(value)
         elif value:
             inpsDict[prefix+key] = template[prefix+key]
 
     if inpsDict['compression'] == False:
         inpsDict['compression'] = None
+    if inpsDict['chunkShape'] == False:
+        inpsDict['chunkShape'] = None
 
     # PROJECT_NAME --> PLATFORM
     if not inpsDict['PROJECT_NAME']:
@@ -286,7 +300,7 @@ def update_box4files_with_inconsistent_size(fnames):
 
 def skip_files_with_inconsistent_size(dsPathDict, pix_box=None, dsName='unwrapPhase'):
     """Skip files by removing the file path from the input dsPathDict."""
-    atr_list = [readfile.read_attribute(fname) for fname in dsPathDict[dsName]]
+    atr_list = readfile.read_attributes(dsPathDict[dsName])
     length_list = [int(atr['LENGTH']) for atr in atr_list]
     width_list = [int(atr['WIDTH']) for atr in atr_list]
 
@@ -507,7 +521,12 @@ def read_inps_dict2geometry_dict_object(inpsDict):
 def update_object(outFile, inObj, box, updateMode=True):
     """Do not write h5 file if: 1) h5 exists and readable,
                                 2) it contains all date12 from ifgramStackDict,
-                                            or all datasets from geometryDict"""
+                                            or all datasets from geometryDict
+    Append to the existing ifgramStack h5 file if it has the same size and datasets, and
+    all its date12 are in ifgramStackDict, but not the other way around; re-write it if it
+    contains extra datasets, e.g. unwrapPhase_bridging, which could not be extended.
+    Returns: write_flag : bool or str, True / False / 'append'
+    """
     write_flag = True
     if updateMode and ut.run_or_skip(outFile, check_readable=True) == 'skip':
         if inObj.name == 'ifgramStack':
@@ -517,12 +536,22 @@ def update_object(outFile, inObj, box, updateMode=True):
             outObj = ifgramStack(outFile)
             out_size = outObj.get_size()[1:]
             out_date12_list = outObj.get_date12_list(dropIfgram=False)
+            in_ds_list = list(list(inObj.pairsDict.values())[0].datasetDict.keys())
+            outObj.open(print_msg=False)
 
             if out_size == in_size and set(in_date12_list).issubset(set(out_date12_list)):
                 print(('All date12   exists in file {} with same size as required,'
                        ' no need to re-load.'.format(os.path.basename(outFile))))
                 write_flag = False
 
+            elif (out_size == in_size
+                    and set(out_date12_list).issubset(set(in_date12_list))
+                    and set(in_ds_list) == set(outObj.datasetNames)):
+                print(('All date12   in file {} exists in the input with same size as required,'
+                       ' append the {} new pairs only.'.format(os.path.basename(outFile),
+                                                               len(set(in_date12_list) - set(out_date12_list)))))
+                write_flag = 'append'
+
         elif inObj.name == 'geometry':
             outObj = geometry(outFile)
             outObj.open(print_msg=False)
@@ -586,6 +615,7 @@ def print_write_setting(inpsDict):
     print('-'*50)
     print('updateMode : {}'.format(updateMode))
     print('compression: {}'.format(comp))
+    print('chunkShape : {}'.format(inpsDict['chunkShape']))
     box = inpsDict['box']
     boxGeo = inpsDict['box4geo_lut']
     return updateMode, comp, box, boxGeo
@@ -600,6 +630,9 @@ def get_extra_metadata(inpsDict):
     for key in ['SUBSET_XMIN', 'SUBSET_YMIN']:
         if key in inpsDict.keys():
             extraDict[key] = inpsDict[key]
+    # chunk policy, inherited by the writers of the downstream products
+    if inpsDict['chunkShape']:
+        extraDict['CHUNK_SHAPE'] = inpsDict['chunkShape']
     return extraDict
 
 
@@ -625,13 +658,22 @@ def main(iargs=None):
         print('create directory: {}'.format(inps.outdir))
 
     # write
-    if stackObj and update_object(inps.outfile[0], stackObj, box, updateMode=updateMode):
+    stack_write_flag = update_object(inps.outfile[0], stackObj, box, updateMode=updateMode) if stackObj else False
+    if stack_write_flag == 'append':
+        print('-'*50)
+        stackObj.append2hdf5(outputFile=inps.outfile[0],
+                             box=box,
+                             num_workers=inpsDict['numWorker'])
+
+    elif stack_write_flag:
         print('-'*50)
         stackObj.write2hdf5(outputFile=inps.outfile[0],
                             access_mode='w',
                             box=box,
                             compression=comp,
-                            extra_metadata=extraDict)
+                            extra_metadata=extraDict,
+                            num_workers=inpsDict['numWorker'],
+                            quantize=inpsDict['quantize'])
 
     if geomRadarObj and update_object(inps.outfile[1], geomRadarObj, box, updateMode=updateMode):
         print('-'*50)
@@ -15,6 +15,7 @@ except ImportError:
 import time
 import itertools
 import numpy as np
+from scipy import ndimage
 from scipy.sparse import csgraph as csg
 from scipy.spatial import cKDTree
 from .ramp import deramp
@@ -56,8 +57,9 @@ class connectComponent:
 
     def label(self, min_area=2.5e3, erosion_size=5, print_msg=False):
         """ Label the connected components
-        Returns: self.labelImg   - 2D np.ndarray in int64 to mask areas to be corrected
-                 self.labelBound - 2D np.ndarray in uint8 for label boundaries to find bridges
+        Returns: self.labelImg    - 2D np.ndarray in int64 to mask areas to be corrected
+                 self.labelBound  - 2D np.ndarray in int64 for label boundaries to find bridges
+                 self.labelSlices - list of tuple of 2 slice, bounding box of each label in labelImg
         """
         # 1. labelImg
         (self.labelImg,
@@ -67,6 +69,7 @@ class connectComponent:
                                                  erosion_size=erosion_size,
                                                  get_boundary=True,
                                                  print_msg=print_msg)
+        self.labelSlices = ndimage.find_objects(self.labelImg)
 
         # 2. reference label (ref_y/x or the largest one)
         if self.refY is not None:
@@ -80,6 +83,25 @@ class connectComponent:
         return
 
 
+    @staticmethod
+    def remove_label(label_img, flag_remove):
+        """Remove labels and re-label the rest sequentially, with one lookup table.
+        The same as setting the removed labels to zero and re-running measure.label() for label images
+        from measure.label(), as the labels are sorted by the raster order of their first pixel.
+        Parameters: label_img   - 2D np.ndarray in int, label image
+                    flag_remove - 1D np.ndarray in bool in size of (num_label+1,), True for labels to be removed
+        Returns:    label_img   - 2D np.ndarray in int, re-labeled image
+                    num_label   - int, number of labels left
+                    lut         - 1D np.ndarray in int in size of (num_label+1,), lookup table from old to new label
+        """
+        flag_keep = ~flag_remove
+        flag_keep[0] = False
+        num_label = int(np.sum(flag_keep))
+        lut = np.zeros(flag_keep.size, dtype=label_img.dtype)
+        lut[flag_keep] = np.arange(1, num_label+1)
+        return lut[label_img], num_label, lut
+
+
     @staticmethod
     def get_large_label(mask, min_area=2.5e3, erosion_size=5, get_boundary=False, print_msg=False):
         # initial label
@@ -89,34 +111,31 @@ class connectComponent:
         if print_msg:
             print('remove regions with area < {}'.format(int(min_area)))
         min_area = min(min_area, label_img.size * 3e-3)
-        flag_slabel = np.bincount(label_img.flatten()) < min_area
-        flag_slabel[0] = False
-        label_small = np.where(flag_slabel)[0]
-        for i in label_small:
-            label_img[label_img == i] = 0
-        label_img, num_label = measure.label(label_img, connectivity=1, return_num=True) # re-label
+        flag_slabel = np.bincount(label_img.flatten(), minlength=num_label+1) < min_area
+        label_img, num_label = connectComponent.remove_label(label_img, flag_slabel)[:2]
 
         # remove regions that would disappear after erosion operation
         erosion_structure = np.ones((erosion_size, erosion_size))
-        label_erosion_img = morph.erosion(label_img, erosion_structure).astype(np.uint8)
-        erosion_regions = measure.regionprops(label_erosion_img)
-        if len(erosion_regions) < num_label:
+        label_erosion_img = morph.erosion(label_img, erosion_structure)
+        flag_lost = np.bincount(label_erosion_img.flatten(), minlength=num_label+1) == 0
+        flag_lost[0] = False
+        if np.any(flag_lost):
             if print_msg:
                 print('Some regions are lost during morphological erosion operation')
-            label_erosion = [reg.label for reg in erosion_regions]
-            for orig_reg in measure.regionprops(label_img):
-                if orig_reg.label not in label_erosion:
-                    if print_msg:
-                        print('label: {}, area: {}, bbox: {}'.format(orig_reg.label,
-                                                                     orig_reg.area,
-                                                                     orig_reg.bbox))
-                    label_img[label_img == orig_reg.label] = 0
-        label_img, num_label = measure.label(label_img, connectivity=1, return_num=True) # re-label
+                area = np.bincount(label_img.flatten(), minlength=num_label+1)
+                bbox_list = ndimage.find_objects(label_img)
+                for label in np.where(flag_lost)[0]:
+                    bbox = bbox_list[label-1]
+                    print('label: {}, area: {}, bbox: {}'.format(label,
+                                                                 area[label],
+                                                                 (bbox[0].start, bbox[1].start,
+                                                                  bbox[0].stop, bbox[1].stop)))
+            label_img, num_label, lut = connectComponent.remove_label(label_img, flag_lost)
+            label_erosion_img = lut[label_erosion_img]
 
         # get label boundaries to facilitate bridge finding
         if get_boundary:
-            label_bound = seg.find_boundaries(label_erosion_img, mode='thick').astype(np.uint8)
-            label_bound *= label_erosion_img
+            label_bound = seg.find_boundaries(label_erosion_img, mode='thick') * label_erosion_img
             return label_img, num_label, label_bound
         else:
             return label_img, num_label
@@ -232,18 +251,24 @@ class connectComponent:
         return self.bridges
 
 
-    def get_bridge_endpoint_aoi_mask(self, bridge, radius=50):
-        # get AOI mask
+    def get_bridge_endpoint_aoi_slice(self, bridge, radius=50):
+        # get AOI window as tuple of 2 slice
         x0, y0 = bridge['x0'], bridge['y0']
         x1, y1 = bridge['x1'], bridge['y1']
-        x00 = max(0, x0 - radius); x01 = min(self.width,  x0 + radius)
-        y00 = max(0, y0 - radius); y01 = min(self.length, y0 + radius)
-        x10 = max(0, x1 - radius); x11 = min(self.width,  x1 + radius)
-        y10 = max(0, y1 - radius); y11 = min(self.length, y1 + radius)
+        aoi_slice0 = (slice(max(0, y0 - radius), min(self.length, y0 + radius)),
+                      slice(max(0, x0 - radius), min(self.width,  x0 + radius)))
+        aoi_slice1 = (slice(max(0, y1 - radius), min(self.length, y1 + radius)),
+                      slice(max(0, x1 - radius), min(self.width,  x1 + radius)))
+        return aoi_slice0, aoi_slice1
+
+
+    def get_bridge_endpoint_aoi_mask(self, bridge, radius=50):
+        # get AOI mask
+        aoi_slice0, aoi_slice1 = self.get_bridge_endpoint_aoi_slice(bridge, radius=radius)
         aoi_mask0 = np.zeros(self.labelImg.shape, dtype=np.bool_)
         aoi_mask1 = np.zeros(self.labelImg.shape, dtype=np.bool_)
-        aoi_mask0[y00:y01, x00:x01] = True
-        aoi_mask1[y10:y11, x10:x11] = True
+        aoi_mask0[aoi_slice0] = True
+        aoi_mask1[aoi_slice1] = True
         return aoi_mask0, aoi_mask1
 
 
@@ -261,15 +286,18 @@ class connectComponent:
             ramp_mask = (self.labelImg == self.labelRef)
             unw, ramp = deramp(unw, ramp_mask, ramp_type, metadata=self.metadata)
 
+        if not hasattr(self, 'labelSlices'):
+            self.labelSlices = ndimage.find_objects(self.labelImg)
+
         for bridge in self.bridges:
-            # prepare masks
-            aoi_mask0, aoi_mask1 = self.get_bridge_endpoint_aoi_mask(bridge, radius=radius)
-            label_mask0 = self.labelImg == bridge['label0']
-            label_mask1 = self.labelImg == bridge['label1']
+            # prepare AOI windows
+            aoi_slice0, aoi_slice1 = self.get_bridge_endpoint_aoi_slice(bridge, radius=radius)
+            label_mask0 = self.labelImg[aoi_slice0] == bridge['label0']
+            label_mask1 = self.labelImg[aoi_slice1] == bridge['label1']
 
             # get phase difference
-            value0 = np.nanmedian(unw[aoi_mask0 * label_mask0])
-            value1 = np.nanmedian(unw[aoi_mask1 * label_mask1])
+            value0 = np.nanmedian(unw[aoi_slice0][label_mask0])
+            value1 = np.nanmedian(unw[aoi_slice1][label_mask1])
             diff_value = value1 - value0
 
             # estimate integer number of phase jump
@@ -277,8 +305,10 @@ class connectComponent:
             if diff_value > 0:
                 num_jump *= -1
 
-            # add phase jump
-            unw[label_mask1] += 2.* np.pi * num_jump
+            # add phase jump, within the bounding box of label1
+            label_slice1 = self.labelSlices[bridge['label1']-1]
+            unw_box = unw[label_slice1]
+            unw_box[self.labelImg[label_slice1] == bridge['label1']] += 2.* np.pi * num_jump
 
             if print_msg:
                 print(('phase diff {}_{}: {:04.1f} rad --> '
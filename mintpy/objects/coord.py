@@ -9,6 +9,7 @@
 
 from argparse import Namespace
 import numpy as np
+from scipy.spatial import cKDTree
 from mintpy.utils import readfile
 from mintpy.utils.utils0 import *
 from mintpy.utils.utils1 import *
@@ -31,6 +32,9 @@ class coordinate:
         coord = ut.coordinate(atr)                                         # for geo   coord file
         y, x = coord.geo2radar(lat, lon)[0:2]
         lat, lon = coord.radar2geo(y, x)[0:2]
+
+        # many points at once, e.g. GPS sites, with kd-tree for radar coord lookup table
+        y, x = coord.geo2radar(lats, lons, bulk=True)[0:2]
     """
 
     def __init__(self, metadata, lookup_file=None):
@@ -51,6 +55,7 @@ class coordinate:
         self.lookup_file = lookup_file
         self.lut_y = None
         self.lut_x = None
+        self.lut_kdtree = None
 
     def open(self):
         try:
@@ -185,6 +190,61 @@ class coordinate:
         return row, col
 
 
+    def _get_lookup_kdtree(self):
+        """Build the kd-tree of the lat/lon of the radar coord lookup table, once per object,
+        with longitude scaled by cos(lat) for isotropic distance in degrees.
+        """
+        if self.lut_kdtree is None:
+            mask = np.multiply(np.isfinite(self.lut_y), np.isfinite(self.lut_x))
+            mask *= np.multiply(self.lut_y != 0., self.lut_x != 0.)
+            self.lut_kdtree_lat_c = np.nanmean(self.lut_y[mask])
+            self.lut_kdtree_index = np.flatnonzero(mask)
+            lon_scale = np.cos(self.lut_kdtree_lat_c * np.pi/180.)
+            self.lut_kdtree = cKDTree(np.stack((self.lut_y[mask],
+                                                self.lut_x[mask] * lon_scale), axis=1))
+        return self.lut_kdtree
+
+    def _get_lookup_row_col_bulk(self, lat, lon, y_buffer, x_buffer):
+        """Get row/col number in the radar coord lookup table for many points at once,
+        from the nearest pixel in the kd-tree, refined with the local lat/lon gradient.
+        Parameters: lat/lon  : 1D np.ndarray, latitude/longitude of points
+                    y/x_buffer : float, max distance in degree in lat/lon direction, as in _get_lookup_row_col()
+        Returns:    row/col  : 1D np.ndarray in float, row/column number
+        """
+        tree = self._get_lookup_kdtree()
+        lon_scale = np.cos(self.lut_kdtree_lat_c * np.pi/180.)
+        dist, idx = tree.query(np.stack((lat, lon * lon_scale), axis=1), k=1)
+
+        # points outside of the lookup table coverage
+        flag = dist > np.hypot(y_buffer, x_buffer * lon_scale)
+        if np.any(flag):
+            i = np.where(flag)[0][0]
+            raise RuntimeError('No coresponding coordinate found for {} points, e.g. y/x: {}/{}'.format(
+                np.sum(flag), lat[i], lon[i]))
+
+        row, col = np.unravel_index(self.lut_kdtree_index[idx], self.lut_y.shape)
+
+        # sub-pixel offset by solving the local linear model:
+        # [dlat, dlon] = [[dlat/drow, dlat/dcol], [dlon/drow, dlon/dcol]] * [drow, dcol]
+        length, width = self.lut_y.shape
+        r0, r1 = np.maximum(row - 1, 0), np.minimum(row + 1, length - 1)
+        c0, c1 = np.maximum(col - 1, 0), np.minimum(col + 1, width - 1)
+        jac = np.zeros((row.size, 2, 2), dtype=np.float64)
+        for i, lut in enumerate([self.lut_y, self.lut_x]):
+            jac[:, i, 0] = (lut[r1, col] - lut[r0, col]) / (r1 - r0)
+            jac[:, i, 1] = (lut[row, c1] - lut[row, c0]) / (c1 - c0)
+        res = np.stack((lat - self.lut_y[row, col], lon - self.lut_x[row, col]), axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            det = jac[:, 0, 0] * jac[:, 1, 1] - jac[:, 0, 1] * jac[:, 1, 0]
+            d_row = (jac[:, 1, 1] * res[:, 0] - jac[:, 0, 1] * res[:, 1]) / det
+            d_col = (jac[:, 0, 0] * res[:, 1] - jac[:, 1, 0] * res[:, 0]) / det
+
+        # keep the nearest pixel for invalid neighbors, e.g. at the edge of the coverage
+        flag = np.multiply(np.abs(d_row) <= 1, np.abs(d_col) <= 1)
+        row = row + np.where(flag, d_row, 0.)
+        col = col + np.where(flag, d_col, 0.)
+        return row, col
+
     def read_lookup_table(self, print_msg=True):
         if 'Y_FIRST' in self.lut_metadata.keys():
             self.lut_y = readfile.read(self.lookup_file[0],
@@ -217,9 +277,13 @@ class coordinate:
         lut.lon_step = lut.lon_step_deg * np.pi/180.0 * self.earth_radius * np.cos(lat_c * np.pi/180)
         return lut
 
-    def geo2radar(self, lat, lon, print_msg=True, debug_mode=False):
+    def geo2radar(self, lat, lon, print_msg=True, debug_mode=False, bulk=False):
         """Convert geo coordinates into radar coordinates.
         Parameters: lat/lon : np.array, float, latitude/longitude
+                    bulk    : bool, convert all points in one vectorized call using the nearest pixel from
+                              a kd-tree of the lookup table, for radar coord lookup table (ISCE) only.
+                              It is much faster for many points, and within 1 pixel of the true position, while
+                              the default buffer search could be off by 2 pixels, as checked in test/test_coord.py.
         Returns:    az/rg : np.array, float, range/azimuth pixel number
                     az/rg_res : float, residul/uncertainty of coordinate conversion
         """
@@ -280,8 +344,16 @@ class coordinate:
             x_factor = 10
             y_factor = 10
 
+            # search the nearest pixel for all points at once
+            if bulk:
+                az, rg = self._get_lookup_row_col_bulk(lat.reshape(-1), lon.reshape(-1),
+                                                       y_factor*az_step_deg,
+                                                       x_factor*rg_step_deg)
+                az = az.reshape(lat.shape)
+                rg = rg.reshape(lat.shape)
+
             # search the overlap area of buffer in x/y direction and use the cross center
-            if lat.size == 1:
+            elif lat.size == 1:
                 az, rg = self._get_lookup_row_col(lat, lon,
                                                   y_factor*az_step_deg,
                                                   x_factor*rg_step_deg,
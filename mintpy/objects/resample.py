@@ -9,9 +9,14 @@
 
 try:
     import pyresample as pr
+    import pyresample.bilinear
 except ImportError:
     raise ImportError('Can not import pyresample!')
 
+import os
+import json
+import hashlib
+import h5py
 import numpy as np
 from scipy import ndimage
 from scipy.interpolate import RegularGridInterpolator as RGI
@@ -34,15 +39,29 @@ class resample:
         # run geocoding
         rdr_data = readfile.read('temporalCoherence.h5')[0]
         geo_data = res_obj.run_resample(src_data=rdr_data, interp_method='nearest', fill_value=np.nan)
+
+        # re-use the resampling plan for other datasets with the same size
+        plan = res_obj.get_resample_plan(interp_method='nearest')
+        geo_data = res_obj.apply_resample_plan(rdr_data, plan, fill_value=np.nan)
+
+    The resampling plan is cached in a HDF5 file next to the lookup table, e.g.
+    ./inputs/resamplePlan_<hash>.h5, and re-used by the following runs with the same
+    lookup table, source data size, SNWE and laloStep, with the kd-tree search skipped.
     """
 
-    def __init__(self, lookupFile, dataFile, SNWE=None, laloStep=None, processor=None):
+    def __init__(self, lookupFile, dataFile, SNWE=None, laloStep=None, processor=None, cachePlan=True):
         self.file = lookupFile
         self.dataFile = dataFile
         self.SNWE = SNWE
         self.laloStep = laloStep
+        self.inputSNWE = SNWE
+        self.inputLaloStep = laloStep
         self.processor = processor
+        self.cachePlan = cachePlan
         self.valid_index = None
+        self.planDict = dict()
+        self.planFile = None
+        self.geometry_prepared = False
 
     def open(self):
         """Prepare aux data before interpolation operation"""
@@ -55,6 +74,21 @@ class resample:
             else:
                 self.processor = 'pyresample'
 
+        # grab the output grid from the cached resampling plan
+        # and prepare the geometry definition only when needed
+        if self.cachePlan:
+            self.planFile, self.planKey = self.get_plan_file()
+            if self.read_plan_grid():
+                print('use output grid from the cached resampling plan: {}'.format(self.planFile))
+                return
+
+        self.prepare_geometry()
+
+    def prepare_geometry(self):
+        """Prepare source and destination geometry, and update SNWE and laloStep"""
+        self.SNWE = self.inputSNWE
+        self.laloStep = self.inputLaloStep
+
         # get src_def and dest_def, update SNWE and laloStep
         if self.processor == 'pyresample':
             if 'Y_FIRST' not in self.lut_metadata.keys():
@@ -65,6 +99,106 @@ class resample:
 
         elif self.processor == 'scipy' and 'Y_FIRST' in self.lut_metadata.keys():
             self.prepare_regular_grid_interpolator()
+        self.geometry_prepared = True
+
+    ##---------------------------- cache of resampling plan ----------------------------##
+    def get_plan_file(self):
+        """Get the path of the resampling plan file and its key.
+        Returns:    plan_file : str, path of the HDF5 file next to the lookup table
+                    plan_key  : str, JSON string of the info the resampling plan depends on
+        """
+        st = os.stat(self.file)
+        src_keys = ['LENGTH', 'WIDTH', 'SUBSET_YMIN', 'SUBSET_XMIN', 'Y_FIRST', 'X_FIRST', 'Y_STEP', 'X_STEP']
+        key_dict = {
+            'lookup_file' : os.path.abspath(self.file),
+            'lookup_mtime': st.st_mtime_ns,
+            'lookup_size' : st.st_size,
+            'processor'   : self.processor,
+            'SNWE'        : None if self.inputSNWE is None else [float(i) for i in self.inputSNWE],
+            'laloStep'    : None if self.inputLaloStep is None else [float(i) for i in self.inputLaloStep],
+            'src_metadata': {key: self.src_metadata.get(key, None) for key in src_keys},
+        }
+        plan_key = json.dumps(key_dict, sort_keys=True)
+
+        # file name independent of the lookup file mtime, so that the outdated plan is overwritten
+        name_dict = {key: val for key, val in key_dict.items() if key not in ['lookup_mtime', 'lookup_size']}
+        name_hash = hashlib.md5(json.dumps(name_dict, sort_keys=True).encode()).hexdigest()[:8]
+        plan_file = os.path.join(os.path.dirname(os.path.abspath(self.file)),
+                                 'resamplePlan_{}.h5'.format(name_hash))
+        return plan_file, plan_key
+
+    def read_plan_grid(self):
+        """Read the output grid info from the cached resampling plan file, if it is valid.
+        Returns:    True if the output grid is read, False otherwise
+        """
+        if not self.planFile or not os.path.isfile(self.planFile):
+            return False
+        try:
+            with h5py.File(self.planFile, 'r') as f:
+                if f.attrs['KEY'] != self.planKey:
+                    return False
+                self.length = int(f.attrs['LENGTH'])
+                self.width = int(f.attrs['WIDTH'])
+                self.SNWE = tuple(f.attrs[i] for i in ['S', 'N', 'W', 'E'])
+                self.laloStep = tuple(f.attrs[i] for i in ['LAT_STEP', 'LON_STEP'])
+        except (OSError, KeyError):
+            return False
+        return True
+
+    def read_plan(self, interp_method):
+        """Read the resampling plan of the given interpolation method from the cached file.
+        Returns:    plan : dict, check prepare_resample_plan() for details, None if not cached
+        """
+        if not self.cachePlan or not self.read_plan_grid():
+            return None
+        with h5py.File(self.planFile, 'r') as f:
+            if interp_method not in f.keys():
+                return None
+            g = f[interp_method]
+            plan = {
+                'interp_method' : interp_method,
+                'src_shape'     : tuple(int(i) for i in g.attrs['SRC_SHAPE']),
+                'dest_shape'    : tuple(int(i) for i in g.attrs['DEST_SHAPE']),
+                'dest_index'    : g['dest_index'][:].astype(np.int64),
+                'src_index'     : g['src_index'][:].astype(np.int64),
+                'weights'       : g['weights'][:] if 'weights' in g.keys() else None,
+            }
+        print('read {} resampling plan from file: {}'.format(interp_method, self.planFile))
+        return plan
+
+    def write_plan(self, plan):
+        """Write the resampling plan into the cache file, shared by all interpolation methods."""
+        if not self.cachePlan or not self.planFile:
+            return
+        mode = 'a' if self.read_plan_grid() else 'w'
+        try:
+            with h5py.File(self.planFile, mode) as f:
+                # output grid info
+                f.attrs['KEY'] = self.planKey
+                f.attrs['LENGTH'] = self.length
+                f.attrs['WIDTH'] = self.width
+                for key, value in zip(['S', 'N', 'W', 'E', 'LAT_STEP', 'LON_STEP'],
+                                      list(self.SNWE) + list(self.laloStep)):
+                    f.attrs[key] = value
+
+                # resampling plan, with index in uint32 if possible to save disk space
+                interp_method = plan['interp_method']
+                if interp_method in f.keys():
+                    del f[interp_method]
+                g = f.create_group(interp_method)
+                g.attrs['SRC_SHAPE'] = plan['src_shape']
+                g.attrs['DEST_SHAPE'] = plan['dest_shape']
+                for key in ['dest_index', 'src_index', 'weights']:
+                    data = plan[key]
+                    if data is None:
+                        continue
+                    if key.endswith('index') and max(np.prod(plan['src_shape']), np.prod(plan['dest_shape'])) < 2**32:
+                        data = data.astype(np.uint32)
+                    g.create_dataset(key, data=data, chunks=True, compression='lzf')
+            print('save {} resampling plan to file: {}'.format(interp_method, self.planFile))
+        except OSError as e:
+            print('WARNING: can not write the resampling plan to file: {}, {}'.format(self.planFile, e))
+        return
 
     def run_resample(self, src_data, interp_method='nearest', fill_value=np.nan, nprocs=1, print_msg=True):
         """Run interpolation operation for input 2D/3D data
@@ -75,46 +209,172 @@ class resample:
                     print_msg     : bool
         Returns:    geo_data      : 2D/3D np.array
         """
-        # use pyresample
-        if self.processor == 'pyresample':
-            if len(src_data.shape) == 3:
-                src_data = np.moveaxis(src_data, 0, -1)
+        plan = self.get_resample_plan(interp_method=interp_method, nprocs=nprocs, print_msg=print_msg)
+        geo_data = self.apply_resample_plan(src_data, plan, fill_value=fill_value, print_msg=print_msg)
+        return geo_data
 
-            if src_data.dtype == np.bool_:
-                fill_value = False
-                print('restrict fill value to False for bool type source data')
+    def get_resample_plan(self, interp_method='nearest', nprocs=1, print_msg=True):
+        """Get the resampling plan for the given interpolation method, computed once and re-used."""
+        interp_method = 'nearest' if interp_method.startswith('near') else 'linear'
+        if interp_method not in self.planDict.keys():
+            plan = self.read_plan(interp_method)
+            if plan is None:
+                plan = self.prepare_resample_plan(interp_method=interp_method,
+                                                  nprocs=nprocs,
+                                                  print_msg=print_msg)
+                self.write_plan(plan)
+            self.planDict[interp_method] = plan
+        return self.planDict[interp_method]
+
+    def prepare_resample_plan(self, interp_method='nearest', nprocs=1, print_msg=True):
+        """Pre-compute the resampling plan between the source and destination grids,
+        so that it can be applied to any number of 2D/3D datasets as a sparse gather.
+        Parameters: interp_method : string, nearest | linear
+                    nprocs        : int, number of processes to be used for the kd-tree search
+        Returns:    plan          : dict, with the following items:
+                        interp_method : str, nearest | linear
+                        src_shape     : tuple of 2 int, source      2D size in (length, width)
+                        dest_shape    : tuple of 2 int, destination 2D size in (length, width)
+                        dest_index    : 1D np.ndarray in size of (num_pixel,),
+                                        flattened index of the valid destination pixels
+                        src_index     : 2D np.ndarray in size of (num_pixel, num_neighbor),
+                                        flattened index of the source pixels, 1 for nearest, 4 for linear
+                        weights       : 2D np.ndarray in size of (num_pixel, num_neighbor) for linear,
+                                        None for nearest
+        """
+        if not self.geometry_prepared:
+            self.prepare_geometry()
 
-            # resample source data into target data
-            geo_data = self.run_pyresample(src_data=src_data,
-                                           interp_method=interp_method,
-                                           fill_value=fill_value,
-                                           nprocs=nprocs,
-                                           radius=None,
-                                           print_msg=True)
+        src_shape = (int(self.src_metadata['LENGTH']), int(self.src_metadata['WIDTH']))
+        dest_shape = (self.length, self.width)
+        weights = None
 
-            if len(geo_data.shape) == 3:
-                geo_data = np.moveaxis(geo_data, -1, 0)
+        if self.processor == 'pyresample':
+            # radius of influence
+            if 'Y_FIRST' in self.src_metadata.keys():
+                radius = 100e3
+            else:
+                radius = self.get_radius_of_influence()
+            num_segment = self.get_segment_number()
+
+            if interp_method == 'nearest':
+                if print_msg:
+                    msg = 'calculate nearest neighbor with kd_tree '
+                    msg += 'using {} processor cores in {} segments ...'.format(nprocs, num_segment)
+                    print(msg)
+                valid_input_index, valid_output_index, index_array = pr.kd_tree.get_neighbour_info(
+                    self.src_def,
+                    self.dest_def,
+                    radius,
+                    neighbours=1,
+                    epsilon=0.5,
+                    nprocs=nprocs,
+                    segments=num_segment)[:3]
+                src_valid = np.flatnonzero(valid_input_index)
+                flag = index_array < src_valid.size
+                dest_index = np.flatnonzero(valid_output_index)[flag]
+                src_index = src_valid[index_array[flag]].reshape(-1, 1)
+
+            else:
+                if print_msg:
+                    print('calculate bilinear weights using {} processor cores ...'.format(nprocs))
+                t, s, input_idxs, idx_arr = pr.bilinear.get_bil_info(self.src_def,
+                                                                     self.dest_def,
+                                                                     radius=radius,
+                                                                     neighbours=32,
+                                                                     nprocs=nprocs,
+                                                                     masked=False,
+                                                                     segments=num_segment,
+                                                                     epsilon=0)
+                src_valid = np.flatnonzero(input_idxs) if input_idxs.dtype == np.bool_ else input_idxs
+                t = np.asarray(t).flatten()
+                s = np.asarray(s).flatten()
+                idx_arr = np.asarray(idx_arr).reshape(-1, 4)
+                flag = np.isfinite(t) * np.isfinite(s) * np.all(idx_arr < src_valid.size, axis=1)
+                dest_index = np.flatnonzero(flag)
+                src_index = src_valid[idx_arr[flag]]
+                t, s = t[flag], s[flag]
+                weights = np.stack(((1 - s) * (1 - t), s * (1 - t), (1 - s) * t, s * t), axis=1)
+
+            # index in the full source grid, for reduced swath data
+            if self.valid_index is not None:
+                src_index = np.flatnonzero(self.valid_index)[src_index]
 
-        # use scipy.interpolater.RegularGridInterpolator
         else:
+            # scipy.interpolate.RegularGridInterpolator: on the grid points [0, n-1]
+            # with the same lower/upper neighbor and rounding rule
             if print_msg:
-                print('resampling using scipy.interpolate.RegularGridInterpolator ...')
-            if len(src_data.shape) == 3:
-                geo_data = np.empty((src_data.shape[0], self.length, self.width), src_data.dtype)
-                prog_bar = ptime.progressBar(maxValue=src_data.shape[0])
-                for i in range(src_data.shape[0]):
-                    geo_data[i, :, :] = self.run_regular_grid_interpolator(src_data=src_data[i, :, :],
-                                                                           interp_method=interp_method,
-                                                                           fill_value=fill_value,
-                                                                           print_msg=True)
-                    prog_bar.update(i+1)
-                prog_bar.close()
+                print('calculate {} neighbor index on regular grid ...'.format(interp_method))
+            dest_y, dest_x = self.dest_pts[:, 0], self.dest_pts[:, 1]
+            flag = np.multiply(dest_y <= src_shape[0] - 1, dest_x <= src_shape[1] - 1)
+            dest_index = np.flatnonzero(self.interp_mask)[flag]
+            index_list, dist_list = [], []
+            for pts, num in zip([dest_y[flag], dest_x[flag]], src_shape):
+                idx = np.clip(np.searchsorted(np.arange(num), pts, side='right') - 1, 0, max(num - 2, 0))
+                index_list.append(idx)
+                dist_list.append(pts - idx)
+
+            if interp_method == 'nearest':
+                y, x = [np.where(d <= 0.5, i, i + 1) for i, d in zip(index_list, dist_list)]
+                src_index = (y * src_shape[1] + x).reshape(-1, 1)
             else:
-                geo_data = self.run_regular_grid_interpolator(src_data=src_data,
-                                                              interp_method=interp_method,
-                                                              fill_value=fill_value,
-                                                              print_msg=True)
-        return geo_data
+                (y, x), (dy, dx) = index_list, dist_list
+                src_index = np.stack((y * src_shape[1] + x,
+                                      y * src_shape[1] + x + 1,
+                                      (y + 1) * src_shape[1] + x,
+                                      (y + 1) * src_shape[1] + x + 1), axis=1)
+                weights = np.stack(((1 - dy) * (1 - dx), (1 - dy) * dx, dy * (1 - dx), dy * dx), axis=1)
+
+        plan = {
+            'interp_method' : interp_method,
+            'src_shape'     : src_shape,
+            'dest_shape'    : dest_shape,
+            'dest_index'    : dest_index.astype(np.int64),
+            'src_index'     : src_index.astype(np.int64),
+            'weights'       : weights,
+        }
+        if print_msg:
+            print('number of valid pixels in the destination grid: {} out of {}'.format(dest_index.size,
+                                                                                          np.prod(dest_shape)))
+        return plan
+
+    @staticmethod
+    def apply_resample_plan(src_data, plan, fill_value=np.nan, print_msg=True):
+        """Resample 2D/3D source data with the pre-computed plan via sparse gather.
+        Parameters: src_data   : 2D/3D np.array, source data in size of ([num_slice, ]length, width)
+                    plan       : dict, resampling plan from prepare_resample_plan()
+                    fill_value : NaN or number, value for pixels without valid source data
+        Returns:    dest_data  : 2D/3D np.array, in the destination grid
+        """
+        if src_data.shape[-2:] != tuple(plan['src_shape']):
+            raise ValueError('input data size {} does not match the resampling plan source size {}!'.format(
+                src_data.shape[-2:], tuple(plan['src_shape'])))
+
+        if src_data.dtype == np.bool_:
+            fill_value = False
+            if print_msg:
+                print('restrict fill value to False for bool type source data')
+
+        elif np.isnan(fill_value) and not np.issubdtype(src_data.dtype, np.inexact):
+            fill_value = 0
+            if print_msg:
+                print('input source data is not float, change fill_value from NaN to 0.')
+
+        # reshape to (num_slice, num_pixel)
+        out_shape = src_data.shape[:-2] + tuple(plan['dest_shape'])
+        src_data = src_data.reshape(-1, src_data.shape[-2] * src_data.shape[-1])
+        dest_data = np.empty((src_data.shape[0], np.prod(plan['dest_shape'])), dtype=src_data.dtype)
+        dest_data.fill(fill_value)
+
+        src_index, weights = plan['src_index'], plan['weights']
+        if weights is None:
+            dest_data[:, plan['dest_index']] = src_data[:, src_index[:, 0]]
+        else:
+            value = np.zeros((src_data.shape[0], src_index.shape[0]), dtype=np.float64)
+            for i in range(src_index.shape[1]):
+                value += src_data[:, src_index[:, i]] * weights[:, i]
+            dest_data[:, plan['dest_index']] = value
+        return dest_data.reshape(out_shape)
 
     def prepare_regular_grid_interpolator(self):
         """Prepare aux data for RGI module"""
@@ -150,6 +410,9 @@ class resample:
 
     def run_regular_grid_interpolator(self, src_data, interp_method='nearest', fill_value=np.nan, print_msg=True):
         """Interpolate 2D matrix"""
+        if not self.geometry_prepared:
+            self.prepare_geometry()
+
         # prepare interpolation function
         rgi_func = RGI(self.src_pts,
                        src_data,
@@ -423,6 +686,9 @@ class resample:
                                                      interp_method=inps.interpMethod,
                                                      fill_value=np.fillValue, nprocs=4)
         """
+        if not self.geometry_prepared:
+            self.prepare_geometry()
+
         if not radius:
             # geo2radar
             if 'Y_FIRST' in self.src_metadata.keys():
@@ -11,9 +11,11 @@
 import os
 import sys
 import time
+import itertools
 import datetime as dt
 import h5py
 import numpy as np
+from scipy.sparse import csr_matrix
 
 
 BOOL_ZERO = np.bool_(0)
@@ -127,6 +129,269 @@ datasetUnitDict = {'unwrapPhase'        :'radian',
 
 
 
+################################ memory map begin ######################################
+def get_dataset_memmap(ds):
+    """Get the read-only memory map of an HDF5 dataset for zero-copy access.
+    Only uncompressed dataset with contiguous layout in the file can be mapped,
+    e.g. created with chunks=None and compression=None.
+    Parameters: ds   - h5py.Dataset object
+    Returns:    data - np.memmap in the same shape and data type as ds,
+                       or None if the dataset can not be mapped.
+    """
+    if ds.chunks is not None or ds.compression is not None:
+        return None
+
+    # offset is None if the storage is not allocated yet
+    offset = ds.id.get_offset()
+    if offset is None:
+        return None
+    return np.memmap(ds.file.filename, dtype=ds.dtype, mode='r', offset=offset, shape=ds.shape)
+
+
+def read_chunked_memmap(ds, index):
+    """Read a box of an uncompressed chunked HDF5 dataset via memory maps of its chunks.
+    Each chunk of an unfiltered dataset is stored as raw bytes at its own offset in the file,
+    thus the chunks overlapping with the box are mapped and copied into the output array,
+    without going through the HDF5 chunk cache.
+    Parameters: ds    - h5py.Dataset object, chunked without any filter
+                index - tuple of slice objects with step of 1, one per dimension
+    Returns:    data  - np.ndarray in the shape of the box,
+                        or None if the dataset can not be read in this way.
+    """
+    if ds.chunks is None or ds.id.get_create_plist().get_nfilters() > 0:
+        return None
+
+    start = [i.indices(n)[0] for i, n in zip(index, ds.shape)]
+    stop  = [max(i.indices(n)[1], s) for i, n, s in zip(index, ds.shape, start)]
+    data = np.empty([e - s for s, e in zip(start, stop)], dtype=ds.dtype)
+    if data.size == 0:
+        return data
+    fill_value = ds.fillvalue
+
+    # loop over the chunks overlapping with the box
+    chunk_ranges = [range(s // c * c, e, c) for s, e, c in zip(start, stop, ds.chunks)]
+    for coord in itertools.product(*chunk_ranges):
+        # overlap in the dataset coordinates
+        s0 = [max(s, c) for s, c in zip(start, coord)]
+        s1 = [min(e, c + n) for e, c, n in zip(stop, coord, ds.chunks)]
+        out_index = tuple(slice(i - s, j - s) for i, j, s in zip(s0, s1, start))
+
+        info = ds.id.get_chunk_info_by_coord(coord)
+        if info.byte_offset is None:
+            # chunk not allocated yet
+            data[out_index] = fill_value
+            continue
+        chunk = np.memmap(ds.file.filename, dtype=ds.dtype, mode='r',
+                          offset=info.byte_offset, shape=ds.chunks)
+        data[out_index] = chunk[tuple(slice(i - c, j - c) for i, j, c in zip(s0, s1, coord))]
+        del chunk
+    return data
+
+
+def read_dataset_memmap(ds, dateFlag, box):
+    """Read a 3D HDF5 dataset via memory map, for both contiguous and chunked layout.
+    Parameters: ds       - h5py.Dataset object in 3D
+                dateFlag - 1D np.ndarray in bool, flag of the 1st dimension to read
+                box      - tuple of 4 int, area of interest in (x0, y0, x1, y1)
+    Returns:    data     - np.memmap view (contiguous layout) or np.ndarray (chunked layout),
+                           or None if the dataset is compressed.
+    """
+    # contiguous layout: a view of the whole dataset
+    data = get_dataset_memmap(ds)
+    if data is not None:
+        index = flag2index(dateFlag)
+        data = data[index, box[1]:box[3], box[0]:box[2]]
+        # fancy indexing returns a copy, which is not a valid np.memmap any more;
+        # np.memmap can not be squeezed into 0D array, i.e. for a single value
+        if not isinstance(index, slice) or data.size == 1:
+            data = np.array(data)
+        return data
+
+    # chunked layout: read the bounding box of the selected dates, then select
+    idx = np.where(dateFlag)[0]
+    if idx.size == 0:
+        return None
+    index = (slice(idx[0], idx[-1]+1), slice(box[1], box[3]), slice(box[0], box[2]))
+    data = read_chunked_memmap(ds, index)
+    if data is not None and idx.size != idx[-1] - idx[0] + 1:
+        data = data[idx - idx[0]]
+    return data
+
+
+def flag2index(flag):
+    """Convert 1D bool array into slice object if the True values are continuous, to keep views of memmap,
+    or into array of index otherwise."""
+    idx = np.where(flag)[0]
+    if idx.size > 0 and idx[-1] - idx[0] + 1 == idx.size:
+        return slice(idx[0], idx[-1]+1)
+    return idx
+
+
+################################ chunk layout begin ####################################
+# chunk shape of 3D dataset in (num_date/ifgram, length, width), with None for the full size
+CHUNK_SHAPE_PRESETS = {
+    'pixel'    : (None, 128, 128),   # fast for pixel-wise access, e.g. box-wise inversion, point time-series
+    'slice'    : (1, 512, 512),      # fast for slice-wise access, e.g. view.py, network modification
+    'balanced' : (32, 64, 64),
+}
+
+
+def get_chunk_shape(ds_shape, chunks=None):
+    """Get the chunk shape of an HDF5 dataset from the chunk policy.
+    Parameters: ds_shape - tuple of int, shape of the dataset
+                chunks   - str / tuple of int, chunk policy, e.g.:
+                           None / True / False / 'auto' - auto-chunking by h5py
+                           pixel / slice / balanced     - presets in CHUNK_SHAPE_PRESETS
+                           (None, 128, 128) or '(num_ifgram, 128, 128)', with None or
+                           non-integer string for the full size along that axis
+    Returns:    chunks   - tuple of int, or True for auto-chunking by h5py
+    Example:    get_chunk_shape((100, 2000, 3000), 'pixel')        -> (100, 128, 128)
+                get_chunk_shape((2000, 3000), '(num_date, 64, 64)')  -> (64, 64)
+    """
+    if chunks in [None, True, False] or len(ds_shape) < 2:
+        return True
+
+    if isinstance(chunks, str):
+        chunks = chunks.strip()
+        if chunks.lower() in ['auto', 'no', 'none', 'true', 'false']:
+            return True
+        elif chunks.lower() in CHUNK_SHAPE_PRESETS.keys():
+            chunks = CHUNK_SHAPE_PRESETS[chunks.lower()]
+        else:
+            chunks = [int(i) if i.strip().isdigit() else None
+                      for i in chunks.strip('()[]').split(',')]
+
+    # use the last 2 or 3 dimensions for 2D or 3D dataset
+    chunks = list(chunks)[-len(ds_shape):]
+    if len(chunks) != len(ds_shape):
+        raise ValueError('chunk shape {} does not match the dataset shape {}'.format(chunks, ds_shape))
+    chunks = tuple(max(1, min(c, s) if c else s) for c, s in zip(chunks, ds_shape))
+    return chunks
+
+
+################################ compression begin #####################################
+# blosc filter with byte-shuffle via the HDF5 filter plugin, which is optional.
+# Importing hdf5plugin registers the filters, for both writing and reading.
+try:
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+BLOSC_FILTER_ID = 32001
+BLOSC_COMPRESSORS = ['blosclz', 'lz4', 'lz4hc', 'snappy', 'zlib', 'zstd']   # in the order of compcode
+COMPRESSION_NAMES = ['lzf', 'gzip', 'blosc', 'zstd'] + ['blosc:{}'.format(i) for i in BLOSC_COMPRESSORS]
+
+
+def get_compression_kwargs(compression):
+    """Get the keyword arguments of h5py create_dataset() for the compression.
+    Parameters: compression - str, None / no, lzf, gzip, or via hdf5plugin (optional):
+                              blosc         - blosc:lz4  with byte-shuffle, fast
+                              zstd          - blosc:zstd with byte-shuffle, better ratio
+                              blosc:<cname> - with cname in BLOSC_COMPRESSORS
+    Returns:    kwargs      - dict, with compression and compression_opts
+    Example:    f.create_dataset('timeseries', data=data, chunks=True, **get_compression_kwargs('zstd'))
+    """
+    if compression in [None, False] or str(compression).lower() in ['no', 'none', 'false']:
+        return {'compression': None}
+
+    compression = str(compression).lower()
+    if compression in ['lzf', 'gzip']:
+        return {'compression': compression}
+
+    if compression == 'zstd':
+        compression = 'blosc:zstd'
+    if compression.startswith('blosc'):
+        cname = compression.split(':')[1] if ':' in compression else 'lz4'
+        if cname not in BLOSC_COMPRESSORS:
+            raise ValueError('un-supported blosc compressor: {}, available: {}'.format(cname, BLOSC_COMPRESSORS))
+        if hdf5plugin is None:
+            raise ImportError('Can not import hdf5plugin, which is required for compression = {}!'.format(compression))
+        return dict(hdf5plugin.Blosc(cname=cname, clevel=5, shuffle=hdf5plugin.Blosc.SHUFFLE))
+
+    raise ValueError('un-recognized compression: {}, available: {}'.format(compression, COMPRESSION_NAMES))
+
+
+def get_dataset_compression(ds):
+    """Get the compression of an HDF5 dataset, in the format of get_compression_kwargs() input.
+    Parameters: ds          - h5py.Dataset object
+    Returns:    compression - str, e.g. lzf, gzip, blosc:zstd, or None
+    """
+    if ds.compression is not None:
+        return ds.compression
+
+    # filters from plugin
+    plist = ds.id.get_create_plist()
+    for i in range(plist.get_nfilters()):
+        code, flags, values = plist.get_filter(i)[:3]
+        if code == BLOSC_FILTER_ID:
+            if len(values) > 6 and values[6] < len(BLOSC_COMPRESSORS):
+                return 'blosc:{}'.format(BLOSC_COMPRESSORS[values[6]])
+            return 'blosc'
+    return None
+
+
+def get_dataset_compression_kwargs(ds):
+    """Get the keyword arguments of h5py create_dataset() to write a copy of an HDF5 dataset
+    with the same compression, including the compression level and the filters from plugin.
+    Parameters: ds     - h5py.Dataset object
+    Returns:    kwargs - dict, with compression and compression_opts
+    Example:    fo.create_dataset(ds.name, data=ds[()], chunks=ds.chunks, **get_dataset_compression_kwargs(ds))
+    """
+    if ds.compression is not None:
+        return {'compression': ds.compression, 'compression_opts': ds.compression_opts}
+    return get_compression_kwargs(get_dataset_compression(ds))
+
+
+################################ quantization begin ####################################
+# scale/offset quantized storage in CF convention: value = stored * scale_factor + add_offset,
+# with _FillValue for NaN. Dataset name : (stored data type, attributes)
+QUANTIZE_DATASET_DICT = {
+    # values in [0, 1] with max error of 0.002
+    'coherence' : (np.uint8, {'scale_factor': 1./254, 'add_offset': 0., '_FillValue': 255}),
+}
+
+
+def quantize_data(data, dtype, attrs):
+    """Encode float data into integers with scale_factor / add_offset / _FillValue.
+    Parameters: data  - np.ndarray, in float
+                dtype - numpy integer data type, e.g. np.uint8
+                attrs - dict, with scale_factor, add_offset (optional) and _FillValue (optional)
+    Returns:    data  - np.ndarray, in dtype
+    """
+    fill_value = attrs.get('_FillValue', None)
+    info = np.iinfo(dtype)
+    vmin, vmax = info.min, info.max
+    if fill_value is not None:
+        if fill_value == vmax:
+            vmax -= 1
+        elif fill_value == vmin:
+            vmin += 1
+
+    data = np.array(data, dtype=np.float32)
+    out = np.round((data - attrs.get('add_offset', 0.)) / attrs['scale_factor'])
+    out = np.clip(out, vmin, vmax)
+    nan_flag = np.isnan(out)
+    out[nan_flag] = fill_value if fill_value is not None else 0
+    return out.astype(dtype)
+
+
+def dequantize_data(data, attrs):
+    """Decode the quantized data back into float32 based on the dataset attributes.
+    Parameters: data  - np.ndarray, data as stored in the HDF5 file
+                attrs - dict / h5py.AttributeManager, dataset attributes
+    Returns:    data  - np.ndarray, in float32 if quantized, or as it is otherwise
+    """
+    if 'scale_factor' not in attrs.keys():
+        return data
+
+    out = np.array(data, dtype=np.float32) * np.float32(attrs['scale_factor'])
+    out += np.float32(attrs.get('add_offset', 0.))
+    fill_value = attrs.get('_FillValue', None)
+    if fill_value is not None:
+        out[data == fill_value] = np.nan
+    return out
+
+
 ################################ timeseries class begin ################################
 FILE_STRUCTURE_TIMESERIES = """
 /                Root level
@@ -212,11 +477,14 @@ class timeseries:
             self.dateList = [i.decode('utf8') for i in f['date'][:]]
         return self.dateList
 
-    def read(self, datasetName=None, box=None, squeeze=True, print_msg=True):
+    def read(self, datasetName=None, box=None, squeeze=True, print_msg=True, mmap=False):
         """Read dataset from timeseries file
         Parameters: self : timeseries object
                     datasetName : (list of) string in YYYYMMDD format
                     box : tuple of 4 int, indicating x0,y0,x1,y1 of range
+                    mmap : bool, read via memory map for uncompressed dataset, read normally otherwise:
+                        return read-only np.memmap view for contiguous layout, or
+                        copy the box from the memory maps of the overlapping chunks for chunked layout.
         Returns:    data : 2D or 3D dataset
         Examples:   from mintpy.objects import timeseries
                     tsobj = timeseries('timeseries_ERA5_demErr.h5')
@@ -224,6 +492,7 @@ class timeseries:
                     data = tsobj.read(datasetName='20161020', box=(100,300,500,800))
                     data = tsobj.read(datasetName=['20161020','20161026','20161101'])
                     data = tsobj.read(box=(100,300,500,800))
+                    data = tsobj.read(box=(100,300,101,301), mmap=True)
         """
         if print_msg:
             print('reading {} data from file: {} ...'.format(self.name, self.file))
@@ -253,40 +522,30 @@ class timeseries:
             if box is None:
                 box = [0, 0, self.width, self.length]
 
-            data = ds[dateFlag, box[1]:box[3], box[0]:box[2]]
+            data = read_dataset_memmap(ds, dateFlag, box) if mmap else None
+            if data is None:
+                if mmap and print_msg:
+                    print('dataset is compressed, can not be memory mapped, read into memory instead.')
+                data = ds[dateFlag, box[1]:box[3], box[0]:box[2]]
             if squeeze:
                 data = np.squeeze(data)
         return data
 
-    def layout_hdf5(self, dsNameDict, metadata, compression=None):
-        print('-'*50)
-        print('create HDF5 file {} with w mode'.format(self.file))
-        f = h5py.File(self.file, "w")
-
-        for key in dsNameDict.keys():
-            print("create dataset: {d:<25} of {t:<25} in size of {s}".format(
-                d=key,
-                t=str(dsNameDict[key][0]),
-                s=dsNameDict[key][1]))
-
-            f.create_dataset(key,
-                             shape=dsNameDict[key][1],
-                             dtype=dsNameDict[key][0],
-                             chunks=True,
-                             compression=compression)
-
-        # write attributes
+    def layout_hdf5(self, dsNameDict, metadata, compression=None, chunks=None):
+        """Create HDF5 file with (empty) dataset structure, via writefile.layout_hdf5().
+        Parameters: dsNameDict : dict, with key = datasetName and value = (dtype, shape) or (dtype, shape, data)
+                    metadata : dict
+                    compression : str, compression while writing to HDF5 file
+                    chunks : str / tuple of int, chunk policy, default: CHUNK_SHAPE in metadata or auto
+        Returns: self.file
+        """
+        from mintpy.utils import writefile
         metadata = dict(metadata)
         metadata['FILE_TYPE'] = self.name
-        for key in metadata.keys():
-            f.attrs[key] = metadata[key]
-
-        print('close HDF5 file {}'.format(self.file))
-        f.close()
-        return self.file
+        return writefile.layout_hdf5(self.file, dsNameDict, metadata, compression=compression, chunks=chunks)
 
     def write2hdf5_block(self, data, datasetName, block=None, mode='a'):
-        """Write data to existing HDF5 dataset in disk block by block.
+        """Write data to existing HDF5 dataset in disk block by block, via writefile.write_hdf5_block().
         Parameters: data : np.ndarray 1/2/3D matrix
                     datasetName : str, dataset name
                     block : list of 2/4/6 int, for
@@ -296,44 +555,11 @@ class timeseries:
                     mode : str, open mode
         Returns: self.file
         """
-        if block is None:
-            # data shape
-            if isinstance(data, list):
-                shape=(len(data),)
-            else:
-                shape = data.shape
-
-            if len(shape) ==1:
-                block = [0, shape[0]]
-            elif len(shape) == 2:
-                block = [0, shape[0],
-                         0, shape[1]]
-            elif len(shape) == 3:
-                block = [0, shape[0],
-                         0, shape[1],
-                         0, shape[2]]
-
-        print('open HDF5 file {} in {} mode'.format(self.file, mode))
-        f = h5py.File(self.file, mode)
-
-        print("writing dataset /{:<25} block: {}".format(datasetName, block))
-        if len(block) == 6:
-            f[datasetName][block[0]:block[1],
-                           block[2]:block[3],
-                           block[4]:block[5]] = data
-
-        elif len(block) == 4:
-            f[datasetName][block[0]:block[1],
-                           block[2]:block[3]] = data
-
-        elif len(block) == 2:
-            f[datasetName][block[0]:block[1]] = data
+        from mintpy.utils import writefile
+        return writefile.write_hdf5_block(self.file, data, datasetName, block=block, mode=mode)
 
-        f.close()
-        print('close HDF5 file {}.'.format(self.file))
-        return self.file
-
-    def write2hdf5(self, data, outFile=None, dates=None, bperp=None, metadata=None, refFile=None, compression=None):
+    def write2hdf5(self, data, outFile=None, dates=None, bperp=None, metadata=None, refFile=None, compression=None,
+                   chunks=None):
         """
         Parameters: data  : 3D array of float32
                     dates : 1D array/list of string in YYYYMMDD format
@@ -342,6 +568,7 @@ class timeseries:
                     outFile : string
                     refFile : string
                     compression : string or None
+                    chunks : string or tuple of int, chunk policy, default: CHUNK_SHAPE in metadata or auto
         Returns: outFile : string
         Examples:
             from mintpy.objects import timeseries
@@ -368,7 +595,7 @@ class timeseries:
             # get ref file compression type if input compression is None
             if compression is None:
                 with h5py.File(refFile, 'r') as rf:
-                    compression = rf[timeseriesDatasetNames[0]].compression
+                    compression = get_dataset_compression(rf[timeseriesDatasetNames[0]])
             refobj.close(print_msg=False)
         data = np.array(data, dtype=np.float32)
         dates = np.array(dates, dtype=np.string_)
@@ -385,11 +612,15 @@ class timeseries:
         # 3D dataset - timeseries
         print('create timeseries HDF5 file: {} with w mode'.format(outFile))
         f = h5py.File(outFile, 'w')
+        if chunks is None:
+            chunks = metadata.get('CHUNK_SHAPE', None)
+        chunks = get_chunk_shape(data.shape, chunks)
         print(('create dataset /timeseries of {t:<10} in size of {s} '
-               'with compression={c}').format(t=str(data.dtype),
-                                              s=data.shape,
-                                              c=compression))
-        f.create_dataset('timeseries', data=data, chunks=True, compression=compression)
+               'with compression={c}, chunks={k}').format(t=str(data.dtype),
+                                                          s=data.shape,
+                                                          c=compression,
+                                                          k=chunks))
+        f.create_dataset('timeseries', data=data, chunks=chunks, **get_compression_kwargs(compression))
 
         # 1D dataset - date / bperp
         print('create dataset /dates      of {:<10} in size of {}'.format(str(dates.dtype), dates.shape))
@@ -762,7 +993,7 @@ class ifgramStack:
         self.mTimes = np.array([dt.datetime(*time.strptime(i, "%Y%m%d")[0:5]) for i in self.mDates])
         self.sTimes = np.array([dt.datetime(*time.strptime(i, "%Y%m%d")[0:5]) for i in self.sDates])
 
-    def read(self, datasetName='unwrapPhase', box=None, print_msg=True, dropIfgram=False):
+    def read(self, datasetName='unwrapPhase', box=None, print_msg=True, dropIfgram=False, mmap=False):
         """Read 3D dataset with bounding box in space
         Parameters: datasetName : string, to point to specific 2D dataset, e.g.:
                         unwrapPhase
@@ -778,6 +1009,10 @@ class ifgramStack:
                          ...]
                     box : tuple of 4 int, for (x0,y0,x1,y1)
                     print_msg : bool
+                    dropIfgram : bool, read the kept interferograms only
+                    mmap : bool, read via memory map for uncompressed dataset, read normally otherwise:
+                        return read-only np.memmap view for contiguous layout, or
+                        copy the box from the memory maps of the overlapping chunks for chunked layout.
         Returns: data : 2D or 3D array
         Example:
             obj = ifgramStack('./inputs/ifgramStack.h5')
@@ -786,6 +1021,7 @@ class ifgramStack:
             obj.read(datasetName='unwrapPhase-20161020_20161026')
             obj.read(datasetName=['unwrapPhase-20161020_20161026',
                                   'unwrapPhase-20161020_20161101'])
+            obj.read(datasetName='coherence', box=(100,300,101,301), mmap=True)
         """
         self.get_size(dropIfgram=False)
         date12List = self.get_date12_list(dropIfgram=False)
@@ -818,8 +1054,15 @@ class ifgramStack:
             if box is None:
                 box = (0, 0, self.width, self.length)
 
-            data = ds[dateFlag, box[1]:box[3], box[0]:box[2]]
+            data = read_dataset_memmap(ds, dateFlag, box) if mmap else None
+            if data is None:
+                if mmap and print_msg:
+                    print('dataset is compressed, can not be memory mapped, read into memory instead.')
+                data = ds[dateFlag, box[1]:box[3], box[0]:box[2]]
             data = np.squeeze(data)
+
+            # decode quantized data, e.g. coherence in uint8
+            data = dequantize_data(data, ds.attrs)
         return data
 
     def spatial_average(self, datasetName='coherence', maskFile=None, box=None, useMedian=False):
@@ -845,7 +1088,7 @@ class ifgramStack:
             numIfgram = dset.shape[0]
             dmean = np.zeros((numIfgram), dtype=np.float32)
             for i in range(numIfgram):
-                data = dset[i, box[1]:box[3], box[0]:box[2]]
+                data = dequantize_data(dset[i, box[1]:box[3], box[0]:box[2]], dset.attrs)
                 if maskFile:
                     data[mask == 0] = np.nan
 
@@ -933,7 +1176,7 @@ class ifgramStack:
             num2read = np.sum(dropIfgramFlag)
             idx2read = np.where(dropIfgramFlag)[0]
             for i in range(num2read):  # Loop to save memory usage
-                data = dset[idx2read[i], :, :]
+                data = dequantize_data(dset[idx2read[i], :, :], dset.attrs)
                 mask[data == 0.] = 0
                 mask[np.isnan(data)] = 0
                 sys.stdout.write('\rreading interferogram {}/{} ...'.format(i+1, num2read))
@@ -965,7 +1208,7 @@ class ifgramStack:
             idx2read = np.where(drop_ifgram_flag)[0]
             for i in range(num2read):
                 idx = idx2read[i]
-                data = dset[idx, :, :]
+                data = dequantize_data(dset[idx, :, :], dset.attrs)
                 if 'unwrapPhase' in datasetName:
                     if self.refY:
                         try:
@@ -991,10 +1234,12 @@ class ifgramStack:
 
     # Functions for Unwrap error correction
     @staticmethod
-    def get_design_matrix4triplet(date12_list):
+    def get_design_matrix4triplet(date12_list, sparse=False):
         """Generate the design matrix of ifgram triangle for unwrap error correction using phase closure
         Parameters: date12_list : list of string in YYYYMMDD_YYYYMMDD format
-        Returns:    C : 2D np.array in size of (num_tri, num_ifgram) consisting 0, 1, -1
+                    sparse      : bool, return scipy.sparse.csr_matrix instead of np.ndarray
+        Returns:    C : 2D np.array / scipy.sparse.csr_matrix in np.float32
+                        in size of (num_tri, num_ifgram) consisting 0, 1, -1
                         for 3 SAR acquisition in t1, t2 and t3 in time order,
                         ifg1 for (t1, t2) with 1
                         ifg2 for (t1, t3) with -1
@@ -1002,46 +1247,41 @@ class ifgramStack:
         Examples:   obj = ifgramStack('./inputs/ifgramStack.h5')
                     date12_list = obj.get_date12_list(dropIfgram=True)
                     C = ifgramStack.get_design_matrix4triplet(date12_list)
+                    C = ifgramStack.get_design_matrix4triplet(date12_list, sparse=True)
         """
         # Date info
         date12_list = list(date12_list)
+        num_ifgram = len(date12_list)
+
+        # adjacency: {date1: {date2: index of ifgram (date1, date2)}}
+        # with the 1st one for duplicated ifgrams
+        date12_idx = {}
+        for i in reversed(range(num_ifgram)):
+            date1, date2 = date12_list[i].split('_')
+            date12_idx.setdefault(date1, {})[date2] = i
 
-        # calculate triangle_idx
+        # calculate triangle_idx, for ifgram1 (date1, date2), ifgram2 (date1, date3) and ifgram3 (date2, date3)
         triangle_idx = []
-        for ifgram1 in date12_list:
-            # ifgram1 (date1, date2)
-            date1, date2 = ifgram1.split('_')
-
-            # ifgram2 candidates (date1, date3)
-            date3_list = []
-            for ifgram2 in date12_list:
-                if date1 == ifgram2.split('_')[0] and ifgram2 != ifgram1:
-                    date3_list.append(ifgram2.split('_')[1])
-
-            # ifgram2/3
-            if len(date3_list) > 0:
-                for date3 in date3_list:
-                    ifgram3 = '{}_{}'.format(date2, date3)
-                    if ifgram3 in date12_list:
-                        ifgram1 = '{}_{}'.format(date1, date2)
-                        ifgram2 = '{}_{}'.format(date1, date3)
-                        ifgram3 = '{}_{}'.format(date2, date3)
-                        triangle_idx.append([date12_list.index(ifgram1),
-                                             date12_list.index(ifgram2),
-                                             date12_list.index(ifgram3)])
+        for date1, date2_idx in date12_idx.items():
+            for date2, idx1 in date2_idx.items():
+                date3_idx = date12_idx.get(date2, {})
+                for date3 in date2_idx.keys() & date3_idx.keys():
+                    if date3 != date2:
+                        triangle_idx.append([idx1, date2_idx[date3], date3_idx[date3]])
         if len(triangle_idx) == 0:
             raise ValueError("No triangles found!")
 
-        triangle_idx = np.array(triangle_idx, np.int16)
+        triangle_idx = np.array(triangle_idx, np.int64)
         triangle_idx = np.unique(triangle_idx, axis=0)
 
         # triangle_idx to C
         num_triangle = triangle_idx.shape[0]
-        C = np.zeros((num_triangle, len(date12_list)), np.float32)
-        for i in range(num_triangle):
-            C[i, triangle_idx[i, 0]] = 1
-            C[i, triangle_idx[i, 1]] = -1
-            C[i, triangle_idx[i, 2]] = 1
+        C = csr_matrix((np.tile(np.array([1, -1, 1], np.float32), num_triangle),
+                        triangle_idx.flatten(),
+                        np.arange(0, num_triangle * 3 + 1, 3)),
+                       shape=(num_triangle, num_ifgram))
+        if not sparse:
+            C = C.toarray()
         return C
 
 
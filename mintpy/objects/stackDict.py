@@ -13,6 +13,8 @@
 import os
 import time
 import warnings
+import collections
+import concurrent.futures
 import h5py
 import numpy as np
 
@@ -23,7 +25,11 @@ except ImportError:
 
 from mintpy.objects import (dataTypeDict,
                             geometryDatasetNames,
-                            ifgramDatasetNames)
+                            ifgramDatasetNames,
+                            get_chunk_shape,
+                            get_compression_kwargs,
+                            quantize_data,
+                            QUANTIZE_DATASET_DICT)
 from mintpy.utils import readfile, ptime, utils0 as ut
 
 
@@ -35,6 +41,22 @@ CPX_ZERO = np.complex64(0.0)
 dataType = np.float32
 
 
+def encode_slice(data, dtype, attrs):
+    """Encode one slice read from the input file into the data type of the HDF5 dataset.
+    Parameters: data  - 2D np.ndarray, data as read from the input file
+                dtype - numpy data type of the HDF5 dataset
+                attrs - dict / h5py.AttributeManager, attributes of the HDF5 dataset
+    Returns:    data  - 2D np.ndarray, quantized with scale_factor if in attrs,
+                        or in uint8 for byte data, e.g. connectComponent from SNAPHU
+    """
+    if 'scale_factor' in attrs.keys():
+        data = quantize_data(data, dtype, attrs)
+    elif dtype == np.uint8:
+        # re-interpret the bytes without clipping, as labels in int8 are reported for ISCE products
+        data = np.asarray(data).astype(np.uint8)
+    return data
+
+
 ########################################################################################
 class ifgramStackDict:
     '''
@@ -50,6 +72,8 @@ class ifgramStackDict:
                      }
         stackObj = ifgramStackDict(pairsDict=pairsDict)
         stackObj.write2hdf5(outputFile='ifgramStack.h5', box=(200,500,300,600))
+        # add new pairs into an existing file
+        stackObj.append2hdf5(outputFile='ifgramStack.h5', box=(200,500,300,600))
     '''
 
     def __init__(self, name='ifgramStack', pairsDict=None, dsName0=ifgramDatasetNames[0]):
@@ -90,7 +114,39 @@ class ifgramStackDict:
             dsDataType = dataTypeDict[metadata['DATA_TYPE'].lower()]
         return dsDataType
 
-    def write2hdf5(self, outputFile='ifgramStack.h5', access_mode='w', box=None, compression=None, extra_metadata=None):
+    def read_data_pipeline(self, dsName, box=None, num_workers=1, max_in_flight=None):
+        """Read dataset of all pairs with a pool of reader threads, in the order of self.pairs.
+        Parameters: dsName        : str, dataset name, e.g. unwrapPhase, coherence
+                    box           : tuple, subset range in (x0, y0, x1, y1)
+                    num_workers   : int, number of reader threads
+                    max_in_flight : int, max number of pairs read but not yet consumed, to bound memory usage,
+                                    default: 2 * num_workers
+        Returns:    generator of 2D np.ndarray, data of each pair
+        """
+        num_workers = max(int(num_workers), 1)
+        if not max_in_flight:
+            max_in_flight = 2 * num_workers
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = collections.deque()
+            i_next = 0
+            for i in range(len(self.pairs)):
+                # keep up to max_in_flight pairs being read in the background
+                while i_next < len(self.pairs) and len(futures) < max_in_flight:
+                    ifgramObj = self.pairsDict[self.pairs[i_next]]
+                    futures.append(executor.submit(ifgramObj.read, dsName, box))
+                    i_next += 1
+                yield futures.popleft().result()[0]
+
+    def get_perp_baseline(self, num_workers=1):
+        """Get the perpendicular baseline of all pairs, in the order of self.pairs."""
+        ifgramObjs = [self.pairsDict[pair] for pair in self.pairs]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(int(num_workers), 1)) as executor:
+            bperp = list(executor.map(lambda obj: obj.get_perp_baseline(family=self.dsName0), ifgramObjs))
+        return np.array(bperp)
+
+    def write2hdf5(self, outputFile='ifgramStack.h5', access_mode='w', box=None, compression=None, extra_metadata=None,
+                   num_workers=1, chunks=None, quantize=False):
         '''Save/write an ifgramStackDict object into an HDF5 file with the structure below:
 
         /                  Root level
@@ -99,8 +155,8 @@ class ifgramStackDict:
         /bperp             1D array of float32 in size of (m,     ) in meter.
         /dropIfgram        1D array of bool    in size of (m,     ) True by default for keeping interferogram.
         /unwrapPhase       3D array of float32 in size of (m, l, w) in radian.
-        /coherence         3D array of float32 in size of (m, l, w).
-        /connectComponent  3D array of int16   in size of (m, l, w).           (optional)
+        /coherence         3D array of float32 in size of (m, l, w).           (uint8 if quantize)
+        /connectComponent  3D array of int16   in size of (m, l, w).           (optional, uint8 if quantize)
         /wrapPhase         3D array of float32 in size of (m, l, w) in radian. (optional)
         /iono              3D array of float32 in size of (m, l, w) in radian. (optional)
         /rangeOffset       3D array of float32 in size of (m, l, w).           (optional)
@@ -110,6 +166,12 @@ class ifgramStackDict:
                     access_mode : str, access mode of output File, e.g. w, r+
                     box : tuple, subset range in (x0, y0, x1, y1)
                     extra_metadata : dict, extra metadata to be added into output file
+                    num_workers : int, number of threads to read the input files, while writing to the HDF5 file
+                    chunks : str / tuple of int, chunk policy of 3D datasets, e.g. pixel, slice, balanced,
+                             (None, 128, 128), default: CHUNK_SHAPE in extra_metadata or auto-chunking by h5py
+                    quantize : bool, store coherence in uint8 with scale_factor attributes (max error of 0.002),
+                               and connectComponent in uint8 if the input files are in byte.
+                               Decoded into float32 while reading via ifgramStack.read() / readfile.read().
         Returns:    outputFile
         '''
 
@@ -123,36 +185,51 @@ class ifgramStackDict:
         maxDigit = max([len(i) for i in self.dsNames])
         self.get_size(box)
 
-        self.bperp = np.zeros(self.numIfgram)
+        if chunks is None and extra_metadata:
+            chunks = extra_metadata.get('CHUNK_SHAPE', None)
+
+        print('read perpendicular baseline of all pairs with {} threads'.format(num_workers))
+        self.bperp = self.get_perp_baseline(num_workers=num_workers)
         ###############################
         # 3D datasets containing unwrapPhase, coherence, connectComponent, wrapPhase, etc.
         for dsName in self.dsNames:
             dsShape = (self.numIfgram, self.length, self.width)
             dsDataType = dataType
             dsCompression = compression
+            dsAttrs = {}
             if dsName in ['connectComponent']:
                 dsDataType = np.int16
                 dsCompression = 'lzf'
+                # labels from SNAPHU in byte, which is reported as int8 for ISCE products
+                if quantize:
+                    dsFile = self.pairsDict[self.pairs[0]].datasetDict[dsName]
+                    if readfile.read_attribute(dsFile).get('DATA_TYPE', '').lower() in ['byte', 'int8', 'uint8']:
+                        dsDataType = np.uint8
+
+            elif quantize and dsName in QUANTIZE_DATASET_DICT.keys():
+                dsDataType, dsAttrs = QUANTIZE_DATASET_DICT[dsName]
 
+            dsChunks = get_chunk_shape(dsShape, chunks)
             print(('create dataset /{d:<{w}} of {t:<25} in size of {s}'
-                   ' with compression = {c}').format(d=dsName,
-                                                     w=maxDigit,
-                                                     t=str(dsDataType),
-                                                     s=dsShape,
-                                                     c=dsCompression))
+                   ' with compression = {c}, chunks = {k}').format(d=dsName,
+                                                                   w=maxDigit,
+                                                                   t=str(dsDataType),
+                                                                   s=dsShape,
+                                                                   c=dsCompression,
+                                                                   k=dsChunks))
             ds = f.create_dataset(dsName,
                                   shape=dsShape,
                                   maxshape=(None, dsShape[1], dsShape[2]),
                                   dtype=dsDataType,
-                                  chunks=True,
-                                  compression=dsCompression)
+                                  chunks=dsChunks,
+                                  **get_compression_kwargs(dsCompression))
+            for key, value in dsAttrs.items():
+                ds.attrs[key] = value
 
+            # read with multiple threads while writing in the main thread
             prog_bar = ptime.progressBar(maxValue=self.numIfgram)
-            for i in range(self.numIfgram):
-                ifgramObj = self.pairsDict[self.pairs[i]]
-                data = ifgramObj.read(dsName, box=box)[0]
-                ds[i, :, :] = data
-                self.bperp[i] = ifgramObj.get_perp_baseline(family=self.dsName0)
+            for i, data in enumerate(self.read_data_pipeline(dsName, box=box, num_workers=num_workers)):
+                ds[i, :, :] = encode_slice(data, dsDataType, dsAttrs)
                 prog_bar.update(i+1, suffix='{}_{}'.format(self.pairs[i][0],
                                                            self.pairs[i][1]))
             prog_bar.close()
@@ -209,6 +286,106 @@ class ifgramStackDict:
         print('Finished writing to {}'.format(self.outputFile))
         return self.outputFile
 
+    def append2hdf5(self, outputFile='ifgramStack.h5', box=None, num_workers=1, drop_extra_dataset=False):
+        '''Append pairs not yet in an existing ifgramStack HDF5 file, without re-reading the existing ones.
+
+        The 3D datasets are resized along the 1st dimension and only the slices of the new pairs are read;
+        all pairs are kept in the sorted order as in write2hdf5(), thus existing slices after the first new
+        pair are moved backward in the file to make room for the new ones. /date, /bperp and /dropIfgram
+        are re-created in the merged order, while the dropIfgram value of the existing pairs is kept.
+
+        3D datasets in the file but not in the input (e.g. unwrapPhase_bridging from the unwrapping error
+        correction) can not be extended, thus they have to be deleted explicitly via drop_extra_dataset.
+
+        Parameters: outputFile  : str, Name of the existing HDF5 file for the InSAR stack
+                    box         : tuple, subset range in (x0, y0, x1, y1)
+                    num_workers : int, number of threads to read the input files, while writing to the HDF5 file
+                    drop_extra_dataset : bool, delete the 3D datasets not available in the input.
+        Returns:    outputFile
+        '''
+        self.outputFile = outputFile
+        f = h5py.File(self.outputFile, 'r+')
+        print('open HDF5 file {} in r+ mode to append new pairs'.format(self.outputFile))
+
+        # existing and new pairs
+        date12_exist = [tuple(i.decode('utf8') for i in pair) for pair in f['date'][:]]
+        if date12_exist != sorted(date12_exist):
+            f.close()
+            raise ValueError('pairs in file {} are not sorted, can not append to it!'.format(self.outputFile))
+        pairs_new = sorted([pair for pair in self.pairsDict.keys() if pair not in date12_exist])
+        num_exist, num_new = len(date12_exist), len(pairs_new)
+        self.pairs = pairs_new
+        self.dsNames = list(self.pairsDict[sorted(self.pairsDict.keys())[0]].datasetDict.keys())
+        self.dsNames = [i for i in ifgramDatasetNames if i in self.dsNames]
+        self.get_size(box)
+        self.numIfgram = num_exist + num_new
+        print('number of existing pairs: {}, new pairs to append: {}'.format(num_exist, num_new))
+        if num_new == 0:
+            f.close()
+            return self.outputFile
+
+        # 3D datasets that could not be extended with the input
+        dsNames_extra = [i for i in f.keys() if f[i].ndim == 3 and i not in self.dsNames]
+        if dsNames_extra:
+            if not drop_extra_dataset:
+                f.close()
+                msg = 'dataset {} in file {} are not available for the new pairs, '.format(dsNames_extra, self.outputFile)
+                msg += 'use drop_extra_dataset=True to delete them or re-write the whole file instead.'
+                raise ValueError(msg)
+            for dsName in dsNames_extra:
+                print('delete dataset /{} as it is not available for the new pairs'.format(dsName))
+                del f[dsName]
+
+        # index of existing and new pairs in the merged sorted list
+        pairs_all = sorted(date12_exist + pairs_new)
+        pair2index = dict((pair, i) for i, pair in enumerate(pairs_all))
+        idx_exist = np.array([pair2index[pair] for pair in date12_exist], dtype=np.int64)
+        idx_new = np.array([pair2index[pair] for pair in pairs_new], dtype=np.int64)
+        num_move = np.sum(idx_exist != np.arange(num_exist))
+
+        print('read perpendicular baseline of new pairs with {} threads'.format(num_workers))
+        bperp_new = self.get_perp_baseline(num_workers=num_workers)
+
+        ###############################
+        # 3D datasets: resize, move existing slices to their sorted position and write new slices
+        for dsName in self.dsNames:
+            ds = f[dsName]
+            ds.resize(self.numIfgram, axis=0)
+            print('insert {} slices to dataset /{} in size of {}, move {} existing slices'.format(
+                num_new, dsName, ds.shape, num_move))
+
+            # move from the last one backward, as the index in the merged list is >= the existing one
+            for i in range(num_exist-1, -1, -1):
+                if idx_exist[i] != i:
+                    ds[idx_exist[i], :, :] = ds[i, :, :]
+
+            prog_bar = ptime.progressBar(maxValue=num_new)
+            for i, data in enumerate(self.read_data_pipeline(dsName, box=box, num_workers=num_workers)):
+                ds[idx_new[i], :, :] = encode_slice(data, ds.dtype, ds.attrs)
+                prog_bar.update(i+1, suffix='{}_{}'.format(self.pairs[i][0],
+                                                           self.pairs[i][1]))
+            prog_bar.close()
+            ds.attrs['MODIFICATION_TIME'] = str(time.time())
+
+        ###############################
+        # 1D/2D datasets: small, thus re-create in the merged order
+        dsDict = {}
+        dsDict['date'] = np.array(pairs_all, dtype=np.string_)
+        dsDict['bperp'] = np.zeros(self.numIfgram, dtype=dataType)
+        dsDict['bperp'][idx_exist] = f['bperp'][:]
+        dsDict['bperp'][idx_new] = bperp_new
+        dsDict['dropIfgram'] = np.ones(self.numIfgram, dtype=np.bool_)
+        dsDict['dropIfgram'][idx_exist] = f['dropIfgram'][:]
+        for dsName, data in dsDict.items():
+            print('extend dataset /{} to size of {}'.format(dsName, data.shape))
+            del f[dsName]
+            f.create_dataset(dsName, data=data)
+        self.pairs = pairs_all
+
+        f.close()
+        print('Finished appending to {}'.format(self.outputFile))
+        return self.outputFile
+
 
 ########################################################################################
 class ifgramDict:
@@ -411,7 +588,8 @@ class geometryDict:
         #self.metadata['PROCESSOR'] = self.processor
         return self.metadata
 
-    def write2hdf5(self, outputFile='geometryRadar.h5', access_mode='w', box=None, compression='lzf', extra_metadata=None):
+    def write2hdf5(self, outputFile='geometryRadar.h5', access_mode='w', box=None, compression='lzf', extra_metadata=None,
+                   chunks=None):
         '''
         /                        Root level
         Attributes               Dictionary for metadata. 'X/Y_FIRST/STEP' attribute for geocoded.
@@ -439,6 +617,9 @@ class geometryDict:
         #group = f.create_group(groupName)
         #print('create group   /{}'.format(groupName))
 
+        if chunks is None and extra_metadata:
+            chunks = extra_metadata.get('CHUNK_SHAPE', None)
+
         maxDigit = max([len(i) for i in geometryDatasetNames])
         length, width = self.get_size(box=box)
         self.length, self.width = self.get_size()
@@ -455,8 +636,8 @@ class geometryDict:
                                       shape=dsShape,
                                       maxshape=(None, dsShape[1], dsShape[2]),
                                       dtype=dsDataType,
-                                      chunks=True,
-                                      compression=compression)
+                                      chunks=get_chunk_shape(dsShape, chunks),
+                                      **get_compression_kwargs(compression))
                 print(('create dataset /{d:<{w}} of {t:<25} in size of {s}'
                        ' with compression = {c}').format(d=dsName,
                                                          w=maxDigit,
@@ -502,8 +683,8 @@ class geometryDict:
                 data = np.array(self.read(family=dsName, box=box)[0], dtype=dsDataType)
                 ds = f.create_dataset(dsName,
                                       data=data,
-                                      chunks=True,
-                                      compression=compression)
+                                      chunks=get_chunk_shape(dsShape, chunks),
+                                      **get_compression_kwargs(compression))
 
         ###############################
         # Generate Dataset if not existed in binary file: incidenceAngle, slantRangeDistance
@@ -529,8 +710,8 @@ class geometryDict:
                 ds = f.create_dataset(dsName,
                                       data=data,
                                       dtype=dataType,
-                                      chunks=True,
-                                      compression=compression)
+                                      chunks=get_chunk_shape(dsShape, chunks),
+                                      **get_compression_kwargs(compression))
 
         ###############################
         # Attributes
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+############################################################
+
+
+import os
+import time
+import argparse
+import h5py
+from mintpy.objects import (get_chunk_shape,
+                            get_dataset_compression_kwargs,
+                            CHUNK_SHAPE_PRESETS)
+from mintpy.utils import ptime, utils as ut
+
+
+###########################################################################################
+EXAMPLE = """example:
+  rechunk.py  inputs/ifgramStack.h5  pixel
+  rechunk.py  timeseries.h5          slice     -o timeseries_slice.h5
+  rechunk.py  timeseries.h5          "(None,64,64)"  --memory 2GB
+  rechunk.py  inputs/ifgramStack.h5  auto      #back to auto-chunking by h5py
+"""
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Convert the chunk layout of an existing HDF5 file',
+                                     formatter_class=argparse.RawTextHelpFormatter,
+                                     epilog=EXAMPLE)
+
+    parser.add_argument('file', type=str, help='HDF5 file to be rechunked')
+    parser.add_argument('chunks', type=str,
+                        help='chunk shape / policy of 2D/3D datasets:\n'
+                             'auto     - auto-chunking by h5py\n' +
+                             '\n'.join(['{:<8} - {}'.format(k, v) for k, v in CHUNK_SHAPE_PRESETS.items()]) +
+                             '\nor chunk shape, e.g. "(None,128,128)", with None for the full size along that axis')
+    parser.add_argument('-o', '--output', dest='outfile',
+                        help='output file name, default: overwrite the input file.')
+    parser.add_argument('--memory', '--max-memory', dest='maxMemory', type=str, default='4GB',
+                        help='max memory to allocate while copying the data, default: 4GB')
+    return parser
+
+
+def cmd_line_parse(iargs=None):
+    parser = create_parser()
+    inps = parser.parse_args(args=iargs)
+    if os.path.splitext(inps.file)[1] not in ['.h5', '.he5']:
+        raise ValueError('input file is not HDF5: {}'.format(inps.file))
+    if not inps.outfile:
+        inps.outfile = inps.file
+    return inps
+
+
+###########################################################################################
+def rechunk_dataset(ds, fo, chunks, max_memory=4):
+    """Copy the dataset into the output HDF5 file with the new chunk shape, block by block.
+    Parameters: ds         - h5py.Dataset, input dataset
+                fo         - h5py.File, output file object
+                chunks     - str / tuple of int, chunk shape / policy
+                max_memory - str / float, memory budget
+    Returns:    dsOut      - h5py.Dataset, output dataset
+    """
+    # keep the compression, including the filters from plugin, e.g. blosc / zstd
+    compKwargs = get_dataset_compression_kwargs(ds)
+
+    # datasets not in the 2D size of the file (date, bperp, etc.): keep as it is
+    shape2d = (int(ds.file.attrs.get('LENGTH', 0)), int(ds.file.attrs.get('WIDTH', 0)))
+    if ds.ndim < 2 or ds.shape[-2:] != shape2d:
+        dsOut = fo.create_dataset(ds.name, data=ds[()], chunks=ds.chunks, **compKwargs)
+        for key, value in ds.attrs.items():
+            dsOut.attrs[key] = value
+        return dsOut
+
+    dsChunks = get_chunk_shape(ds.shape, chunks)
+    print('rechunk dataset {:<25} in size of {} from chunks = {} to {}'.format(ds.name,
+                                                                              ds.shape,
+                                                                              ds.chunks,
+                                                                              dsChunks))
+    dsOut = fo.create_dataset(ds.name,
+                              shape=ds.shape,
+                              maxshape=ds.maxshape,
+                              dtype=ds.dtype,
+                              chunks=dsChunks,
+                              **compKwargs)
+
+    # copy in boxes aligned with the output chunks, so that each chunk is written only once
+    box_list = ut.split2boxes_by_memory([(ds.shape, ds.dtype, 2)],
+                                        max_memory=max_memory,
+                                        chunk_shape=dsOut.chunks,
+                                        print_msg=False)
+    prog_bar = ptime.progressBar(maxValue=len(box_list))
+    for i, box in enumerate(box_list):
+        dsOut[..., box[1]:box[3], box[0]:box[2]] = ds[..., box[1]:box[3], box[0]:box[2]]
+        prog_bar.update(i+1, suffix='{}/{}'.format(i+1, len(box_list)))
+    prog_bar.close()
+
+    for key, value in ds.attrs.items():
+        dsOut.attrs[key] = value
+    return dsOut
+
+
+def rechunk_file(fname, chunks, out_file=None, max_memory=4):
+    """Rechunk all 2D/3D datasets of the HDF5 file.
+    Parameters: fname      - str, input HDF5 file
+                chunks     - str / tuple of int, chunk shape / policy, e.g. pixel, slice, balanced
+                out_file   - str, output HDF5 file, default: overwrite the input file
+                max_memory - str / float, memory budget
+    Returns:    out_file   - str, output HDF5 file
+    """
+    if not out_file:
+        out_file = fname
+
+    # write to a temporary file if overwriting the input file
+    temp_file = out_file
+    if os.path.abspath(out_file) == os.path.abspath(fname):
+        temp_file = os.path.join(os.path.dirname(out_file), 'tmp_{}'.format(os.path.basename(out_file)))
+
+    print('read   HDF5 file: {} with r mode'.format(fname))
+    print('create HDF5 file: {} with w mode'.format(temp_file))
+    with h5py.File(fname, 'r') as fi, h5py.File(temp_file, 'w') as fo:
+        objList = []
+        fi.visititems(lambda name, obj: objList.append(obj))
+        for obj in objList:
+            if isinstance(obj, h5py.Dataset):
+                rechunk_dataset(obj, fo, chunks, max_memory=max_memory)
+            else:
+                group = fo.require_group(obj.name)
+                for key, value in obj.attrs.items():
+                    group.attrs[key] = value
+
+        # metadata, with CHUNK_SHAPE inherited by the writers of the downstream products
+        for key, value in fi.attrs.items():
+            fo.attrs[key] = value
+        if str(chunks).lower() in ['auto', 'no', 'none', 'true', 'false']:
+            if 'CHUNK_SHAPE' in fo.attrs.keys():
+                del fo.attrs['CHUNK_SHAPE']
+        else:
+            fo.attrs['CHUNK_SHAPE'] = str(chunks)
+
+    if temp_file != out_file:
+        os.replace(temp_file, out_file)
+    print('finished writing to {}'.format(out_file))
+    return out_file
+
+
+###########################################################################################
+def main(iargs=None):
+    inps = cmd_line_parse(iargs)
+    start_time = time.time()
+
+    rechunk_file(inps.file, inps.chunks, out_file=inps.outfile, max_memory=inps.maxMemory)
+
+    m, s = divmod(time.time()-start_time, 60)
+    print('time used: {:02.0f} mins {:02.1f} secs.'.format(m, s))
+    return inps.outfile
+
+
+###########################################################################################
+if __name__ == '__main__':
+    main()
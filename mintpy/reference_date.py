@@ -130,6 +130,7 @@ def ref_date_file(ts_file, ref_date, outfile=None):
                 print("update /timeseries dataset and 'REF_DATE' attribute value")
                 f['timeseries'][:] = ts_data
                 f.attrs['REF_DATE'] = ref_date
+            readfile.clear_attribute_cache(ts_file)
             print('close {}'.format(ts_file))
         else:
             atr['REF_DATE'] = ref_date
@@ -219,6 +219,7 @@ def reference_file(inps):
                 ds[i, :, :] -= ds[i, inps.ref_y, inps.ref_x]
             f[k].attrs.update(atrNew)
             f.close()
+            readfile.clear_attribute_cache(inps.file)
             inps.outfile = inps.file
 
         elif k == 'timeseries':
@@ -12,7 +12,7 @@ import argparse
 import datetime as dt
 import h5py
 import numpy as np
-from mintpy.objects import timeseries, geometry, sensor
+from mintpy.objects import timeseries, geometry, sensor, get_compression_kwargs, COMPRESSION_NAMES
 from mintpy.defaults.template import get_template_content
 from mintpy.utils import readfile
 from mintpy import info
@@ -51,6 +51,9 @@ def create_parser():
                         help='Enable update mode, a.k.a. put XXXXXXXX as endDate in filename if endDate < 1 year')
     parser.add_argument('--subset', action='store_true',
                         help='Enable subset mode, a.k.a. put suffix _N31700_N32100_E130500_E131100')
+    parser.add_argument('--compression', choices=COMPRESSION_NAMES, default=compression,
+                        help='compression while writing to HDF5 file, default: {}.\n'.format(compression) +
+                             'blosc / zstd require the hdf5plugin package, also for reading.')
     return parser
 
 
@@ -283,7 +286,7 @@ def read_template2inps(template_file, inps=None):
     return inps
 
 
-def write2hdf5(out_file, ts_file, coh_file, mask_file, geom_file, metadata):
+def write2hdf5(out_file, ts_file, coh_file, mask_file, geom_file, metadata, compression=compression):
     """Write HDF5 file in HDF-EOS5 format"""
     ts_obj = timeseries(ts_file)
     ts_obj.open(print_msg=False)
@@ -311,7 +314,7 @@ def write2hdf5(out_file, ts_file, coh_file, mask_file, geom_file, metadata):
                                 data=data,
                                 dtype=np.float32,
                                 chunks=True,
-                                compression=compression)
+                                **get_compression_kwargs(compression))
     dset.attrs['Title'] = dsName
     dset.attrs['MissingValue'] = FLOAT_ZERO
     dset.attrs['_FillValue'] = FLOAT_ZERO
@@ -350,7 +353,7 @@ def write2hdf5(out_file, ts_file, coh_file, mask_file, geom_file, metadata):
     dset = group.create_dataset(dsName,
                                 data=data,
                                 chunks=True,
-                                compression=compression)
+                                **get_compression_kwargs(compression))
     dset.attrs['Title'] = dsName
     dset.attrs['MissingValue'] = FLOAT_ZERO
     dset.attrs['_FillValue'] = FLOAT_ZERO
@@ -368,7 +371,7 @@ def write2hdf5(out_file, ts_file, coh_file, mask_file, geom_file, metadata):
     dset = group.create_dataset(dsName,
                                 data=data,
                                 chunks=True,
-                                compression=compression)
+                                **get_compression_kwargs(compression))
     dset.attrs['Title'] = dsName
     dset.attrs['MissingValue'] = BOOL_ZERO
     dset.attrs['_FillValue'] = BOOL_ZERO
@@ -394,7 +397,7 @@ def write2hdf5(out_file, ts_file, coh_file, mask_file, geom_file, metadata):
         dset = group.create_dataset(dsName,
                                     data=data,
                                     chunks=True,
-                                    compression=compression)
+                                    **get_compression_kwargs(compression))
 
         dset.attrs['Title'] = dsName
         if dsName in ['height',
@@ -451,7 +454,8 @@ def main(iargs=None):
                coh_file=inps.coherence_file,
                mask_file=inps.mask_file,
                geom_file=inps.geom_file,
-               metadata=meta_dict)
+               metadata=meta_dict,
+               compression=inps.compression)
     return outName
 
 
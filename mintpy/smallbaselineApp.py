@@ -537,6 +537,8 @@ class TimeSeriesAnalysis:
         # 2) calculate the integer ambiguity of closure phase
         water_mask_file = 'waterMask.h5'
         scp_args = '{} --water-mask {} --action calculate --update'.format(stack_file, water_mask_file)
+        scp_args += ' --memory {}'.format(self.template['mintpy.compute.maxMemory'])
+        scp_args += ' --num-worker {}'.format(self.template['mintpy.unwrapError.numWorker'])
         print('unwrap_error_phase_closure.py', scp_args)
         mintpy.unwrap_error_phase_closure.main(scp_args.split())
         return
@@ -555,6 +557,7 @@ class TimeSeriesAnalysis:
 
         scp_args_bridge = '{} --template {} --update'.format(stack_file, self.templateFile)
         scp_args_closure = '{} --cc-mask {} --template {} --update'.format(stack_file, mask_file, self.templateFile)
+        scp_args_closure += ' --memory {}'.format(self.template['mintpy.compute.maxMemory'])
 
         if method == 'bridging':
             print('unwrap_error_bridging.py', scp_args_bridge)
@@ -588,6 +591,7 @@ class TimeSeriesAnalysis:
 
         # 1) invert ifgramStack for time-series
         scp_args = '{} -t {} --update '.format(stack_file, self.templateFile)
+        scp_args += ' --memory {}'.format(self.template['mintpy.compute.maxMemory'])
         print('ifgram_inversion.py', scp_args)
         mintpy.ifgram_inversion.main(scp_args.split())
 
@@ -851,6 +855,7 @@ class TimeSeriesAnalysis:
             scp_args = '{f} -t {t} -o {o} --update'.format(f=in_file, t=self.templateFile, o=out_file)
             if self.template['mintpy.topographicResidual.pixelwiseGeometry']:
                 scp_args += ' -g {}'.format(geom_file)
+            scp_args += ' --memory {}'.format(self.template['mintpy.compute.maxMemory'])
             print('dem_error.py', scp_args)
             mintpy.dem_error.main(scp_args.split())
         else:
@@ -891,6 +896,7 @@ class TimeSeriesAnalysis:
         scp_args = '{f} -t {t} -o {o} --update'.format(f=ts_file,
                                                        t=self.templateFile,
                                                        o=vel_file)
+        scp_args += ' --memory {}'.format(self.template['mintpy.compute.maxMemory'])
         print('timeseries2velocity.py', scp_args)
         mintpy.timeseries2velocity.main(scp_args.split())
 
@@ -903,6 +909,7 @@ class TimeSeriesAnalysis:
             scp_args= '{f} -t {t} -o {o} --update'.format(f=tropo_file,
                                                           t=self.templateFile,
                                                           o=tropo_vel_file)
+            scp_args += ' --memory {}'.format(self.template['mintpy.compute.maxMemory'])
             print('timeseries2velocity.py', scp_args)
             mintpy.timeseries2velocity.main(scp_args.split())
         return
@@ -925,6 +932,7 @@ class TimeSeriesAnalysis:
                 scp_args = '-l {l} -t {t} --outdir {o} --update '.format(l=lookup_file,
                                                                          t=self.templateFile,
                                                                          o=out_dir)
+                scp_args += ' --memory {} '.format(self.template['mintpy.compute.maxMemory'])
                 for in_file in in_files:
                     scp_args += ' {}'.format(in_file)
                 print('geocode.py', scp_args)
@@ -65,6 +65,8 @@ def create_parser():
                         help='template file with options')
     parser.add_argument('-o', '--output', dest='outfile',
                         help='output file name')
+    parser.add_argument('--memory', '--max-memory', dest='maxMemory', type=str, default='4GB',
+                        help='max memory to allocate, e.g. 8GB, 500MB, 4 (in GB), default: %(default)s.')
     parser.add_argument('--update', dest='update_mode', action='store_true',
                         help='Enable update mode, and skip estimation if:\n'+
                              '1) output velocity file already exists, readable '+
@@ -220,26 +222,11 @@ def read_date_info(inps):
 
 
 def estimate_linear_velocity(inps):
-    # read time-series data
-    print('reading data from file {} ...'.format(inps.timeseries_file))
-    ts_data, atr = readfile.read(inps.timeseries_file)
-    ts_data = ts_data[inps.dropDate, :, :].reshape(inps.numDate, -1)
-    if atr['UNIT'] == 'mm':
-        ts_data *= 1./1000.
+    atr = readfile.read_attribute(inps.timeseries_file)
     length, width = int(atr['LENGTH']), int(atr['WIDTH'])
-
-    # The following is equivalent
-    # X = scipy.linalg.lstsq(A, ts_data, cond=1e-15)[0]
-    # It is not used because it can not handle NaN value in ts_data
-    A = timeseries.get_design_matrix4average_velocity(inps.dateList)
-    X = np.dot(np.linalg.pinv(A), ts_data)
-    vel = np.array(X[0, :].reshape(length, width), dtype=dataType)
-
-    # velocity STD (Eq. (10), Fattahi and Amelung, 2015)
-    ts_diff = ts_data - np.dot(A, X)
-    t_diff = A[:, 0] - np.mean(A[:, 0])
-    vel_std = np.sqrt(np.sum(ts_diff ** 2, axis=0) / np.sum(t_diff ** 2)  / (inps.numDate - 2))
-    vel_std = np.array(vel_std.reshape(length, width), dtype=dataType)
+    num_date_all = len(inps.dropDate)
+    # scale of input time-series to meter, before UNIT is updated for the output
+    scale = 1./1000. if atr.get('UNIT', 'm') == 'mm' else 1.
 
     # prepare attributes
     atr['FILE_TYPE'] = 'velocity'
@@ -252,11 +239,52 @@ def estimate_linear_velocity(inps):
     for key in configKeys:
         atr[key_prefix+key] = str(vars(inps)[key])
 
-    # write to HDF5 file
-    dsDict = dict()
-    dsDict['velocity'] = vel
-    dsDict['velocityStd'] = vel_std
-    writefile.write(dsDict, out_file=inps.outfile, metadata=atr)
+    # initiate output file
+    dsNameDict = {'velocity'    : (dataType, (length, width)),
+                  'velocityStd' : (dataType, (length, width))}
+    writefile.layout_hdf5(inps.outfile, dsNameDict, metadata=atr)
+
+    # split into boxes based on the working set: time-series in float32 (read + subset)
+    # and its model prediction / residual in float64
+    ds_list = [((num_date_all, length, width), np.float32, 2),
+               ((inps.numDate, length, width), np.float64, 2)]
+    box_list = ut.split2boxes_by_memory(ds_list,
+                                        max_memory=inps.maxMemory,
+                                        chunk_shape=readfile.get_hdf5_chunks(inps.timeseries_file))
+    num_box = len(box_list)
+
+    # The following is equivalent
+    # X = scipy.linalg.lstsq(A, ts_data, cond=1e-15)[0]
+    # It is not used because it can not handle NaN value in ts_data
+    A = timeseries.get_design_matrix4average_velocity(inps.dateList)
+    A_inv = np.linalg.pinv(A)
+    t_diff = A[:, 0] - np.mean(A[:, 0])
+
+    for i, box in enumerate(box_list):
+        box_length = box[3] - box[1]
+        box_width = box[2] - box[0]
+        if num_box > 1:
+            print('\n------- processing patch {} out of {} --------------'.format(i+1, num_box))
+
+        # read time-series data
+        print('reading data from file {} in box {} ...'.format(inps.timeseries_file, box))
+        ts_data = readfile.read(inps.timeseries_file, box=box)[0]
+        ts_data = ts_data[inps.dropDate, :, :].reshape(inps.numDate, -1)
+        if scale != 1.:
+            ts_data *= scale
+
+        X = np.dot(A_inv, ts_data)
+        vel = np.array(X[0, :].reshape(box_length, box_width), dtype=dataType)
+
+        # velocity STD (Eq. (10), Fattahi and Amelung, 2015)
+        ts_diff = ts_data - np.dot(A, X)
+        vel_std = np.sqrt(np.sum(ts_diff ** 2, axis=0) / np.sum(t_diff ** 2)  / (inps.numDate - 2))
+        vel_std = np.array(vel_std.reshape(box_length, box_width), dtype=dataType)
+
+        # write to HDF5 file
+        block = [box[1], box[3], box[0], box[2]]
+        writefile.write_hdf5_block(inps.outfile, vel, datasetName='velocity', block=block)
+        writefile.write_hdf5_block(inps.outfile, vel_std, datasetName='velocityStd', block=block)
     return inps.outfile
 
 
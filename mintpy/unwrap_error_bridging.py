@@ -9,10 +9,13 @@
 import os
 import sys
 import time
+import hashlib
 import argparse
+import collections
+import concurrent.futures
 import h5py
 import numpy as np
-from mintpy.objects import ifgramStack
+from mintpy.objects import ifgramStack, get_chunk_shape
 from mintpy.objects.conncomp import connectComponent
 from mintpy.defaults.template import get_template_content
 from mintpy.utils import (ptime,
@@ -70,8 +73,11 @@ def create_parser():
                         help='name of dataset to be corrected, default: unwrapPhase')
     parser.add_argument('-o','--out-dataset', dest='datasetNameOut',
                         help='name of dataset to be written after correction, default: {}_bridging')
+    parser.add_argument('--num-worker', dest='numWorker', type=int, default=4,
+                        help='number of processes to correct the interferograms in parallel, default: %(default)s.')
     parser.add_argument('--update', dest='update_mode', action='store_true',
-                        help='Enable update mode: if unwrapPhase_unwCor dataset exists, skip the correction.')
+                        help='Enable update mode: if unwrapPhase_unwCor dataset exists, skip the correction;\n'
+                             'if it is incomplete from an interrupted run, resume the correction.')
     return parser
 
 
@@ -115,7 +121,7 @@ def read_template2inps(template_file, inps=None):
         elif value:
             if key in ['waterMaskFile', 'ramp']:
                 inpsDict[key] = value
-            elif key in ['bridgePtsRadius']:
+            elif key in ['bridgePtsRadius', 'numWorker']:
                 inpsDict[key] = int(value)
     return inps
 
@@ -130,6 +136,9 @@ def run_or_skip(inps):
         if inps.datasetNameOut not in f.keys():
             flag = 'run'
             print('1) output dataset: {} NOT found.'.format(inps.datasetNameOut))
+        elif not is_output_dataset_complete(f[inps.datasetNameOut]):
+            flag = 'run'
+            print('1) output dataset: {} is incomplete.'.format(inps.datasetNameOut))
         else:
             print('1) output dataset: {} exists'.format(inps.datasetNameOut))
             ti = float(f[inps.datasetNameIn].attrs.get('MODIFICATION_TIME', os.path.getmtime(inps.ifgram_file)))
@@ -169,9 +178,144 @@ def run_or_skip(inps):
 
 
 ##########################################################################################
+def get_checkpoint_key(ifgram_file, dsNameIn, config_list):
+    """Get the key of the correction setup, to invalidate the incomplete output dataset of a previous run.
+    It changes with the input dataset (modification time), dropIfgram and the given configurations.
+    """
+    with h5py.File(ifgram_file, 'r') as f:
+        drop_ifgram = f['dropIfgram'][:]
+        ti = f[dsNameIn].attrs.get('MODIFICATION_TIME', '')
+    key_list = [dsNameIn, str(ti), ''.join(str(int(i)) for i in drop_ifgram)]
+    key_list += [str(i) for i in config_list]
+    return hashlib.md5('\n'.join(key_list).encode('utf-8')).hexdigest()
+
+
+def is_output_dataset_complete(ds):
+    """Check if all interferograms of the output dataset are written,
+    based on the NUM_IFGRAM_DONE attribute, which is missing for outputs of older versions (complete).
+    """
+    return int(ds.attrs.get('NUM_IFGRAM_DONE', ds.shape[0])) >= ds.shape[0]
+
+
+def prepare_output_dataset(f, dsNameOut, shape_out, key, resume=False):
+    """Create / access the 3D output dataset, and get the number of interferograms finished by a previous run.
+    Parameters: f         : h5py.File object opened in r+ mode
+                dsNameOut : str, output dataset name
+                shape_out : tuple of 3 int, output dataset shape
+                key       : str, key of the correction setup, from get_checkpoint_key()
+                resume    : bool, resume from the incomplete output dataset of a previous run with the same key
+    Returns:    ds        : h5py.Dataset object
+                num_done  : int, number of interferograms already written
+    """
+    num_done = 0
+    if dsNameOut in f.keys():
+        ds = f[dsNameOut]
+        print('access /{d} of np.float32 in size of {s}'.format(d=dsNameOut, s=shape_out))
+        if resume and ds.shape == shape_out and not is_output_dataset_complete(ds):
+            if ds.attrs.get('CHECKPOINT_KEY', None) == key:
+                num_done = int(ds.attrs['NUM_IFGRAM_DONE'])
+                print('resume from interferogram {} finished in the previous run'.format(num_done))
+            else:
+                print('incomplete /{} is from a different setup, ignore it.'.format(dsNameOut))
+    else:
+        ds = f.create_dataset(dsNameOut,
+                              shape_out,
+                              maxshape=(None, None, None),
+                              chunks=get_chunk_shape(shape_out, f.attrs.get('CHUNK_SHAPE', None)),
+                              compression=None)
+        print('create /{d} of np.float32 in size of {s}'.format(d=dsNameOut, s=shape_out))
+    ds.attrs['CHECKPOINT_KEY'] = key
+    ds.attrs['NUM_IFGRAM_DONE'] = num_done
+    readfile.clear_attribute_cache(f.filename)
+    return ds, num_done
+
+
+def run_ifgram_correction(ds, read_func, task_func, initializer, initargs=(), start_index=0,
+                          num_worker=1, date12_list=None):
+    """Correct interferograms in parallel, and write them in order into the output dataset.
+    Interferograms are read and written by the main process only, as the output file is open in r+ mode;
+    the number of interferograms in memory is limited to twice the number of workers.
+
+    Parameters: ds          : h5py.Dataset object, 3D output dataset
+                read_func   : function(i), read the input of the i-th interferogram, return tuple of arguments
+                task_func   : function(*args), correct one interferogram, return 2D np.ndarray;
+                              defined at the module level to run in the pool of processes
+                initializer : function(*initargs), set up the shared inputs of task_func in each process
+                start_index : int, index of the first interferogram to be corrected
+                num_worker  : int, number of processes
+                date12_list : list of str, date12 of interferograms as the suffix of progress bar
+    Returns:    ds          : h5py.Dataset object, with NUM_IFGRAM_DONE attribute updated
+                              after each interferogram to resume the correction if interrupted
+    """
+    num_ifgram = ds.shape[0]
+    num_worker = max(min(num_worker, os.cpu_count(), num_ifgram - start_index), 1)
+    print('correct interferograms {} - {} using {} process(es)'.format(start_index, num_ifgram, num_worker))
+
+    prog_bar = ptime.progressBar(maxValue=num_ifgram)
+    def write_ifgram(i, data):
+        ds[i, :, :] = data
+        ds.attrs['NUM_IFGRAM_DONE'] = i + 1
+        ds.file.flush()
+        readfile.clear_attribute_cache(ds.file.filename)
+        prog_bar.update(i+1, suffix=date12_list[i] if date12_list else '')
+
+    if num_worker == 1:
+        initializer(*initargs)
+        for i in range(start_index, num_ifgram):
+            write_ifgram(i, task_func(*read_func(i)))
+
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_worker,
+                                                    initializer=initializer,
+                                                    initargs=initargs) as executor:
+            futures = collections.deque()
+            for i in range(start_index, num_ifgram):
+                futures.append((i, executor.submit(task_func, *read_func(i))))
+                if len(futures) >= num_worker * 2:
+                    j, future = futures.popleft()
+                    write_ifgram(j, future.result())
+            while futures:
+                j, future = futures.popleft()
+                write_ifgram(j, future.result())
+    prog_bar.close()
+    return ds
+
+
+def bridge_unwrap_error(unw, cc, metadata, water_mask=None, radius=50, ramp_type=None):
+    """Correct the unwrapping error of one interferogram with bridging.
+    Parameters: unw        : 2D np.ndarray, unwrapped phase
+                cc         : 2D np.ndarray, connected components
+                metadata   : dict, attributes with reference point info
+                water_mask : 2D np.ndarray in bool, water mask
+                radius     : int, radius of the end point of bridges
+                ramp_type  : str, name of phase ramp to be removed during the phase jump estimation
+    Returns:    unw_cor    : 2D np.ndarray in float32, corrected unwrapped phase
+    """
+    if water_mask is not None:
+        cc[water_mask == 0] = 0
+
+    cc_obj = connectComponent(conncomp=cc, metadata=metadata)
+    cc_obj.label()
+    cc_obj.find_mst_bridge()
+    return cc_obj.unwrap_conn_comp(unw, radius=radius, ramp_type=ramp_type)
+
+
+def _init_bridge_worker(kwargs):
+    global bridge_kwargs
+    bridge_kwargs = kwargs
+    return
+
+
+def _bridge_unwrap_error_worker(unw, cc=None):
+    # skip dropped interferograms
+    if cc is None:
+        return unw
+    return bridge_unwrap_error(unw, cc, **bridge_kwargs)
+
+
 def run_unwrap_error_bridge(ifgram_file, water_mask_file, ramp_type=None, radius=50, 
                             ccName='connectComponent', dsNameIn='unwrapPhase',
-                            dsNameOut='unwrapPhase_bridging'):
+                            dsNameOut='unwrapPhase_bridging', num_worker=1, resume=False):
     """Run unwrapping error correction with bridging
     Parameters: ifgram_file     : str, path of ifgram stack file
                 water_mask_file : str, path of water mask file
@@ -179,6 +323,8 @@ def run_unwrap_error_bridge(ifgram_file, water_mask_file, ramp_type=None, radius
                 ccName          : str, dataset name of connected components
                 dsNameIn        : str, dataset name of unwrap phase to be corrected
                 dsNameOut       : str, dataset name of unwrap phase to be saved after correction
+                num_worker      : int, number of processes to correct the interferograms in parallel
+                resume          : bool, resume from the incomplete output dataset of an interrupted run
     Returns:    ifgram_file     : str, path of ifgram stack file
     """
     print('-'*50)
@@ -204,51 +350,37 @@ def run_unwrap_error_bridge(ifgram_file, water_mask_file, ramp_type=None, radius
         date12_list_kept = ifgramStack(ifgram_file).get_date12_list(dropIfgram=True)
         num_ifgram = len(date12_list)
         shape_out = (num_ifgram, length, width)
+        key = get_checkpoint_key(ifgram_file, dsNameIn, [ccName, water_mask_file, radius, ramp_type])
 
         # prepare output data writing
         print('open {} with r+ mode'.format(ifgram_file))
         f = h5py.File(ifgram_file, 'r+')
         print('input  dataset:', dsNameIn)
         print('output dataset:', dsNameOut)
-        if dsNameOut in f.keys():
-            ds = f[dsNameOut]
-            print('access /{d} of np.float32 in size of {s}'.format(d=dsNameOut, s=shape_out))
-        else:
-            ds = f.create_dataset(dsNameOut,
-                                  shape_out,
-                                  maxshape=(None, None, None),
-                                  chunks=True,
-                                  compression=None)
-            print('create /{d} of np.float32 in size of {s}'.format(d=dsNameOut, s=shape_out))
+        ds, num_done = prepare_output_dataset(f, dsNameOut, shape_out, key=key, resume=resume)
 
-        # correct unwrap error ifgram by ifgram
-        prog_bar = ptime.progressBar(maxValue=num_ifgram)
-        for i in range(num_ifgram):
+        def read_ifgram(i):
             # read unwrapPhase
-            date12 = date12_list[i]
             unw = np.squeeze(f[dsNameIn][i, :, :])
-
             # skip dropped interferograms
-            if date12 not in date12_list_kept:
-                ds[i, :, :] = unw
-            else:
-                # read connectComponent
-                cc = np.squeeze(f[ccName][i, :, :])
-                if water_mask is not None:
-                    cc[water_mask == 0] = 0
-
-                # bridging
-                cc_obj = connectComponent(conncomp=cc, metadata=atr)
-                cc_obj.label()
-                cc_obj.find_mst_bridge()
-                unw_cor = cc_obj.unwrap_conn_comp(unw, radius=radius, ramp_type=ramp_type)
-
-                # write to hdf5 file
-                ds[i, :, :] = unw_cor
-            prog_bar.update(i+1, suffix=date12)
-        prog_bar.close()
+            if date12_list[i] not in date12_list_kept:
+                return (unw,)
+            # read connectComponent
+            cc = np.squeeze(f[ccName][i, :, :])
+            return (unw, cc)
+
+        # correct unwrap error ifgram by ifgram
+        kwargs = dict(metadata=atr, water_mask=water_mask, radius=radius, ramp_type=ramp_type)
+        run_ifgram_correction(ds, read_ifgram,
+                              task_func=_bridge_unwrap_error_worker,
+                              initializer=_init_bridge_worker,
+                              initargs=(kwargs,),
+                              start_index=num_done,
+                              num_worker=num_worker,
+                              date12_list=date12_list)
         ds.attrs['MODIFICATION_TIME'] = str(time.time())
         f.close()
+        readfile.clear_attribute_cache(ifgram_file)
         print('close {} file.'.format(ifgram_file))
 
     if k == '.unw':
@@ -261,14 +393,9 @@ def run_unwrap_error_bridge(ifgram_file, water_mask_file, ramp_type=None, radius
         if len(cc_files) == 0:
             raise FileNotFoundError(cc_files0)
         cc = readfile.read(cc_files[0])[0]
-        if water_mask is not None:
-            cc[water_mask == 0] = 0
 
         # bridging
-        cc_obj = connectComponent(conncomp=cc, metadata=atr)
-        cc_obj.label()
-        cc_obj.find_mst_bridge()
-        unw_cor = cc_obj.unwrap_conn_comp(unw, ramp_type=ramp_type)
+        unw_cor = bridge_unwrap_error(unw, cc, metadata=atr, water_mask=water_mask, ramp_type=ramp_type)
 
         # write to hdf5 file
         out_file = '{}_unwCor{}'.format(os.path.splitext(ifgram_file)[0],
@@ -295,7 +422,9 @@ def main(iargs=None):
                             ramp_type=inps.ramp,
                             radius=inps.bridgePtsRadius,
                             dsNameIn=inps.datasetNameIn,
-                            dsNameOut=inps.datasetNameOut)
+                            dsNameOut=inps.datasetNameOut,
+                            num_worker=inps.numWorker,
+                            resume=inps.update_mode)
 
     # config parameter
     if os.path.splitext(inps.ifgram_file)[1] in ['.h5', '.he5']:
@@ -10,6 +10,8 @@ import os
 import sys
 import argparse
 import time
+import hashlib
+import concurrent.futures
 import h5py
 import numpy as np
 from matplotlib import pyplot as plt, ticker
@@ -23,12 +25,16 @@ try:
 except ImportError:
     raise ImportError('Could not import skimage!')
 
-from mintpy.objects import ifgramStack
+from mintpy.objects import ifgramStack, get_chunk_shape
 from mintpy.objects.conncomp import connectComponent
 from mintpy.defaults.template import get_template_content
 from mintpy.utils import ptime, readfile, writefile, utils as ut, plot as pp
 from mintpy.utils.solvers import l1regls
 from mintpy import ifgram_inversion as ifginv
+from mintpy.unwrap_error_bridging import (get_checkpoint_key,
+                                          is_output_dataset_complete,
+                                          prepare_output_dataset,
+                                          run_ifgram_correction)
 
 
 key_prefix = 'mintpy.unwrapError.'
@@ -42,6 +48,7 @@ EXAMPLE = """example:
   # calculate the number of non-zero closure phase
   unwrap_error_phase_closure.py  ./inputs/ifgramStack.h5  --action calculate
   unwrap_error_phase_closure.py  ./inputs/ifgramStack.h5  --action calculate  --water-mask waterMask.h5
+  unwrap_error_phase_closure.py  ./inputs/ifgramStack.h5  --action calculate  --water-mask waterMask.h5 --stats
 """
 
 NOTE = """
@@ -94,8 +101,18 @@ def create_parser():
     mask.add_argument('-t', '--template', dest='template_file',
                       help='template file with options for setting.')
 
+    parser.add_argument('--memory', '--max-memory', dest='maxMemory', type=str, default='4GB',
+                        help='max memory to allocate, e.g. 8GB, 500MB, 4 (in GB), default: %(default)s.')
+    parser.add_argument('--num-worker', dest='numWorker', type=int, default=4,
+                        help='number of processes to solve the integer ambiguity of the sample pixels\n'
+                             'and to correct the interferograms in parallel, or\n'
+                             'number of threads to calculate the closure phase block by block, default: %(default)s.')
+    parser.add_argument('--stats', dest='saveStats', action='store_true',
+                        help='save the number of non-zero integer closure phase for each interferogram / triplet\n'
+                             'into text files, to identify interferograms to drop, for --action calculate.')
     parser.add_argument('--update', dest='update_mode', action='store_true',
-                        help='Enable update mode: if unwrapPhase_phaseClosure dataset exists, skip the correction.')
+                        help='Enable update mode: if unwrapPhase_phaseClosure dataset exists, skip the correction;\n'
+                             'if it is incomplete from an interrupted run, resume the correction.')
     return parser
 
 
@@ -143,6 +160,8 @@ def read_template2inps(template_file, inps=None):
         if value:
             if key in ['waterMaskFile']:
                 inpsDict[key] = value
+            elif key in ['numWorker']:
+                inpsDict[key] = int(value)
     return inps
 
 
@@ -156,6 +175,9 @@ def run_or_skip(inps):
         if inps.datasetNameOut not in f.keys():
             flag = 'run'
             print('1) output dataset: {} NOT found.'.format(inps.datasetNameOut))
+        elif not is_output_dataset_complete(f[inps.datasetNameOut]):
+            flag = 'run'
+            print('1) output dataset: {} is incomplete.'.format(inps.datasetNameOut))
         else:
             print('1) output dataset: {} exists.'.format(inps.datasetNameOut))
             to = float(f[inps.datasetNameOut].attrs.get('MODIFICATION_TIME', os.path.getmtime(inps.ifgram_file)))
@@ -172,8 +194,97 @@ def run_or_skip(inps):
 
 
 ##########################################################################################
+def calc_num_nonzero_closure_block(stack_obj, C, box, ref_phase, dsName='unwrapPhase', mask=None):
+    """Calculate the number of non-zero integer ambiguity of closure phase for one block.
+    Parameters: stack_obj   - ifgramStack object
+                C           - scipy.sparse.csr_matrix in size of (num_triplet, num_ifgram), design matrix for triplets
+                box         - tuple of 4 int in (x0, y0, x1, y1)
+                ref_phase   - 1D np.ndarray in size of (num_ifgram,), reference phase
+                dsName      - str, unwrapped phase dataset name
+                mask        - 2D np.ndarray in bool in size of the block, pixels to count for each triplet
+    Returns:    num_nonzero - 2D np.ndarray in float32 in size of the block, number of triplets
+                              with non-zero integer ambiguity for each pixel
+                num_pixel   - 1D np.ndarray in int64 in size of (num_triplet,), number of (masked) pixels
+                              with non-zero integer ambiguity for each triplet
+    """
+    num_ifgram = C.shape[1]
+    unw = ifginv.read_unwrap_phase(stack_obj, box=box,
+                                   ref_phase=ref_phase,
+                                   obsDatasetName=dsName,
+                                   dropIfgram=True,
+                                   print_msg=False).reshape(num_ifgram, -1)
+
+    # calculate based on equation (8-9) and T_int equation inline,
+    # i.e. round((closure_pha - ut.wrap(closure_pha)) / (2.*np.pi)), in place
+    closure_pha = C.dot(unw)
+    closure_int = closure_pha + np.pi
+    np.mod(closure_int, 2.*np.pi, out=closure_int)
+    closure_int -= np.pi
+    np.subtract(closure_pha, closure_int, out=closure_int)
+    closure_int /= 2.*np.pi
+    np.round(closure_int, out=closure_int)
+    flag = closure_int != 0
+    num_nonzero = np.sum(flag, axis=0).reshape(box[3]-box[1], box[2]-box[0]).astype(np.float32)
+
+    if mask is not None:
+        flag = flag[:, mask.flatten()]
+    num_pixel = np.sum(flag, axis=1)
+    return num_nonzero, num_pixel
+
+
+def write_closure_stats(out_file, C, date12_list, num_pixel, num_valid_pixel, date12_list_all=None):
+    """Write the number of non-zero integer closure phase for each interferogram / triplet into text files.
+    Parameters: out_file        - str, path of the numNonzeroIntClosure file, as the prefix of text files
+                C               - scipy.sparse.csr_matrix in size of (num_triplet, num_ifgram)
+                date12_list     - list of str, date12 of the kept interferograms
+                num_pixel       - 1D np.ndarray in size of (num_triplet,), number of pixels
+                                  with non-zero integer ambiguity for each triplet
+                num_valid_pixel - int, number of pixels counted
+                date12_list_all - list of str, date12 of all interferograms, for the index used in modify_network.py
+    Returns:    ifg_file / tri_file - str, path of text files
+    """
+    num_valid_pixel = max(num_valid_pixel, 1)
+    if date12_list_all is None:
+        date12_list_all = date12_list
+    fbase = os.path.splitext(out_file)[0]
+
+    # triplet
+    tri_file = '{}_triplet.txt'.format(fbase)
+    C = C.tocsr()
+    with open(tri_file, 'w') as f:
+        f.write('# triplet               num_nonzero_pixel  ratio\n')
+        for i in range(C.shape[0]):
+            idx = C.indices[C.indptr[i]:C.indptr[i+1]]
+            date_list = sorted(set('_'.join(date12_list[j] for j in idx).split('_')))
+            f.write('{}  {:>17d}  {:.4f}\n'.format('_'.join(date_list), num_pixel[i], num_pixel[i] / num_valid_pixel))
+    print('write the number of non-zero integer closure phase for each triplet to file', tri_file)
+
+    # interferogram: sum of its triplets
+    C_abs = abs(C)
+    num_triplet = np.asarray(C_abs.sum(axis=0)).flatten().astype(int)
+    num_pixel_ifg = C_abs.T.dot(num_pixel).astype(int)
+    ratio = num_pixel_ifg / (np.maximum(num_triplet, 1) * num_valid_pixel)
+
+    ifg_file = '{}_ifgram.txt'.format(fbase)
+    with open(ifg_file, 'w') as f:
+        f.write('# index: 1 as the first in all interferograms, as in modify_network.py --exclude-ifg-index\n')
+        f.write('# ratio: num_nonzero_pixel / (num_triplet * num_pixel), num_pixel = {}\n'.format(num_valid_pixel))
+        f.write('# index  date12             num_triplet  num_nonzero_pixel  ratio\n')
+        for i, date12 in enumerate(date12_list):
+            f.write('{:>7d}  {}  {:>11d}  {:>17d}  {:.4f}\n'.format(date12_list_all.index(date12)+1, date12,
+                                                                  num_triplet[i], num_pixel_ifg[i], ratio[i]))
+    print('write the number of non-zero integer closure phase for each interferogram to file', ifg_file)
+
+    # top interferograms
+    print('interferograms with the largest ratio of non-zero integer closure phase:')
+    for i in np.argsort(-ratio, kind='stable')[:min(10, len(date12_list))]:
+        print('  {:>5d}  {}  {:.4f}'.format(date12_list_all.index(date12_list[i])+1, date12_list[i], ratio[i]))
+    return ifg_file, tri_file
+
+
 def calc_num_nonzero_integer_closure_phase(ifgram_file, mask_file=None, dsName='unwrapPhase',
-                                           out_file=None, step=50, update_mode=True):
+                                           out_file=None, max_memory=4, num_worker=1, save_stats=False,
+                                           update_mode=True):
     """Calculate the number of non-zero integer ambiguity of closure phase.
 
     T_int as shown in equation (8-9) and inline in Yunjun et al. (2019, CAGEO).
@@ -182,7 +293,10 @@ def calc_num_nonzero_integer_closure_phase(ifgram_file, mask_file=None, dsName='
                 mask_file   - str, path of mask file
                 dsName      - str, unwrapped phase dataset name used to calculate the closure phase
                 out_file    - str, custom output filename
-                step        - int, number of row in each block to calculate T_int
+                max_memory  - str / float, max memory to allocate, e.g. 8GB, 4 (in GB)
+                num_worker  - int, number of threads to process the blocks in parallel
+                save_stats  - bool, save the number of non-zero integer closure phase
+                              for each interferogram / triplet into text files
                 update_mode - bool
     Returns:    out_file    - str, custom output filename
     Example:    calc_num_nonzero_integer_closure_phase('inputs/ifgramStack.h5', mask_file='waterMask.h5')
@@ -209,43 +323,56 @@ def calc_num_nonzero_integer_closure_phase(ifgram_file, mask_file=None, dsName='
     date12_list = stack_obj.get_date12_list(dropIfgram=True)
     num_ifgram = len(date12_list)
 
-    C = stack_obj.get_design_matrix4triplet(date12_list)
+    # sparse design matrix, with 3 non-zero elements per row
+    C = stack_obj.get_design_matrix4triplet(date12_list, sparse=True)
     ref_phase = stack_obj.get_reference_phase(unwDatasetName=dsName, dropIfgram=True).reshape(num_ifgram, -1)
     print('get design matrix for the interferogram triplets in size of {}'.format(C.shape))    
 
+    # read mask
+    mask = None
+    if mask_file is not None:
+        print('read mask from file', mask_file)
+        mask = readfile.read(mask_file)[0] != 0
+
+    # split into boxes based on the working set of each thread:
+    # unwrapped phase + closure phase, its integer component and non-zero flag
+    num_triplet = C.shape[0]
+    num_worker = max(min(num_worker, os.cpu_count()), 1)
+    ds_list = [((num_ifgram, length, width), np.float32, 1),
+               ((num_triplet, length, width), np.float32, 2),
+               ((num_triplet, length, width), np.bool_, 1)]
+    box_list = ut.split2boxes_by_memory(ds_list,
+                                        max_memory=ut.parse_memory_size(max_memory) / 1024**3 / num_worker,
+                                        chunk_shape=readfile.get_hdf5_chunks(ifgram_file, dsName),
+                                        print_msg=False)
+    num_box = len(box_list)
+    num_worker = min(num_worker, num_box)
+
     # calculate number of nonzero closure phase
-    num_loop = int(np.ceil(length / step))
     num_nonzero_closure = np.zeros((length, width), dtype=np.float32)
+    num_nonzero_pixel = np.zeros(num_triplet, dtype=np.int64)
     msg = 'calcualting the number of triplets with non-zero integer ambiguity of closure phase ...'
-    msg += '\n    block by block with size up to {}, {} blocks in total'.format((step, width), num_loop)
+    msg += '\n    block by block with size up to {}, {} blocks in total, using {} thread(s)'.format(
+        (box_list[0][3] - box_list[0][1], box_list[0][2] - box_list[0][0]), num_box, num_worker)
     print(msg)
 
-    prog_bar = ptime.progressBar(maxValue=num_loop)
-    for i in range(num_loop):
-        # box
-        r0 = i * step
-        r1 = min((r0+step), stack_obj.length)
-        box = (0, r0, stack_obj.width, r1)
-
-        # read data
-        unw = ifginv.read_unwrap_phase(stack_obj, box=box,
-                                       ref_phase=ref_phase,
-                                       obsDatasetName=dsName,
-                                       dropIfgram=True,
-                                       print_msg=False).reshape(num_ifgram, -1)
-
-        # calculate based on equation (8-9) and T_int equation inline.
-        closure_pha = np.dot(C, unw)
-        closure_int = np.round((closure_pha - ut.wrap(closure_pha)) / (2.*np.pi))
-        num_nonzero_closure[r0:r1, :] = np.sum(closure_int != 0, axis=0).reshape(-1, width)
-
-        prog_bar.update(i+1, every=1)
+    def calc_block(box):
+        mask_box = mask[box[1]:box[3], box[0]:box[2]] if mask is not None else None
+        return box, calc_num_nonzero_closure_block(stack_obj, C, box, ref_phase, dsName=dsName, mask=mask_box)
+
+    prog_bar = ptime.progressBar(maxValue=num_box)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_worker) as executor:
+        futures = [executor.submit(calc_block, box) for box in box_list]
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            box, (num_nonzero, num_pixel) = future.result()
+            num_nonzero_closure[box[1]:box[3], box[0]:box[2]] = num_nonzero
+            num_nonzero_pixel += num_pixel
+            prog_bar.update(i+1, every=1)
     prog_bar.close()
 
     # mask
-    if mask_file is not None:
+    if mask is not None:
         print('masking with file', mask_file)
-        mask = readfile.read(mask_file)[0]
         num_nonzero_closure[mask == 0] = np.nan
 
     # write to disk
@@ -255,6 +382,12 @@ def calc_num_nonzero_integer_closure_phase(ifgram_file, mask_file=None, dsName='
     meta['UNIT'] = '1'
     writefile.write(num_nonzero_closure, out_file, meta)
 
+    # statistics for each interferogram / triplet
+    if save_stats:
+        num_valid_pixel = np.sum(mask) if mask is not None else length * width
+        write_closure_stats(out_file, C, date12_list, num_nonzero_pixel, int(num_valid_pixel),
+                            date12_list_all=stack_obj.get_date12_list(dropIfgram=False))
+
     # plot
     plot_num_nonzero_integer_closure_phase(out_file)
 
@@ -344,7 +477,8 @@ def write_hdf5_file_patch(ifgram_file, data, box=None, dsName='unwrapPhase_phase
         print('create '+msg)
         ds = f.create_dataset(dsName, (num_ifgram, num_row, num_col),
                               maxshape=(None, None, None),
-                              chunks=True, compression=None)
+                              chunks=get_chunk_shape((num_ifgram, length, width), f.attrs.get('CHUNK_SHAPE', None)),
+                              compression=None)
 
     # resize h5py.Dataset if current size is not enough
     if ds.shape != (num_ifgram, length, width):
@@ -355,18 +489,72 @@ def write_hdf5_file_patch(ifgram_file, data, box=None, dsName='unwrapPhase_phase
 
     ds.attrs['MODIFICATION_TIME'] = str(time.time())
     f.close()
+    readfile.clear_attribute_cache(ifgram_file)
     print('close {}'.format(ifgram_file))
     return ifgram_file
 
 
+def read_unwrap_phase_sample(stack_obj, sample_coords, ref_phase, dsNameIn='unwrapPhase'):
+    """Read the unwrapped phase of the kept interferograms at sample pixels, in one pass.
+    Parameters: stack_obj     : ifgramStack object
+                sample_coords : 2D np.ndarray in size of (num_sample, 2) in int, for (y, x)
+                ref_phase     : 1D np.ndarray in size of (num_ifgram,), reference phase
+                dsNameIn      : str, dataset name of the unwrap phase
+    Returns:    unw           : 2D np.ndarray in size of (num_ifgram, num_sample) in float32,
+                                the same as ifgram_inversion.read_unwrap_phase() for each pixel.
+    """
+    idx_ifgram = np.where(stack_obj.dropIfgram)[0]
+    num_ifgram, num_sample = idx_ifgram.size, sample_coords.shape[0]
+
+    # point selection of (ifgram, y, x) of all samples
+    coords = np.zeros((num_ifgram, num_sample, 3), dtype=np.uint64)
+    coords[:, :, 0] = idx_ifgram.reshape(-1, 1)
+    coords[:, :, 1:] = sample_coords.reshape(1, -1, 2)
+    with h5py.File(stack_obj.file, 'r') as f:
+        ds = f[dsNameIn]
+        file_space = ds.id.get_space()
+        file_space.select_elements(coords.reshape(-1, 3))
+        mem_space = h5py.h5s.create_simple((num_ifgram * num_sample,))
+        unw = np.zeros(num_ifgram * num_sample, dtype=ds.dtype)
+        ds.id.read(mem_space, file_space, unw)
+    unw = unw.reshape(num_ifgram, num_sample).astype(np.float32)
+    unw[np.isnan(unw)] = 0.
+
+    # reference unwrapPhase
+    for i in range(num_ifgram):
+        mask = unw[i, :] != 0.
+        unw[i, :][mask] -= ref_phase[i]
+    return unw
+
+
+def solve_int_ambiguity(C, closure_int):
+    """Solve the integer ambiguity from the integer closure phase via L1-norm regularized least squares.
+    Parameters: C           : cvxopt.matrix in size of (num_triplet, num_ifgram), design matrix for triplets
+                closure_int : 1D np.ndarray in size of (num_triplet,), integer ambiguity of closure phase
+    Returns:    U           : 1D np.ndarray in size of (num_ifgram,), integer ambiguity of interferograms
+    """
+    return np.round(l1regls(-C, matrix(closure_int.reshape(-1, 1)), alpha=1e-2, show_progress=0)).flatten()
+
+
+def _init_solver_worker(C):
+    global solver_design_matrix
+    solver_design_matrix = C
+    return
+
+
+def _solve_int_ambiguity_worker(closure_int):
+    return solve_int_ambiguity(solver_design_matrix, closure_int)
+
+
 def get_common_region_int_ambiguity(ifgram_file, cc_mask_file, water_mask_file=None, num_sample=100,
-                                    dsNameIn='unwrapPhase'):
+                                    dsNameIn='unwrapPhase', num_worker=1):
     """Solve the phase unwrapping integer ambiguity for the common regions among all interferograms
     Parameters: ifgram_file     : str, path of interferogram stack file
                 cc_mask_file    : str, path of common connected components file
                 water_mask_file : str, path of water mask file
                 num_sample      : int, number of pixel sampled for each region
                 dsNameIn        : str, dataset name of the unwrap phase to be corrected
+                num_worker      : int, number of processes to solve the unique integer closure phase
     Returns:    common_regions  : list of skimage.measure._regionprops._RegionProperties object
                     modified by adding two more variables:
                     sample_coords : 2D np.ndarray in size of (num_sample, 2) in int64 format
@@ -379,7 +567,9 @@ def get_common_region_int_ambiguity(ifgram_file, cc_mask_file, water_mask_file=N
     stack_obj.open()
     date12_list = stack_obj.get_date12_list(dropIfgram=True)
     num_ifgram = len(date12_list)
-    C = matrix(ifgramStack.get_design_matrix4triplet(date12_list).astype(float))
+    # sparse design matrix for the closure phase, dense cvxopt matrix for the solver
+    C_sparse = ifgramStack.get_design_matrix4triplet(date12_list, sparse=True).astype(np.float64)
+    C = matrix(C_sparse.toarray())
     ref_phase = stack_obj.get_reference_phase(unwDatasetName=dsNameIn, dropIfgram=True).reshape(num_ifgram, -1)
 
     # prepare common label
@@ -399,10 +589,18 @@ def get_common_region_int_ambiguity(ifgram_file, cc_mask_file, water_mask_file=N
     print('solving the phase-unwrapping integer ambiguity for {}'.format(dsNameIn))
     print('\tbased on the closure phase of interferograms triplets (Yunjun et al., 2019)')
     print('\tusing the L1-norm regularzed least squares approximation (LASSO) ...')
+    # seed the sampling with the input setup, for the same int_ambiguity, thus checkpoint key, of a resumed run
+    key = get_checkpoint_key(ifgram_file, dsNameIn, [cc_mask_file, water_mask_file, num_sample])
+    rng = np.random.RandomState(int(key[:8], 16))
+    executor = None
+    if num_worker > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_worker,
+                                                          initializer=_init_solver_worker,
+                                                          initargs=(C,))
     for i in range(num_label):
         common_reg = common_regions[i]
         # sample_coords
-        idx = sorted(np.random.choice(common_reg.area, num_sample, replace=False))
+        idx = sorted(rng.choice(int(common_reg.area), num_sample, replace=False))
         common_reg.sample_coords = common_reg.coords[idx, :].astype(int)
 
         # solve for int_ambiguity
@@ -410,28 +608,31 @@ def get_common_region_int_ambiguity(ifgram_file, cc_mask_file, water_mask_file=N
         if common_reg.label == label_img[stack_obj.refY, stack_obj.refX]:
             print('{}/{} skip calculation for the reference region'.format(i+1, num_label))
         else:
-            prog_bar = ptime.progressBar(maxValue=num_sample, prefix='{}/{}'.format(i+1, num_label))
-            for j in range(num_sample):
-                # read unwrap phase
-                y, x = common_reg.sample_coords[j, :]
-                unw = ifginv.read_unwrap_phase(stack_obj,
-                                               box=(x, y, x+1, y+1),
-                                               ref_phase=ref_phase,
-                                               obsDatasetName=dsNameIn,
-                                               dropIfgram=True,
-                                               print_msg=False).reshape(num_ifgram, -1)
-
-                # calculate closure_int
-                closure_pha = np.dot(C, unw)
-                closure_int = matrix(np.round((closure_pha - ut.wrap(closure_pha)) / (2.*np.pi)))
-
-                # solve for U
-                U[:,j] = np.round(l1regls(-C, closure_int, alpha=1e-2, show_progress=0)).flatten()
-                prog_bar.update(j+1, every=5)
-            prog_bar.close()
+            # read unwrap phase of all samples
+            unw = read_unwrap_phase_sample(stack_obj, common_reg.sample_coords, ref_phase, dsNameIn=dsNameIn)
+
+            # calculate closure_int
+            closure_pha = C_sparse.dot(unw)
+            closure_int = np.round((closure_pha - ut.wrap(closure_pha)) / (2.*np.pi))
+
+            # solve for U, once for each unique closure_int (all-zero one has zero solution)
+            closure_int_uniq, idx_uniq = np.unique(closure_int.T, axis=0, return_inverse=True)
+            idx_uniq = idx_uniq.flatten()
+            flag = np.any(closure_int_uniq != 0, axis=1)
+            U_uniq = np.zeros((closure_int_uniq.shape[0], num_ifgram))
+            print('{}/{} solve {} unique non-zero closure phase out of {} samples'.format(
+                i+1, num_label, np.sum(flag), num_sample))
+            if executor is not None:
+                U_uniq[flag] = list(executor.map(_solve_int_ambiguity_worker, closure_int_uniq[flag]))
+            else:
+                U_uniq[flag] = [solve_int_ambiguity(C, x) for x in closure_int_uniq[flag]]
+            U = U_uniq[idx_uniq].T
+
         # add int_ambiguity
         common_reg.int_ambiguity = np.median(U, axis=1)
         common_reg.date12_list = date12_list
+    if executor is not None:
+        executor.shutdown()
 
     #sort regions by size to facilitate the region matching later
     common_regions.sort(key=lambda x: x.area, reverse=True)
@@ -452,14 +653,82 @@ def get_common_region_int_ambiguity(ifgram_file, cc_mask_file, water_mask_file=N
     return common_regions
 
 
+def correct_unwrap_error_phase_closure(unw, cc, metadata, common_regions, water_mask=None):
+    """Correct the unwrapping error of one interferogram with the integer ambiguity of the matched common regions.
+    Parameters: unw            : 2D np.ndarray, unwrapped phase
+                cc             : 2D np.ndarray, connected components
+                metadata       : dict, attributes with reference point info
+                common_regions : list of tuple of (sample_y, sample_x, int_ambiguity), the latter in float
+                                 for the interferogram of interest, sorted by the region size
+                water_mask     : 2D np.ndarray in bool, water mask
+    Returns:    unw_cor        : 2D np.ndarray in float32, corrected unwrapped phase
+    """
+    if water_mask is not None:
+        cc[water_mask == 0] = 0
+    cc_obj = connectComponent(conncomp=cc, metadata=metadata)
+    cc_obj.label()
+    label_img = cc_obj.labelImg
+
+    # matching regions: the first / largest common region with all samples in the local region
+    U = np.zeros(cc_obj.numLabel + 1, dtype=np.float32)
+    matched = np.zeros(cc_obj.numLabel + 1, dtype=np.bool_)
+    for y, x, int_ambiguity in common_regions:
+        label = label_img[y[0], x[0]]
+        if label != 0 and not matched[label] and np.all(label_img[y, x] == label):
+            U[label] = 2. * np.pi * int_ambiguity
+            matched[label] = True
+
+    # correct unwrap error, within the bounding box of each local region
+    unw_cor = np.array(unw, dtype=np.float32)
+    for label in np.where(U != 0.)[0]:
+        label_slice = cc_obj.labelSlices[label-1]
+        unw_box = unw_cor[label_slice]
+        unw_box[label_img[label_slice] == label] += U[label]
+    return unw_cor
+
+
+def _init_closure_worker(kwargs):
+    global closure_kwargs
+    closure_kwargs = kwargs
+    return
+
+
+def _correct_unwrap_error_phase_closure_worker(unw, cc=None, idx_common=None):
+    # reference unwrap phase
+    ref_y, ref_x = int(closure_kwargs['metadata']['REF_Y']), int(closure_kwargs['metadata']['REF_X'])
+    unw_cor = np.array(unw, dtype=np.float32)
+    unw_cor -= unw_cor[ref_y, ref_x]
+
+    # update kept interferograms only
+    if cc is not None:
+        common_regions = [(y, x, U[idx_common]) for y, x, U in closure_kwargs['common_regions']]
+        unw_cor = correct_unwrap_error_phase_closure(unw_cor, cc,
+                                                     metadata=closure_kwargs['metadata'],
+                                                     common_regions=common_regions,
+                                                     water_mask=closure_kwargs['water_mask'])
+    return unw_cor
+
+
 def run_unwrap_error_phase_closure(ifgram_file, common_regions, water_mask_file=None, ccName='connectComponent',
-                                   dsNameIn='unwrapPhase', dsNameOut='unwrapPhase_phaseClosure'):
+                                   dsNameIn='unwrapPhase', dsNameOut='unwrapPhase_phaseClosure',
+                                   num_worker=1, resume=False):
+    """Correct the unwrapping error of all interferograms with the integer ambiguity of the common regions
+    Parameters: ifgram_file     : str, path of interferogram stack file
+                common_regions  : list of skimage.measure._regionprops._RegionProperties object,
+                                  from get_common_region_int_ambiguity()
+                water_mask_file : str, path of water mask file
+                ccName          : str, dataset name of connected components
+                dsNameIn        : str, dataset name of unwrap phase to be corrected
+                dsNameOut       : str, dataset name of unwrap phase to be saved after correction
+                num_worker      : int, number of processes to correct the interferograms in parallel
+                resume          : bool, resume from the incomplete output dataset of an interrupted run
+    Returns:    ifgram_file     : str, path of interferogram stack file
+    """
     print('-'*50)
     print('correct unwrapping error in {} with phase closure ...'.format(ifgram_file))
     stack_obj = ifgramStack(ifgram_file)
     stack_obj.open()
     length, width = stack_obj.length, stack_obj.width
-    ref_y, ref_x = stack_obj.refY, stack_obj.refX
     date12_list = stack_obj.get_date12_list(dropIfgram=False)
     num_ifgram = len(date12_list)
     shape_out = (num_ifgram, length, width)
@@ -471,60 +740,44 @@ def run_unwrap_error_phase_closure(ifgram_file, common_regions, water_mask_file=
     else:
         water_mask = None
 
+    # common regions in plain arrays, to be shared with the pool of processes
+    common_region_list = [(common_reg.sample_coords[:,0],
+                           common_reg.sample_coords[:,1],
+                           common_reg.int_ambiguity) for common_reg in common_regions]
+    int_ambiguity = np.array([x[2] for x in common_region_list])
+    key = get_checkpoint_key(ifgram_file, dsNameIn, [ccName, water_mask_file,
+                                                     hashlib.md5(int_ambiguity.tobytes()).hexdigest()])
+
     # prepare output data writing
     print('open {} with r+ mode'.format(ifgram_file))
     f = h5py.File(ifgram_file, 'r+')
     print('input  dataset:', dsNameIn)
     print('output dataset:', dsNameOut)
-    if dsNameOut in f.keys():
-        ds = f[dsNameOut]
-        print('access /{d} of np.float32 in size of {s}'.format(d=dsNameOut, s=shape_out))
-    else:
-        ds = f.create_dataset(dsNameOut,
-                              shape_out,
-                              maxshape=(None, None, None),
-                              chunks=True,
-                              compression=None)
-        print('create /{d} of np.float32 in size of {s}'.format(d=dsNameOut, s=shape_out))
-
-    # correct unwrap error ifgram by ifgram
-    prog_bar = ptime.progressBar(maxValue=num_ifgram)
-    for i in range(num_ifgram):
-        date12 = date12_list[i]
+    ds, num_done = prepare_output_dataset(f, dsNameOut, shape_out, key=key, resume=resume)
 
+    def read_ifgram(i):
         # read unwrap phase to be updated
-        unw_cor = np.squeeze(f[dsNameIn][i, :, :]).astype(np.float32)
-        unw_cor -= unw_cor[ref_y, ref_x]
-
+        unw = np.squeeze(f[dsNameIn][i, :, :])
         # update kept interferograms only
-        if stack_obj.dropIfgram[i]:
-            # get local region info from connectComponent
-            cc = np.squeeze(f[ccName][i, :, :])
-            if water_mask is not None:
-                cc[water_mask == 0] = 0
-            cc_obj = connectComponent(conncomp=cc, metadata=stack_obj.metadata)
-            cc_obj.label()
-            local_regions = measure.regionprops(cc_obj.labelImg)
-
-            # matching regions and correct unwrap error
-            idx_common = common_regions[0].date12_list.index(date12)
-            for local_reg in local_regions:
-                local_mask = cc_obj.labelImg == local_reg.label
-                U = 0
-                for common_reg in common_regions:
-                    y = common_reg.sample_coords[:,0]
-                    x = common_reg.sample_coords[:,1]
-                    if all(local_mask[y, x]):
-                        U = common_reg.int_ambiguity[idx_common]
-                        break
-                unw_cor[local_mask] += 2. * np.pi * U
-
-        # write to hdf5 file
-        ds[i, :, :] = unw_cor
-        prog_bar.update(i+1, suffix=date12)
-    prog_bar.close()
+        if not stack_obj.dropIfgram[i]:
+            return (unw,)
+        # get local region info from connectComponent
+        cc = np.squeeze(f[ccName][i, :, :])
+        idx_common = common_regions[0].date12_list.index(date12_list[i])
+        return (unw, cc, idx_common)
+
+    # correct unwrap error ifgram by ifgram
+    kwargs = dict(metadata=stack_obj.metadata, common_regions=common_region_list, water_mask=water_mask)
+    run_ifgram_correction(ds, read_ifgram,
+                          task_func=_correct_unwrap_error_phase_closure_worker,
+                          initializer=_init_closure_worker,
+                          initargs=(kwargs,),
+                          start_index=num_done,
+                          num_worker=num_worker,
+                          date12_list=date12_list)
     ds.attrs['MODIFICATION_TIME'] = str(time.time())
     f.close()
+    readfile.clear_attribute_cache(ifgram_file)
     print('close {} file.'.format(ifgram_file))
     return ifgram_file
 
@@ -544,19 +797,25 @@ def main(iargs=None):
                                                          cc_mask_file=inps.cc_mask_file,
                                                          water_mask_file=inps.waterMaskFile,
                                                          num_sample=100,
-                                                         dsNameIn=inps.datasetNameIn)
+                                                         dsNameIn=inps.datasetNameIn,
+                                                         num_worker=inps.numWorker)
 
         # apply the integer ambiguity from common conn comp to the whole ifgram
         run_unwrap_error_phase_closure(inps.ifgram_file, common_regions,
                                        water_mask_file=inps.waterMaskFile,
                                        dsNameIn=inps.datasetNameIn,
-                                       dsNameOut=inps.datasetNameOut)
+                                       dsNameOut=inps.datasetNameOut,
+                                       num_worker=inps.numWorker,
+                                       resume=inps.update_mode)
 
     else:
         # calculate the number of triplets with non-zero integer ambiguity
         out_file = calc_num_nonzero_integer_closure_phase(inps.ifgram_file,
                                                           mask_file=inps.waterMaskFile,
                                                           dsName=inps.datasetNameIn,
+                                                          max_memory=inps.maxMemory,
+                                                          num_worker=inps.numWorker,
+                                                          save_stats=inps.saveStats,
                                                           update_mode=inps.update_mode)
         # for debug
         #plot_num_nonzero_integer_closure_phase(out_file)
@@ -370,7 +370,8 @@ def read_point2inps(inps, coord_obj):
         inps.pts_lalo = np.array(inps.pts_lalo).reshape(-1, 2)
         inps.pts_yx = coord_obj.geo2radar(inps.pts_lalo[:, 0],
                                           inps.pts_lalo[:, 1],
-                                          print_msg=False)
+                                          print_msg=False,
+                                          bulk=True)
     if inps.pts_yx is not None:
         inps.pts_yx = np.array(inps.pts_yx).reshape(-1, 2)
     return inps
@@ -10,6 +10,9 @@
 import os
 import re
 import warnings
+import threading
+import collections
+import concurrent.futures
 import xml.etree.ElementTree as ET
 
 import h5py
@@ -25,7 +28,9 @@ from mintpy.objects import (
     ifgramStack,
     timeseriesDatasetNames,
     timeseries,
-    HDFEOS
+    HDFEOS,
+    get_dataset_compression,
+    dequantize_data,
 )
 
 
@@ -228,13 +233,10 @@ def read_hdf5_file(fname, datasetName=None, box=None):
                 atr : dict, metadata
     """
     # File Info: list of slice / dataset / dataset2d / dataset3d
-    slice_list = get_slice_list(fname)
-    ds_list = []
-    for i in [i.split('-')[0] for i in slice_list]:
-        if i not in ds_list:
-            ds_list.append(i)
-    ds_2d_list = [i for i in slice_list if '-' not in i]
-    ds_3d_list = [i for i in ds_list if i not in ds_2d_list]
+    sliceIndex = get_slice_index(fname)
+    slice_list = sliceIndex['sliceList']
+    ds_list = sliceIndex['datasetList']
+    ds_3d_list = sliceIndex['dataset3dList']
 
     # Input Argument: convert input datasetName into list of slice
     if not datasetName:
@@ -270,14 +272,16 @@ def read_hdf5_file(fname, datasetName=None, box=None):
             if not inputDateList or inputDateList == ['']:
                 slice_flag[:] = True
             else:
-                date_list = [i.split('-')[1] for i in
-                             [j for j in slice_list if j.startswith(dsFamily)]]
+                date_index = sliceIndex['dateIndex'][dsFamily]
                 for d in inputDateList:
-                    slice_flag[date_list.index(d)] = True
+                    slice_flag[date_index[d]] = True
 
             # read data
             data = ds[slice_flag, box[1]:box[3], box[0]:box[2]]
             data = np.squeeze(data)
+
+        # decode quantized data, e.g. coherence in uint8
+        data = dequantize_data(data, ds.attrs)
     return data
 
 
@@ -447,12 +451,17 @@ def read_binary_file(fname, datasetName=None, box=None):
 #########################################################################
 def get_slice_list(fname):
     """Get list of 2D slice existed in file (for display)"""
+    return list(get_slice_index(fname)['sliceList'])
+
+
+def get_slice_list_from_file(fname):
+    """Get list of 2D slice existed in file, without cache, check get_slice_list() for details."""
     fbase, fext = os.path.splitext(os.path.basename(fname))
     fext = fext.lower()
     atr = read_attribute(fname)
     k = atr['FILE_TYPE']
 
-    global slice_list
+    slice_list = []
     # HDF5 Files
     if fext in ['.h5', '.he5']:
         with h5py.File(fname, 'r') as f:
@@ -491,7 +500,6 @@ def get_slice_list(fname):
             ## Find slice by walking through the file structure
             length, width = int(atr['LENGTH']), int(atr['WIDTH'])
             def get_hdf5_2d_dataset(name, obj):
-                global slice_list
                 if isinstance(obj, h5py.Dataset) and obj.shape[-2:] == (length, width):
                     if obj.ndim == 2:
                         slice_list.append(name)
@@ -523,15 +531,13 @@ def get_dataset_list(fname, datasetName=None):
     fbase, fext = os.path.splitext(os.path.basename(fname))
     fext = fext.lower()
 
-    global ds_list
+    ds_list = []
     if fext in ['.h5', '.he5']:
         atr = read_attribute(fname)
         length, width = int(atr['LENGTH']), int(atr['WIDTH'])
         def get_hdf5_dataset(name, obj):
-            global ds_list
             if isinstance(obj, h5py.Dataset) and obj.shape[-2:] == (length, width):
                 ds_list.append(name)
-        ds_list = []
         with h5py.File(fname, 'r') as f:
             f.visititems(get_hdf5_dataset)
 
@@ -553,13 +559,133 @@ def get_hdf5_compression(fname):
     compression = None
     ds_name = get_dataset_list(fname)[0]
     with h5py.File(fname, 'r') as f:
-        compression = f[ds_name].compression
+        compression = get_dataset_compression(f[ds_name])
     return compression
 
 
+def get_hdf5_chunks(fname, datasetName=None):
+    """Get the chunk shape of the dataset in the input HDF5 file
+    Parameters: fname       - str, path of HDF5 file
+                datasetName - str, name of dataset, the 1st one by default
+    Returns:    chunks      - tuple of int, chunk shape, None for contiguous layout / non-HDF5 file
+    """
+    ext = os.path.splitext(fname)[1].lower()
+    if ext not in ['.h5','.he5']:
+        return None
+
+    if not datasetName:
+        datasetName = get_dataset_list(fname)[0]
+    with h5py.File(fname, 'r') as f:
+        chunks = f[datasetName].chunks
+    return chunks
+
+
+#########################################################################
+## process-wide cache of read_attribute(), in the order of least recently used,
+## with key   = (file path, datasetName, standardize, metafile_ext) and
+##      value = (stats of the data/metadata files in (path, mtime, size), attributes)
+ATTRIBUTE_CACHE_SIZE = 2000   # max number of cached items, 0 to disable the cache
+attributeCache = collections.OrderedDict()
+attributeCacheLock = threading.Lock()
+
+
+def get_file_stats(fname):
+    """Get the (path, mtime, size) of the data file and its existing metadata files,
+    to check whether the cached attributes are still valid."""
+    fnames = [fname]
+    if os.path.splitext(fname)[1].lower() not in ['.h5', '.he5']:
+        fbases = [fname, os.path.splitext(fname)[0]] if fname.endswith('.img') else [fname]
+        fnames += [i+j for i in fbases for j in ['.rsc', '.xml', '.aux.xml', '.par', '.hdr']]
+
+    stats = []
+    for fname in fnames:
+        try:
+            st = os.stat(fname)
+            stats.append((fname, st.st_mtime_ns, st.st_size))
+        except OSError:
+            pass
+    return tuple(stats)
+
+
+def clear_attribute_cache(fname=None):
+    """Remove the cached attributes and slice index of the given file, or all files if fname is None.
+    Parameters: fname : str, path/name of the data file
+    """
+    with attributeCacheLock:
+        if fname is None:
+            attributeCache.clear()
+            sliceIndexCache.clear()
+        else:
+            fname = os.path.abspath(fname)
+            for key in [i for i in attributeCache.keys() if i[0] == fname]:
+                attributeCache.pop(key)
+            sliceIndexCache.pop(fname, None)
+    return
+
+
 #########################################################################
+## process-wide cache of the slice index of HDF5 files, in the order of least recently used,
+## with key   = file path and
+##      value = (stats of the file in (path, mtime, size), slice index)
+SLICE_INDEX_CACHE_SIZE = 200   # max number of cached files, 0 to disable the cache
+sliceIndexCache = collections.OrderedDict()
+
+
+def get_slice_index(fname):
+    """Get the index of 2D slices existed in file, built once and re-used until the file changes.
+    Parameters: fname : str, path/name of data file
+    Returns:    sliceIndex : dict, with the following items:
+                    sliceList     : list of str, 2D slice names, e.g. timeseries-20150215
+                    datasetList   : list of str, dataset family names, e.g. timeseries, bperp
+                    dataset2dList : list of str, 2D dataset names
+                    dataset3dList : list of str, 3D dataset family names
+                    dateIndex     : dict of dict, index in time domain of each 3D dataset family,
+                                    e.g. {'unwrapPhase' : {'20150215_20150227' : 0, ...}, ...}
+    Examples:
+        sliceIndex = readfile.get_slice_index('timeseries.h5')
+        idx = sliceIndex['dateIndex']['timeseries']['20161020']
+    """
+    use_cache = SLICE_INDEX_CACHE_SIZE > 0 and os.path.isfile(fname)
+    if use_cache:
+        key = os.path.abspath(fname)
+        stats = get_file_stats(fname)
+        with attributeCacheLock:
+            if key in sliceIndexCache.keys() and sliceIndexCache[key][0] == stats:
+                sliceIndexCache.move_to_end(key)
+                return sliceIndexCache[key][1]
+
+    slice_list = get_slice_list_from_file(fname)
+    ds_list = []
+    dateIndex = {}
+    for slice_name in slice_list:
+        dsFamily = slice_name.split('-')[0]
+        if dsFamily not in ds_list:
+            ds_list.append(dsFamily)
+        if '-' in slice_name:
+            date_dict = dateIndex.setdefault(dsFamily, {})
+            date_dict[slice_name.split('-')[1]] = len(date_dict)
+    ds_2d_list = [i for i in slice_list if '-' not in i]
+
+    sliceIndex = {
+        'sliceList'     : slice_list,
+        'datasetList'   : ds_list,
+        'dataset2dList' : ds_2d_list,
+        'dataset3dList' : [i for i in ds_list if i not in ds_2d_list],
+        'dateIndex'     : dateIndex,
+    }
+
+    if use_cache:
+        with attributeCacheLock:
+            sliceIndexCache[key] = (stats, sliceIndex)
+            while len(sliceIndexCache) > SLICE_INDEX_CACHE_SIZE:
+                sliceIndexCache.popitem(last=False)
+    return sliceIndex
+
+
 def read_attribute(fname, datasetName=None, standardize=True, metafile_ext=None):
     """Read attributes of input file into a dictionary
+    The attributes are cached and re-used until the modification time or size of the
+    data file or its metadata file changes, check clear_attribute_cache() to invalidate explicitly.
     Parameters: fname : str, path/name of data file
                 datasetName : str, name of dataset of interest, for file with multiple datasets
                     e.g. unwrapPhase in ifgramStack.h5
@@ -570,6 +696,42 @@ def read_attribute(fname, datasetName=None, standardize=True, metafile_ext=None)
                 standardize : bool, grab standardized metadata key name
     Returns:    atr : dict, attributes dictionary
     """
+    if ATTRIBUTE_CACHE_SIZE <= 0 or not os.path.isfile(fname):
+        return read_attribute_from_file(fname, datasetName, standardize, metafile_ext)
+
+    key = (os.path.abspath(fname), datasetName, standardize, metafile_ext)
+    stats = get_file_stats(fname)
+    with attributeCacheLock:
+        if key in attributeCache.keys() and attributeCache[key][0] == stats:
+            attributeCache.move_to_end(key)
+            return dict(attributeCache[key][1])
+
+    atr = read_attribute_from_file(fname, datasetName, standardize, metafile_ext)
+    with attributeCacheLock:
+        attributeCache[key] = (stats, atr)
+        while len(attributeCache) > ATTRIBUTE_CACHE_SIZE:
+            attributeCache.popitem(last=False)
+    return dict(atr)
+
+
+def read_attributes(fnames, datasetName=None, standardize=True, metafile_ext=None, num_workers=8):
+    """Read attributes of multiple files in parallel, e.g. metadata files of all interferograms.
+    Parameters: fnames      : list of str, path/name of data files
+                num_workers : int, number of threads
+                the others are the same as read_attribute()
+    Returns:    atr_list    : list of dict, attributes dictionary in the same order as fnames
+    """
+    num_workers = max(min(int(num_workers), len(fnames)), 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+        atr_list = list(executor.map(lambda x: read_attribute(x,
+                                                              datasetName=datasetName,
+                                                              standardize=standardize,
+                                                              metafile_ext=metafile_ext), fnames))
+    return atr_list
+
+
+def read_attribute_from_file(fname, datasetName=None, standardize=True, metafile_ext=None):
+    """Read attributes of input file into a dictionary, without cache, check read_attribute() for details."""
     fbase, fext = os.path.splitext(os.path.basename(fname))
     fext = fext.lower()
     if not os.path.isfile(fname):
@@ -616,12 +778,10 @@ def read_attribute(fname, datasetName=None, standardize=True, metafile_ext=None)
                 atr = dict(f.attrs)
             else:
                 # grab the list of attrs in HDF5 file
-                global atr_list
+                atr_list = []
                 def get_hdf5_attrs(name, obj):
-                    global atr_list
                     if len(obj.attrs) > 0 and 'WIDTH' in obj.attrs.keys():
                         atr_list.append(dict(obj.attrs))
-                atr_list = []
                 f.visititems(get_hdf5_attrs)
                 # use the attrs with most items
                 if atr_list:
@@ -647,17 +807,16 @@ def read_attribute(fname, datasetName=None, standardize=True, metafile_ext=None)
             ds = f[datasetName]
         else:
             # get the 1st dataset
-            global ds_list
+            ds_list = []
             def get_hdf5_dataset(name, obj):
-                global ds_list
                 if isinstance(obj, h5py.Dataset) and obj.ndim >= 2:
                     ds_list.append(obj)
-            ds_list = []
             f.visititems(get_hdf5_dataset)
             if ds_list:
                 ds = ds_list[0]
         if ds is not None:
-            atr['DATA_TYPE'] = str(ds.dtype)
+            # quantized data is decoded into float32 while reading
+            atr['DATA_TYPE'] = 'float32' if 'scale_factor' in ds.attrs.keys() else str(ds.dtype)
         f.close()
 
         # 3. PROCESSOR
@@ -1053,7 +1212,7 @@ def attribute_gamma2roipac(par_dict_in):
 #########################################################################
 def read_binary(fname, shape, box=None, data_type='float32', byte_order='l',
                 num_band=1, band_interleave='BIL', band=1, cpx_band='phase'):
-    """Read binary file using np.fromfile
+    """Read binary file using np.memmap, only the box of interest is read from disk
     Parameters: fname : str, path/name of data file to read
                 shape : tuple of 2 int in (length, width)
                 box   : tuple of 4 int in (x0, y0, x1, y1)
@@ -1097,35 +1256,40 @@ def read_binary(fname, shape, box=None, data_type='float32', byte_order='l',
         data_type = '>{}{}'.format(letter, digit)
 
     # read data
-    #data = np.fromfile(fname,
-    #                   dtype=data_type,
-    #                   count=box[3]*width).reshape(-1, width)
-    #data = data[box[1]:box[3],
-    #            box[0]:box[2]]
+    # map the rows of interest only, so that the reading time scales with the box size,
+    # instead of its offset in the file.
+    itemsize = np.dtype(data_type).itemsize
+    num_row = box[3] - box[1]
     band_interleave = band_interleave.upper()
     if band_interleave == 'BIL':
-        data = np.fromfile(fname,
-                           dtype=data_type,
-                           count=box[3]*width*num_band).reshape(-1, width*num_band)
-        data = data[box[1]:box[3],
-                    width*(band-1)+box[0]:width*(band-1)+box[2]]
+        data = np.memmap(fname,
+                         dtype=data_type,
+                         mode='r',
+                         offset=box[1]*width*num_band*itemsize,
+                         shape=(num_row, num_band, width))
+        data = data[:, band-1, box[0]:box[2]]
 
     elif band_interleave == 'BIP':
-        data = np.fromfile(fname,
-                           dtype=data_type,
-                           count=box[3]*width*num_band).reshape(-1, width*num_band)
-        data = data[box[1]:box[3],
-                    np.arange(box[0], box[2])*num_band+band-1]
+        data = np.memmap(fname,
+                         dtype=data_type,
+                         mode='r',
+                         offset=box[1]*width*num_band*itemsize,
+                         shape=(num_row, width, num_band))
+        data = data[:, box[0]:box[2], band-1]
 
     elif band_interleave == 'BSQ':
-        data = np.fromfile(fname,
-                           dtype=data_type,
-                           count=(box[3]+length*(band-1))*width).reshape(-1, width)
-        data = data[length*(band-1)+box[1]:length*(band-1)+box[3],
-                    box[0]:box[2]]
+        data = np.memmap(fname,
+                         dtype=data_type,
+                         mode='r',
+                         offset=(length*(band-1)+box[1])*width*itemsize,
+                         shape=(num_row, width))
+        data = data[:, box[0]:box[2]]
     else:
         raise ValueError('unrecognized band interleaving:', band_interleave)
 
+    # copy into memory and release the memory map
+    data = np.array(data)
+
     # adjust output band for complex data
     if data_type.replace('>', '').startswith('c'):
         if cpx_band.startswith('real'):
@@ -13,7 +13,7 @@ import time
 import glob
 import h5py
 import numpy as np
-from mintpy.objects import deramp, ifgramStack, timeseries, geometryDatasetNames
+from mintpy.objects import deramp, ifgramStack, timeseries, geometryDatasetNames, get_chunk_shape
 from mintpy.utils import ptime, readfile, writefile
 from mintpy.utils.utils0 import *
 
@@ -523,6 +523,7 @@ def add_attribute(File, atr_new=dict(), print_msg=False):
             if print_msg:
                 print('{} = {}'.format(key, str(value)))
     f.close()
+    readfile.clear_attribute_cache(File)
     return File
 
 
@@ -533,12 +534,9 @@ def check_file_size(fname_list, mode_width=None, mode_length=None):
         return fname_list, None, None
 
     # Read Width/Length list
-    width_list = []
-    length_list = []
-    for fname in fname_list:
-        atr = readfile.read_attribute(fname)
-        width_list.append(atr['WIDTH'])
-        length_list.append(atr['LENGTH'])
+    atr_list = readfile.read_attributes(fname_list)
+    width_list = [atr['WIDTH'] for atr in atr_list]
+    length_list = [atr['LENGTH'] for atr in atr_list]
 
     # Mode of Width and Length
     if not mode_width:
@@ -642,6 +640,82 @@ def run_or_skip(out_file, in_file=None, check_readable=True, print_msg=True):
     return 'skip'
 
 
+def parse_memory_size(value):
+    """Convert memory size into number of bytes.
+    Parameters: value - str / float, memory size with unit, e.g. 8GB, 500MB, 2.5G, 4e8B (in bytes),
+                        or number in GB without unit, e.g. 4
+    Returns:    num_byte - float, number of bytes
+    """
+    if isinstance(value, str):
+        value = value.strip().upper()
+        unit_dict = {'K': 1024., 'M': 1024.**2, 'G': 1024.**3, 'T': 1024.**4}
+        if value.endswith('B'):
+            value = value[:-1]
+            if value and value[-1] in unit_dict.keys():
+                return float(value[:-1]) * unit_dict[value[-1]]
+            # bare B for bytes
+            return float(value)
+        if value and value[-1] in unit_dict.keys():
+            return float(value[:-1]) * unit_dict[value[-1]]
+    return float(value) * 1024.**3
+
+
+def split2boxes_by_memory(ds_list, max_memory=4, chunk_shape=None, print_msg=True):
+    """Split the 2D spatial domain into boxes, so that the working set of each box fits into the memory budget.
+    Boxes are full-width row strips if possible, and split in columns as well otherwise.
+    The box edges are aligned with the HDF5 chunk layout, to avoid reading the same chunk multiple times.
+
+    Parameters: ds_list     - list of tuple in (shape, dtype, factor), for each 2D / 3D array
+                              in memory while processing, with shape in (..., length, width),
+                              factor: number of copies of this array in memory,
+                              e.g. [((num_ifgram, length, width), np.float32, 2),
+                                    ((num_date, length, width), np.float32, 1)]
+                max_memory  - str / float, memory budget, e.g. 8GB, 500MB, 4 (in GB)
+                chunk_shape - tuple of int, chunk shape of the input HDF5 dataset,
+                              with the last two dimensions in (rows, cols)
+    Returns:    box_list    - list of tuple of 4 int in (x0, y0, x1, y1)
+    Example:    ds_shape = (num_ifgram, length, width)
+                chunks = readfile.get_hdf5_chunks('inputs/ifgramStack.h5', 'unwrapPhase')
+                box_list = split2boxes_by_memory([(ds_shape, np.float32, 2)], max_memory='8GB', chunk_shape=chunks)
+    """
+    length, width = [int(i) for i in ds_list[0][0][-2:]]
+
+    # number of pixels in each box
+    pixel_size = 0.
+    for shape, dtype, factor in ds_list:
+        pixel_size += np.prod(shape[:-2], dtype=np.int64) * np.dtype(dtype).itemsize * factor
+    num_byte = parse_memory_size(max_memory)
+    num_pixel = max(int(num_byte / pixel_size), 1)
+
+    # row / column step
+    c_row, c_col = chunk_shape[-2:] if chunk_shape else (1, 1)
+    r_step = num_pixel // width
+    if r_step >= min(c_row, length):
+        # full-width row strips
+        if r_step < length:
+            r_step = r_step // c_row * c_row
+        r_step = min(r_step, length)
+        c_step = width
+    else:
+        # split in columns as well, with rows of one chunk
+        r_step = min(c_row, length)
+        c_step = max(num_pixel // r_step, 1)
+        if c_step > c_col:
+            c_step = c_step // c_col * c_col
+
+    box_list = []
+    for y0 in range(0, length, r_step):
+        for x0 in range(0, width, c_step):
+            box = (x0, y0, min(x0+c_step, width), min(y0+r_step, length))
+            box_list.append(box)
+
+    if print_msg and len(box_list) > 1:
+        print('maximum memory size: {:.2f} GB'.format(num_byte / 1024**3))
+        print('split {} lines x {} columns into {} boxes for processing'.format(length, width, len(box_list)))
+        print('    with each box up to {} lines x {} columns'.format(r_step, c_step))
+    return box_list
+
+
 def check_template_auto_value(templateDict, auto_file='../defaults/smallbaselineApp_auto.cfg'):
     """Replace auto value based on the input auto config file."""
     # Read default template value and turn yes/no to True/False
@@ -714,8 +788,10 @@ def run_deramp(fname, ramp_type, mask_file=None, out_file=None, datasetName=None
                 dsOut = f[dsNameOut]
                 print('access HDF5 dataset /{}'.format(dsNameOut))
             else:
-                dsOut = f.create_dataset(dsNameOut, shape=(obj.numIfgram, obj.length, obj.width),
-                                         dtype=np.float32, chunks=True, compression=None)
+                dsShape = (obj.numIfgram, obj.length, obj.width)
+                dsOut = f.create_dataset(dsNameOut, shape=dsShape, dtype=np.float32,
+                                         chunks=get_chunk_shape(dsShape, f.attrs.get('CHUNK_SHAPE', None)),
+                                         compression=None)
                 print('create HDF5 dataset /{}'.format(dsNameOut))
 
             prog_bar = ptime.progressBar(maxValue=obj.numIfgram)
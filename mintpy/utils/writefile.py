@@ -10,11 +10,15 @@
 import os
 import h5py
 import numpy as np
-from mintpy.objects import timeseries
+from mintpy.objects import (timeseries,
+                            get_chunk_shape,
+                            get_compression_kwargs,
+                            get_dataset_compression,
+                            get_dataset_compression_kwargs)
 from mintpy.utils import readfile
 
 
-def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None):
+def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None, chunks=None):
     """ Write one file.
     Parameters: datasetDict : dict of dataset, with key = datasetName and value = 2D/3D array, e.g.:
                     {'height'        : np.ones((   200,300), dtype=np.int16),
@@ -24,7 +28,9 @@ def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None)
                 out_file : str, output file name
                 metadata : dict of attributes
                 ref_file : str, reference file to get auxliary info
-                compression : str, compression while writing to HDF5 file, None, "lzf", "gzip"
+                compression : str, compression while writing to HDF5 file, None, "lzf", "gzip", "blosc", "zstd"
+                chunks : str / tuple of int, chunk policy while writing to HDF5 file, e.g. pixel, slice,
+                         balanced, (None, 128, 128), default: CHUNK_SHAPE in metadata or auto-chunking
     Returns:    out_file : str
     Examples:   dsDict = dict()
                 dsDict['velocity'] = np.ones((200,300), dtype=np.float32)
@@ -70,6 +76,11 @@ def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None)
             if 'date' not in dsNames:
                 raise Exception("Can not write {} file without 'date' dataset!".format(meta['FILE_TYPE']))
 
+        # chunk policy from metadata by default, for datasets in the same 2D size as the file only
+        if chunks is None:
+            chunks = meta.get('CHUNK_SHAPE', None)
+        shape2d = (int(meta.get('LENGTH', 0)), int(meta.get('WIDTH', 0)))
+
         # remove existing file
         if os.path.isfile(out_file):
             print('delete exsited file: {}'.format(out_file))
@@ -90,8 +101,8 @@ def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None)
                                                       c=compression))
                 ds = f.create_dataset(dsName,
                                       data=data,
-                                      chunks=True,
-                                      compression=compression)
+                                      chunks=get_chunk_shape(data.shape, chunks) if data.shape[-2:] == shape2d else True,
+                                      **get_compression_kwargs(compression))
 
             # 2. Write extra/auxliary datasets from ref_file
             if len(auxDsNames) > 0:
@@ -107,7 +118,7 @@ def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None)
                         f.create_dataset(dsName,
                                          data=ds[:],
                                          chunks=True,
-                                         compression=compression)
+                                         **get_compression_kwargs(compression))
 
             # 3. metadata
             for key, value in meta.items():
@@ -182,9 +193,83 @@ def write(datasetDict, out_file, metadata=None, ref_file=None, compression=None)
 
         # write metadata file
         write_roipac_rsc(meta, out_file+'.rsc', print_msg=True)
+    readfile.clear_attribute_cache(out_file)
     return out_file
 
 
+def layout_hdf5(fname, dsNameDict, metadata, compression=None, chunks=None, print_msg=True):
+    """Create HDF5 file with defined metadata and (empty) dataset structure,
+    to be filled block by block with write_hdf5_block().
+    It is also used by timeseries.layout_hdf5() with FILE_TYPE = timeseries.
+    Parameters: fname      : str, HDF5 file path
+                dsNameDict : dict, with key = datasetName and value = (dtype, shape) or (dtype, shape, data)
+                metadata   : dict, metadata
+                compression: str, compression while writing to HDF5 file, None, "lzf", "gzip", "blosc", "zstd"
+                chunks     : str / tuple of int, chunk policy, default: CHUNK_SHAPE in metadata or auto-chunking
+    Returns:    fname      : str, HDF5 file path
+    Example:    dsNameDict = {'temporalCoherence' : (np.float32, (200, 300))}
+                layout_hdf5('temporalCoherence.h5', dsNameDict, metadata=atr)
+    """
+    if print_msg:
+        print('-'*50)
+        print('create HDF5 file: {} with w mode'.format(fname))
+    if chunks is None:
+        chunks = metadata.get('CHUNK_SHAPE', None)
+
+    maxDigit = max([len(i) for i in dsNameDict.keys()])
+    with h5py.File(fname, 'w') as f:
+        for key, value in dsNameDict.items():
+            dsChunks = get_chunk_shape(value[1], chunks)
+            if print_msg:
+                print(('create dataset /{d:<{w}} of {t:<25} in size of {s:<20} '
+                       'with compression={c}, chunks={k}').format(d=key,
+                                                                  w=maxDigit,
+                                                                  t=str(value[0]),
+                                                                  s=str(value[1]),
+                                                                  c=compression,
+                                                                  k=dsChunks))
+            ds = f.create_dataset(key,
+                                  shape=value[1],
+                                  dtype=value[0],
+                                  chunks=dsChunks,
+                                  **get_compression_kwargs(compression))
+            if len(value) > 2 and value[2] is not None:
+                ds[:] = value[2]
+
+        # write attributes
+        for key, value in metadata.items():
+            f.attrs[key] = str(value)
+    if print_msg:
+        print('close  HDF5 file: {}'.format(fname))
+    readfile.clear_attribute_cache(fname)
+    return fname
+
+
+def write_hdf5_block(fname, data, datasetName, block=None, mode='a', print_msg=True):
+    """Write data to an existing HDF5 dataset in disk block by block.
+    Parameters: fname       : str, HDF5 file path
+                data        : np.ndarray, 1/2/3D matrix
+                datasetName : str, dataset name
+                block       : list of 2/4/6 int, for
+                    [zStart, zEnd,
+                     yStart, yEnd,
+                     xStart, xEnd]
+                mode        : str, open mode
+    Returns:    fname       : str, HDF5 file path
+    """
+    if block is None:
+        block = []
+        for num in np.array(data).shape:
+            block += [0, num]
+
+    if print_msg:
+        print('write dataset /{:<25} block: {} to file: {}'.format(datasetName, block, fname))
+    slices = tuple(slice(block[i], block[i+1]) for i in range(0, len(block), 2))
+    with h5py.File(fname, mode) as f:
+        f[datasetName][slices] = data
+    return fname
+
+
 def remove_hdf5_dataset(fname, datasetNames, print_msg=True):
     """Remove an existing dataset from an HDF5 file.
     Parameters: fname : str, HDF5 file name/path
@@ -212,14 +297,19 @@ def remove_hdf5_dataset(fname, datasetNames, print_msg=True):
     fo = h5py.File(fname, 'w')
 
     # datasets
-    compression = None
     maxDigit = max([len(i) for i in list(fi.keys())])
     for dsName in [i for i in fi.keys() if i not in datasetNames]:
         ds = fi[dsName]
         if print_msg:
             print('create dataset /{d:<{w}} of {t:<10} in size of {s:<20} with compression={c}'.format(
-                d=dsName, w=maxDigit, t=str(ds.dtype), s=str(ds.shape), c=compression))
-        fo.create_dataset(dsName, data=ds[:], chunks=True, compression=compression)
+                d=dsName, w=maxDigit, t=str(ds.dtype), s=str(ds.shape), c=get_dataset_compression(ds)))
+        # keep the chunk layout, compression and attributes (e.g. scale_factor) of the input file
+        dsOut = fo.create_dataset(dsName,
+                                  data=ds[:],
+                                  chunks=ds.chunks if ds.chunks else True,
+                                  **get_dataset_compression_kwargs(ds))
+        for key, value in ds.attrs.items():
+            dsOut.attrs[key] = value
 
     # metadata
     for key, value in fi.attrs.items():
@@ -229,6 +319,7 @@ def remove_hdf5_dataset(fname, datasetNames, print_msg=True):
     if print_msg:
         print('finished writing to {}'.format(fname))
         print('old file is now saved as: {}. Use rm command to delete it.'.format(temp_file))
+    readfile.clear_attribute_cache(fname)
     return fname
 
 
@@ -274,6 +365,8 @@ def write_roipac_rsc(metadata, out_file, update_mode=False, print_msg=False):
                 f.write('{k:<{d}}    {v}\n'.format(k=str(key),
                                                    d=maxDigit,
                                                    v=str(metadata[key])))
+    # metadata of the data file is changed
+    readfile.clear_attribute_cache(os.path.splitext(out_file)[0])
     return out_file
 
 
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+############################################################
+# Unit tests for coordinate conversion with lookup table in radar coord
+#   python -m pytest test/test_coord.py
+#   python test/test_coord.py
+
+
+import os
+import tempfile
+import unittest
+import h5py
+import numpy as np
+
+from mintpy.utils import utils as ut
+
+
+class TestGeo2RadarBulk(unittest.TestCase):
+    """Compare geo2radar(bulk=True) with the default buffer search and the true row/col,
+    for a synthetic lookup table in radar coord with smooth and slightly curved lat/lon."""
+    length, width = 300, 200
+
+    @staticmethod
+    def row_col2lat_lon(row, col):
+        lat = 30. + 0.0009 * row + 0.0001 * col + 1e-7 * col**2
+        lon = 100. + 0.001 * col - 0.0002 * row
+        return lat, lon
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.lookup_file = os.path.join(self.tmp_dir.name, 'geometryRadar.h5')
+        rows, cols = np.mgrid[0:self.length, 0:self.width].astype(np.float64)
+        lat, lon = self.row_col2lat_lon(rows, cols)
+        with h5py.File(self.lookup_file, 'w') as f:
+            f.create_dataset('latitude', data=lat.astype(np.float32))
+            f.create_dataset('longitude', data=lon.astype(np.float32))
+            f.attrs['FILE_TYPE'] = 'geometry'
+            f.attrs['LENGTH'] = str(self.length)
+            f.attrs['WIDTH'] = str(self.width)
+
+        # pixel size of ~100 m on the ground, similar to the lookup table
+        self.atr = {'LENGTH': str(self.length), 'WIDTH': str(self.width), 'PROCESSOR': 'isce',
+                    'EARTH_RADIUS': '6371000', 'HEIGHT': '700000', 'STARTING_RANGE': '850000'}
+        self.atr['AZIMUTH_PIXEL_SIZE'] = str(100. * (6371e3 + 700e3) / 6371e3)
+        self.atr['RANGE_PIXEL_SIZE'] = '10'
+        inc_angle = ut.incidence_angle(self.atr, dimension=0, print_msg=False)
+        self.atr['RANGE_PIXEL_SIZE'] = str(96. * np.sin(inc_angle * np.pi / 180.))
+
+        rng = np.random.default_rng(1)
+        self.row = rng.uniform(5, self.length - 6, 300)
+        self.col = rng.uniform(5, self.width - 6, 300)
+        self.lat, self.lon = self.row_col2lat_lon(self.row, self.col)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_bulk_vs_loop(self):
+        coord = ut.coordinate(self.atr, lookup_file=self.lookup_file)
+        az_bulk, rg_bulk = coord.geo2radar(self.lat, self.lon, print_msg=False, bulk=True)[0:2]
+        az_loop, rg_loop = coord.geo2radar(self.lat, self.lon, print_msg=False)[0:2]
+        az_true = np.floor(self.row).astype(int)
+        rg_true = np.floor(self.col).astype(int)
+
+        # bulk: within 1 pixel of the truth, and at least as accurate as the buffer search
+        self.assertLessEqual(np.max(np.abs(az_bulk - az_true)), 1)
+        self.assertLessEqual(np.max(np.abs(rg_bulk - rg_true)), 1)
+        err_bulk = np.mean(np.hypot(az_bulk - az_true, rg_bulk - rg_true))
+        err_loop = np.mean(np.hypot(az_loop - az_true, rg_loop - rg_true))
+        self.assertLessEqual(err_bulk, err_loop)
+
+        # consistent with the buffer search, within its own uncertainty
+        self.assertLessEqual(np.max(np.abs(az_bulk - az_loop)), 2)
+        self.assertLessEqual(np.max(np.abs(rg_bulk - rg_loop)), 2)
+
+    def test_single_point(self):
+        coord = ut.coordinate(self.atr, lookup_file=self.lookup_file)
+        az, rg = coord.geo2radar(self.lat[:1], self.lon[:1], print_msg=False, bulk=True)[0:2]
+        self.assertEqual(az.shape, (1,))
+        self.assertLessEqual(abs(az[0] - np.floor(self.row[0])), 1)
+        self.assertLessEqual(abs(rg[0] - np.floor(self.col[0])), 1)
+
+    def test_outside_coverage(self):
+        coord = ut.coordinate(self.atr, lookup_file=self.lookup_file)
+        with self.assertRaises(RuntimeError):
+            coord.geo2radar(np.array([10.]), np.array([10.]), print_msg=False, bulk=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+############################################################
+# Unit tests for the DEM error estimation
+#   python -m pytest test/test_dem_error.py
+#   python test/test_dem_error.py
+
+
+import unittest
+import numpy as np
+
+from mintpy import dem_error
+
+
+class TestEstimateDemErrorBatch(unittest.TestCase):
+    """estimate_dem_error_batch() should give the same result as estimate_dem_error() pixel by pixel."""
+    num_date = 30
+    num_pixel = 200
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.tbase = np.sort(rng.uniform(0, 4, self.num_date)).reshape(-1, 1)
+        self.tbase -= self.tbase[0]
+
+        # geometry column: perpendicular baseline / (range * sin(inc_angle)), varying per pixel
+        bperp = rng.normal(scale=100., size=(self.num_date, 1))
+        bperp -= bperp[0]
+        scale = 1. / (rng.uniform(8.0e5, 9.0e5, self.num_pixel) * np.sin(rng.uniform(0.5, 0.8, self.num_pixel)))
+        self.A_geom = bperp * scale
+        # rank deficient pixels: no geometry, or geometry within the column space of the deformation model
+        self.A_geom[:, 0] = 0.
+        self.A_geom[:, 1] = 1e-4 * self.tbase[:, 0]
+
+        # time-series: DEM error + linear / quadratic deformation + step + noise
+        delta_z = rng.normal(scale=10., size=self.num_pixel)
+        vel = rng.normal(scale=0.02, size=self.num_pixel)
+        acc = rng.normal(scale=0.005, size=self.num_pixel)
+        step = np.array(self.tbase[:, 0] > 2., np.float64).reshape(-1, 1) * rng.normal(scale=0.01, size=self.num_pixel)
+        self.ts = (self.A_geom * delta_z + self.tbase * vel + self.tbase**2 * acc + step
+                   + rng.normal(scale=0.002, size=(self.num_date, self.num_pixel)))
+
+        self.drop_date = np.ones(self.num_date, dtype=np.bool_)
+        self.drop_date[[3, 10, 17]] = False
+
+    def get_design_matrix4deformation(self, num_step=0):
+        A_def = np.hstack((np.ones((self.num_date, 1)), self.tbase, self.tbase**2 / 2.))
+        for t_step in [2., 3.][:num_step]:
+            A_def = np.hstack((A_def, np.array(self.tbase > t_step, np.float64)))
+        return A_def
+
+    def compare(self, drop_date=None, phaseVelocity=False, num_step=0):
+        A_def = self.get_design_matrix4deformation(num_step)
+        delta_z, ts_cor, ts_res, step_def = dem_error.estimate_dem_error_batch(self.ts, self.A_geom, A_def,
+                                                                               tbase=self.tbase,
+                                                                               drop_date=drop_date,
+                                                                               phaseVelocity=phaseVelocity,
+                                                                               num_step=num_step)
+        for i in range(self.num_pixel):
+            A = np.hstack((self.A_geom[:, i:i+1], A_def))
+            delta_z_i, ts_cor_i, ts_res_i, step_def_i = dem_error.estimate_dem_error(self.ts[:, i], A,
+                                                                                     tbase=self.tbase,
+                                                                                     drop_date=drop_date,
+                                                                                     phaseVelocity=phaseVelocity,
+                                                                                     num_step=num_step)
+            msg = 'pixel {}'.format(i)
+            self.assertTrue(np.allclose(delta_z[i], delta_z_i, rtol=1e-5, atol=1e-6), msg)
+            self.assertTrue(np.allclose(ts_cor[:, i], ts_cor_i[:, 0], rtol=1e-5, atol=1e-7), msg)
+            self.assertTrue(np.allclose(ts_res[:, i], ts_res_i[:, 0], rtol=1e-5, atol=1e-7), msg)
+            if num_step > 0:
+                self.assertTrue(np.allclose(step_def[:, i], step_def_i[:, 0], rtol=1e-5, atol=1e-7), msg)
+            else:
+                self.assertIsNone(step_def)
+
+    def test_phase(self):
+        self.compare()
+        self.compare(drop_date=self.drop_date)
+
+    def test_phase_velocity(self):
+        self.compare(phaseVelocity=True)
+        self.compare(drop_date=self.drop_date, phaseVelocity=True)
+
+    def test_step_function(self):
+        for phaseVelocity in [False, True]:
+            self.compare(num_step=2, phaseVelocity=phaseVelocity)
+            self.compare(drop_date=self.drop_date, num_step=2, phaseVelocity=phaseVelocity)
+
+
+if __name__ == '__main__':
+    unittest.main()
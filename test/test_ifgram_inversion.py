@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+############################################################
+# Unit tests for the network inversion
+#   python -m pytest test/test_ifgram_inversion.py
+#   python test/test_ifgram_inversion.py
+
+
+import unittest
+import numpy as np
+
+from mintpy.objects import ifgramStack
+from mintpy import ifgram_inversion as ifginv
+
+
+def get_network(date_list, max_step=3):
+    """Design matrices of a network connecting each acquisition to the next max_step ones."""
+    date12_list = ['{}_{}'.format(date_list[i], date_list[j])
+                   for i in range(len(date_list))
+                   for j in range(i+1, min(i+1+max_step, len(date_list)))]
+    A, B = ifgramStack.get_design_matrix4timeseries(date12_list)
+    return A, B, date12_list
+
+
+class InversionTestCase(unittest.TestCase):
+    """Synthetic network of 12 acquisitions with noise and some zero phase."""
+    date_list = ['2018{:02d}01'.format(i+1) for i in range(12)]
+    num_pixel = 400
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.A, self.B = get_network(self.date_list)[0:2]
+        num_ifgram, num_param = self.A.shape
+
+        # temporal baseline
+        tbase = np.array([int(i[4:6]) - 1 for i in self.date_list], dtype=np.float32) / 12.
+        self.tbase_diff = np.diff(tbase).reshape(-1, 1)
+
+        # observation with noise and some zero phase (invalid) for a subset of pixels in a few patterns
+        ts = np.cumsum(rng.normal(size=(num_param, self.num_pixel)), axis=0)
+        self.ifgram = (np.dot(self.A, ts) + rng.normal(scale=0.3, size=(num_ifgram, self.num_pixel))).astype(np.float32)
+        for i in range(20):
+            pix = rng.choice(self.num_pixel, size=15, replace=False)
+            ifg = rng.choice(num_ifgram, size=rng.integers(1, 8), replace=False)
+            self.ifgram[np.ix_(ifg, pix)] = 0.
+        # pixels without any valid data for the last acquisition: redundancy < 1
+        self.ifgram[-3:, :5] = 0.
+        self.weight_sqrt = rng.uniform(0.2, 1., size=self.ifgram.shape).astype(np.float32)
+
+
+class TestEstimateTimeseriesBatch(InversionTestCase):
+    """estimate_timeseries_batch() should give the same result as estimate_timeseries() pixel by pixel."""
+
+    def compare(self, A, B, ifgram, weight_sqrt=None, min_norm_velocity=True):
+        ts, temp_coh, num_inv_ifg = ifginv.estimate_timeseries_batch(A, B, self.tbase_diff, ifgram,
+                                                                     weight_sqrt=weight_sqrt,
+                                                                     min_norm_velocity=min_norm_velocity,
+                                                                     print_msg=False)
+        self.assertGreater(np.sum(num_inv_ifg > 0), ifgram.shape[1] // 2)
+        for i in range(ifgram.shape[1]):
+            w_i = weight_sqrt[:, i:i+1] if weight_sqrt is not None else None
+            ts_i, temp_coh_i, num_inv_ifg_i = ifginv.estimate_timeseries(A, B, self.tbase_diff, ifgram[:, i:i+1],
+                                                                        weight_sqrt=w_i,
+                                                                        min_norm_velocity=min_norm_velocity)
+            self.assertTrue(np.allclose(ts[:, i], ts_i.flatten(), atol=1e-5, rtol=1e-5), 'pixel {}'.format(i))
+            self.assertAlmostEqual(float(temp_coh[i]), float(temp_coh_i), delta=1e-5)
+            self.assertEqual(int(num_inv_ifg[i]), int(num_inv_ifg_i))
+
+    def test_unweighted(self):
+        self.compare(self.A, self.B, self.ifgram)
+        self.compare(self.A, self.B, self.ifgram, min_norm_velocity=False)
+
+    def test_weighted(self):
+        self.compare(self.A, self.B, self.ifgram, weight_sqrt=self.weight_sqrt)
+        self.compare(self.A, self.B, self.ifgram, weight_sqrt=self.weight_sqrt, min_norm_velocity=False)
+
+    def test_rank_deficient(self):
+        # network of two disconnected subsets: rank deficient but with redundancy >= 1
+        date12_list = get_network(self.date_list)[2]
+        flag = np.array([not (i.split('_')[0] < '20180601' < i.split('_')[1]) for i in date12_list])
+        flag &= np.array([not (i.split('_')[0] < '20180701' <= i.split('_')[1]) for i in date12_list])
+        A, B = self.A[flag], self.B[flag]
+        self.assertLess(np.linalg.matrix_rank(B), B.shape[1])
+        ifgram = self.ifgram[flag]
+        weight_sqrt = self.weight_sqrt[flag]
+        for min_norm_velocity in [True, False]:
+            self.compare(A, B, ifgram, min_norm_velocity=min_norm_velocity)
+            self.compare(A, B, ifgram, weight_sqrt=weight_sqrt, min_norm_velocity=min_norm_velocity)
+
+    def test_small_memory(self):
+        # stacked solve in many steps of one pixel
+        ts = ifginv.estimate_timeseries_batch(self.A, self.B, self.tbase_diff, self.ifgram,
+                                              weight_sqrt=self.weight_sqrt, max_memory=1e-9,
+                                              print_msg=False)[0]
+        ts_ref = ifginv.estimate_timeseries_batch(self.A, self.B, self.tbase_diff, self.ifgram,
+                                                  weight_sqrt=self.weight_sqrt, print_msg=False)[0]
+        self.assertTrue(np.allclose(ts, ts_ref, atol=1e-6))
+
+
+class TestDesignMatrixCache(InversionTestCase):
+    """A cache hit should give the same solution as a fresh factorization."""
+
+    def test_hit(self):
+        cache = ifginv.designMatrixCache()
+        for weight_sqrt in [None, self.weight_sqrt]:
+            # 1st call fills the cache, 2nd call hits it for all patterns
+            ifginv.estimate_timeseries_batch(self.A, self.B, self.tbase_diff, self.ifgram,
+                                             weight_sqrt=weight_sqrt, cache=cache, print_msg=False)
+            num_miss = cache.num_miss
+            out = ifginv.estimate_timeseries_batch(self.A, self.B, self.tbase_diff, self.ifgram,
+                                                   weight_sqrt=weight_sqrt, cache=cache, print_msg=False)
+            self.assertEqual(cache.num_miss, num_miss)
+            self.assertGreater(cache.num_hit, 0)
+
+            out_ref = ifginv.estimate_timeseries_batch(self.A, self.B, self.tbase_diff, self.ifgram,
+                                                       weight_sqrt=weight_sqrt, print_msg=False)
+            for data, data_ref in zip(out, out_ref):
+                self.assertTrue(np.array_equal(data, data_ref))
+
+    def test_entry(self):
+        idx = np.ones(self.A.shape[0], dtype=np.bool_)
+        idx[[2, 5]] = False
+        cache = ifginv.designMatrixCache()
+        cache.set_design_matrix(self.A, self.B)
+        cache.get(self.A, self.B, idx)
+        entry = cache.get(self.A, self.B, idx)
+        self.assertEqual(cache.num_hit, 1)
+
+        entry_ref = ifginv.designMatrixCache().get(self.A, self.B, idx)
+        for key in ['redundant', 'invertible', 'full_rank']:
+            self.assertEqual(entry[key], entry_ref[key])
+        self.assertTrue(np.array_equal(entry['pinv'], entry_ref['pinv']))
+
+    def test_different_network(self):
+        cache = ifginv.designMatrixCache()
+        cache.set_design_matrix(self.A, self.B)
+        cache.get(self.A, self.B, np.ones(self.A.shape[0], dtype=np.bool_))
+        self.assertEqual(len(cache), 1)
+        cache.set_design_matrix(self.A, self.B)
+        self.assertEqual(len(cache), 1)
+        cache.set_design_matrix(self.A[1:], self.B[1:])
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+############################################################
+# Unit tests for rechunk.py
+#   python -m pytest test/test_rechunk.py
+#   python test/test_rechunk.py
+
+
+import os
+import tempfile
+import unittest
+import h5py
+import numpy as np
+
+from mintpy.objects import get_compression_kwargs, get_dataset_compression
+from mintpy import rechunk
+
+
+class TestRechunkFile(unittest.TestCase):
+    """Compression of both the 3D and the non-2D datasets should be kept after rechunking."""
+    length, width = 20, 30
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_rechunk(self, compression):
+        try:
+            compKwargs = get_compression_kwargs(compression)
+        except ImportError:
+            self.skipTest('hdf5plugin is not installed')
+
+        rng = np.random.default_rng(0)
+        data = rng.random((5, self.length, self.width)).astype(np.float32)
+        bperp = rng.random(5).astype(np.float32)
+        fname = os.path.join(self.tmp_dir.name, 'timeseries.h5')
+        out_file = os.path.join(self.tmp_dir.name, 'timeseries_rechunk.h5')
+        with h5py.File(fname, 'w') as f:
+            f.create_dataset('timeseries', data=data, chunks=(5, 10, 10), **compKwargs)
+            f.create_dataset('bperp', data=bperp, chunks=True, **compKwargs)
+            f['bperp'].attrs['UNIT'] = 'm'
+            f.attrs['LENGTH'] = str(self.length)
+            f.attrs['WIDTH'] = str(self.width)
+
+        rechunk.rechunk_file(fname, chunks='pixel', out_file=out_file)
+        with h5py.File(out_file, 'r') as f:
+            for dsName, data_ref in [('timeseries', data), ('bperp', bperp)]:
+                self.assertEqual(get_dataset_compression(f[dsName]), compression)
+                self.assertTrue(np.array_equal(f[dsName][()], data_ref))
+            self.assertEqual(f['bperp'].attrs['UNIT'], 'm')
+
+    def test_gzip(self):
+        self.run_rechunk('gzip')
+
+    def test_zstd(self):
+        self.run_rechunk('blosc:zstd')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+############################################################
+# Unit tests for writing ifgramStack.h5 from ifgramStackDict
+#   python -m pytest test/test_stackDict.py
+#   python test/test_stackDict.py
+
+
+import os
+import tempfile
+import unittest
+import h5py
+import numpy as np
+
+from mintpy.objects import ifgramStack
+from mintpy.objects.stackDict import ifgramDict, ifgramStackDict
+
+
+class TestAppendConnectComponent(unittest.TestCase):
+    """Labels of connectComponent in int8 from ISCE, stored in uint8 with quantize,
+    for pairs both written at once and appended."""
+    date_list = ['20180101', '20180113', '20180125', '20180206']
+    length, width = 10, 12
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(2)
+        self.pairs = [(self.date_list[i], self.date_list[i+1]) for i in range(len(self.date_list)-1)]
+        self.pairs += [(self.date_list[0], self.date_list[2])]
+        self.pairsDict = {}
+        self.labels = {}
+        for i, pair in enumerate(self.pairs):
+            # labels up to 255, e.g. 200, which is -56 in int8
+            label = rng.integers(0, 256, size=(self.length, self.width)).astype(np.uint8)
+            label[0, 0] = 200
+            self.labels[pair] = label
+            unw = rng.random((self.length, self.width)).astype(np.float32)
+            datasetDict = {'unwrapPhase'      : self.write_file(pair, 'unw', unw, i),
+                           'connectComponent' : self.write_file(pair, 'conncomp', label.view(np.int8), i)}
+            self.pairsDict[pair] = ifgramDict(dates=pair, datasetDict=datasetDict)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_file(self, pair, suffix, data, i):
+        fname = os.path.join(self.tmp_dir.name, '{}_{}_{}.h5'.format(pair[0], pair[1], suffix))
+        with h5py.File(fname, 'w') as f:
+            f.create_dataset(suffix, data=data)
+            f.attrs['FILE_TYPE'] = suffix
+            f.attrs['LENGTH'] = str(self.length)
+            f.attrs['WIDTH'] = str(self.width)
+            f.attrs['P_BASELINE_TOP_HDR'] = str(10. * i)
+            f.attrs['P_BASELINE_BOTTOM_HDR'] = str(10. * i)
+        return fname
+
+    def check_labels(self, fname):
+        stack_obj = ifgramStack(fname)
+        stack_obj.open(print_msg=False)
+        with h5py.File(fname, 'r') as f:
+            self.assertEqual(f['connectComponent'].dtype, np.uint8)
+        data = stack_obj.read(datasetName='connectComponent', print_msg=False)
+        for i, date12 in enumerate(stack_obj.get_date12_list(dropIfgram=False)):
+            pair = tuple(date12.split('_'))
+            self.assertTrue(np.array_equal(data[i], self.labels[pair]))
+
+    def test_write(self):
+        fname = os.path.join(self.tmp_dir.name, 'ifgramStack.h5')
+        ifgramStackDict(pairsDict=self.pairsDict).write2hdf5(fname, quantize=True)
+        self.check_labels(fname)
+
+    def test_append(self):
+        fname = os.path.join(self.tmp_dir.name, 'ifgramStack.h5')
+        pairs_exist = self.pairs[:2]
+        ifgramStackDict(pairsDict={p: self.pairsDict[p] for p in pairs_exist}).write2hdf5(fname, quantize=True)
+        ifgramStackDict(pairsDict=self.pairsDict).append2hdf5(fname)
+        self.check_labels(fname)
+
+
+if __name__ == '__main__':
+    unittest.main()
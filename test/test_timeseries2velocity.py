@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+############################################################
+# Unit tests for timeseries2velocity.py
+#   python -m pytest test/test_timeseries2velocity.py
+#   python test/test_timeseries2velocity.py
+
+
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from mintpy.objects import timeseries
+from mintpy.utils import readfile
+from mintpy import timeseries2velocity
+
+
+class TestEstimateVelocity(unittest.TestCase):
+    """Linear time-series of 10 mm/year, stored in m and in mm."""
+    date_list = ['20180101', '20180301', '20180501', '20180701', '20180901', '20190101']
+    length, width = 20, 30
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_velocity(self, unit):
+        scale = 1000. if unit == 'mm' else 1.
+        yr_diff = timeseries.get_design_matrix4average_velocity(self.date_list)[:, 0]
+        data = np.tile((0.01 * scale * yr_diff).reshape(-1, 1, 1), (1, self.length, self.width))
+        atr = {'FILE_TYPE': 'timeseries', 'UNIT': unit, 'REF_DATE': self.date_list[0],
+               'LENGTH': str(self.length), 'WIDTH': str(self.width)}
+
+        ts_file = os.path.join(self.tmp_dir.name, 'timeseries_{}.h5'.format(unit))
+        vel_file = os.path.join(self.tmp_dir.name, 'velocity_{}.h5'.format(unit))
+        timeseries(ts_file).write2hdf5(data, dates=self.date_list, bperp=np.zeros(len(self.date_list)),
+                                       metadata=atr)
+        timeseries2velocity.main([ts_file, '-o', vel_file])
+
+        vel, vel_atr = readfile.read(vel_file, datasetName='velocity')
+        self.assertEqual(vel_atr['UNIT'], 'm/year')
+        self.assertTrue(np.allclose(vel, 0.01, rtol=1e-4))
+
+    def test_unit_m(self):
+        self.run_velocity('m')
+
+    def test_unit_mm(self):
+        self.run_velocity('mm')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+############################################################
+# Unit tests for utilities of block-wise processing
+#   python -m pytest test/test_utils.py
+#   python test/test_utils.py
+
+
+import os
+import tempfile
+import unittest
+import h5py
+import numpy as np
+
+from mintpy.utils import utils as ut
+from mintpy.objects import timeseries
+from mintpy import ifgram_inversion as ifginv
+
+
+class TestParseMemorySize(unittest.TestCase):
+    def test_unit(self):
+        self.assertEqual(ut.parse_memory_size('8GB'), 8 * 1024.**3)
+        self.assertEqual(ut.parse_memory_size('2.5G'), 2.5 * 1024.**3)
+        self.assertEqual(ut.parse_memory_size('500MB'), 500 * 1024.**2)
+        self.assertEqual(ut.parse_memory_size('1kb'), 1024.)
+
+    def test_no_unit_in_GB(self):
+        self.assertEqual(ut.parse_memory_size(4), 4 * 1024.**3)
+        self.assertEqual(ut.parse_memory_size('4'), 4 * 1024.**3)
+
+    def test_bytes(self):
+        self.assertEqual(ut.parse_memory_size('512B'), 512.)
+        self.assertEqual(ut.parse_memory_size('400000000.0B'), 4e8)
+
+
+class TestSplit2Boxes(unittest.TestCase):
+    def check_boxes(self, box_list, shape):
+        # boxes cover the whole 2D domain without overlap
+        cover = np.zeros(shape[-2:], dtype=np.int16)
+        for x0, y0, x1, y1 in box_list:
+            cover[y0:y1, x0:x1] += 1
+        self.assertTrue(np.all(cover == 1))
+
+    def test_chunk_size(self):
+        # without max_memory: at most chunk_size data per box
+        shape = (100, 5000, 5000)
+        box_list = ifginv.split2boxes(shape, chunk_size=100e6, chunk_shape=(128, 128, 128), print_msg=False)
+        self.assertGreater(len(box_list), 1)
+        self.check_boxes(box_list, shape)
+        for x0, y0, x1, y1 in box_list:
+            self.assertLessEqual(shape[0] * (y1 - y0) * (x1 - x0), 100e6)
+            self.assertTrue(y0 % 128 == 0)
+
+    def test_max_memory(self):
+        shape = (100, 5000, 5000)
+        box_list = ifginv.split2boxes(shape, max_memory='1GB', chunk_shape=(128, 128, 128), print_msg=False)
+        self.assertGreater(len(box_list), 1)
+        self.check_boxes(box_list, shape)
+        # working set: observation x 2 + time-series x 2, in float32
+        for x0, y0, x1, y1 in box_list:
+            self.assertLessEqual(shape[0] * 4 * 4 * (y1 - y0) * (x1 - x0), 1024**3)
+
+    def test_max_memory_weighted(self):
+        # memory of the stacked solve for the weighted inversion is reserved from the budget
+        shape = (1000, 2000, 2000)
+        num_date = 300
+        box_list = ifginv.split2boxes(shape, max_memory='2GB', num_date=num_date, weighted=True,
+                                      chunk_shape=(128, 128, 128), print_msg=False)
+        self.check_boxes(box_list, shape)
+        gg_size, pixel_size = ifginv.get_batch_memory(shape[0], num_date - 1)
+        reserve = max(ifginv.BATCH_MAX_MEMORY * 1024**3, gg_size + pixel_size)
+        for x0, y0, x1, y1 in box_list:
+            box_size = (shape[0] * 4 * 4 + num_date * 4 * 2) * (y1 - y0) * (x1 - x0)
+            self.assertLessEqual(box_size + reserve, 2 * 1024**3)
+
+
+class TestReadMemmap(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data = np.random.default_rng(0).random((13, 70, 90)).astype(np.float32)
+        self.date_list = ['201801{:02d}'.format(i+1) for i in range(13)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_file(self, fname, **kwargs):
+        fname = os.path.join(self.tmp_dir.name, fname)
+        with h5py.File(fname, 'w') as f:
+            f.create_dataset('timeseries', data=self.data, **kwargs)
+            f.create_dataset('date', data=np.array(self.date_list, dtype=np.string_))
+            f.attrs['FILE_TYPE'] = 'timeseries'
+            f.attrs['LENGTH'] = str(self.data.shape[1])
+            f.attrs['WIDTH'] = str(self.data.shape[2])
+        return fname
+
+    def check_read(self, fname):
+        obj = timeseries(fname)
+        for dates, box in [(None, None),
+                           (self.date_list[3:9], (17, 5, 88, 66)),
+                           (self.date_list[::4], (0, 69, 1, 70)),
+                           (self.date_list[-1], (30, 20, 31, 21))]:
+            data = obj.read(datasetName=dates, box=box, print_msg=False, mmap=True)
+            data_ref = obj.read(datasetName=dates, box=box, print_msg=False)
+            self.assertTrue(np.array_equal(data, data_ref))
+
+    def test_contiguous(self):
+        self.check_read(self.write_file('ts_contiguous.h5', chunks=None))
+
+    def test_chunked(self):
+        self.check_read(self.write_file('ts_chunked.h5', chunks=(4, 16, 32)))
+        self.check_read(self.write_file('ts_chunked_be.h5', chunks=(5, 7, 11), dtype='>f4'))
+
+    def test_compressed(self):
+        self.check_read(self.write_file('ts_compressed.h5', chunks=(4, 16, 32), compression='gzip'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+############################################################
+# Program is part of MintPy                                #
+# Copyright (c) 2013, Zhang Yunjun, Heresh Fattahi         #
+############################################################
+# Unit tests for mintpy.utils.writefile
+#   python -m pytest test/test_writefile.py
+#   python test/test_writefile.py
+
+
+import os
+import tempfile
+import unittest
+import h5py
+import numpy as np
+
+from mintpy.objects import get_compression_kwargs, get_dataset_compression
+from mintpy.utils import writefile
+
+
+class TestRemoveHDF5Dataset(unittest.TestCase):
+    """The remaining datasets should keep their chunks, compression and attributes."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_remove(self, compression):
+        try:
+            compKwargs = get_compression_kwargs(compression)
+        except ImportError:
+            self.skipTest('hdf5plugin is not installed')
+
+        data = np.random.default_rng(0).random((4, 20, 30)).astype(np.float32)
+        fname = os.path.join(self.tmp_dir.name, 'ifgramStack.h5')
+        with h5py.File(fname, 'w') as f:
+            for dsName in ['unwrapPhase', 'unwrapPhase_bridging']:
+                ds = f.create_dataset(dsName, data=data, chunks=(1, 10, 30), **compKwargs)
+                ds.attrs['scale_factor'] = 0.1
+            f.attrs['FILE_TYPE'] = 'ifgramStack'
+
+        writefile.remove_hdf5_dataset(fname, ['unwrapPhase_bridging'], print_msg=False)
+        with h5py.File(fname, 'r') as f:
+            self.assertEqual(list(f.keys()), ['unwrapPhase'])
+            ds = f['unwrapPhase']
+            self.assertEqual(ds.chunks, (1, 10, 30))
+            self.assertEqual(get_dataset_compression(ds), compression)
+            self.assertEqual(ds.attrs['scale_factor'], 0.1)
+            self.assertTrue(np.array_equal(ds[()], data))
+
+    def test_gzip(self):
+        self.run_remove('gzip')
+
+    def test_zstd(self):
+        self.run_remove('blosc:zstd')
+
+
+if __name__ == '__main__':
+    unittest.main()